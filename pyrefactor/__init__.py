@@ -1 +1,3 @@
-__all__ = ["main"]
+__all__ = ["main", "Project"]
+
+from .project import Project
@@ -1,8 +1,11 @@
 import os
-from typing import List, Tuple, Optional
+from typing import TYPE_CHECKING, List, Tuple, Optional
 import libcst as cst
 from .deps import module_name_from_path_multi, resolve_relative_pkg
 
+if TYPE_CHECKING:
+    from .project import Project
+
 
 def _to_cst_module(name: str) -> cst.CSTNode:
     parts = name.split(".")
@@ -17,6 +20,8 @@ class AbsImportRewriter(cst.CSTTransformer):
         self.module_name = module_name
         self.is_init = is_init
         self.changed = False
+        # (原相对模块写法, 改写后的绝对模块)
+        self.rewrites: List[Tuple[str, str]] = []
 
     def leave_ImportFrom(self, original_node: cst.ImportFrom, updated_node: cst.ImportFrom) -> cst.ImportFrom:
         level = len(updated_node.relative) if updated_node.relative else 0
@@ -39,30 +44,67 @@ class AbsImportRewriter(cst.CSTTransformer):
         if not resolved:
             return updated_node
         self.changed = True
+        self.rewrites.append(("." * level + (base or ""), resolved))
         return updated_node.with_changes(module=_to_cst_module(resolved), relative=())
 
 
-def rewrite_abs_file(path: str, roots: List[str]) -> bool:
+def refactor_source(src: str, module_name: str, is_init: bool) -> Tuple[str, List[Tuple[str, str]]]:
+    """内存接口：把相对导入改写为绝对导入，返回 (新源码, [(原相对模块, 绝对模块)])，不读写文件
+
+    源码无法解析时抛出 libcst.ParserSyntaxError。
+    """
+    module = cst.parse_module(src)
+    rewriter = AbsImportRewriter(module_name, is_init)
+    new_module = module.visit(rewriter)
+    if not rewriter.changed:
+        return src, []
+    return new_module.code, rewriter.rewrites
+
+
+def rewrite_abs_file(path: str, roots: List[str], project: Optional["Project"] = None) -> bool:
+    """给出 project（project.Project）时源码和 libcst 模块取自其缓存，写回后更新缓存，之后的提升不再重新读取"""
+    modname = module_name_from_path_multi(path, roots)
+    is_init = os.path.basename(path) == "__init__.py"
+    if project is not None:
+        module = project.cst_module(path)
+        if module is None:
+            return False
+        rewriter = AbsImportRewriter(modname, is_init)
+        try:
+            new_module = module.visit(rewriter)
+        except Exception:
+            return False
+        if not rewriter.changed:
+            return False
+        project.write(path, new_module.code)
+        return True
     with open(path, "r", encoding="utf-8") as f:
         src = f.read()
     try:
-        module = cst.parse_module(src)
+        new_src, rewrites = refactor_source(src, modname, is_init)
     except Exception:
         return False
-    modname = module_name_from_path_multi(path, roots)
-    is_init = os.path.basename(path) == "__init__.py"
-    rewriter = AbsImportRewriter(modname, is_init)
-    new_module = module.visit(rewriter)
-    if not rewriter.changed:
+    if not rewrites:
         return False
     with open(path, "w", encoding="utf-8") as f:
-        f.write(new_module.code)
+        f.write(new_src)
     return True
 
 
-def rewrite_abs_directory(root: str, package_paths: Optional[List[str]] = None) -> List[str]:
+def rewrite_abs_directory(root: str, package_paths: Optional[List[str]] = None, project: Optional["Project"] = None) -> List[str]:
+    """project 可以是覆盖 root 的 Project（例如随后 refc_import 使用的那个），此时只遍历其文件索引中 root 下的文件；
+    root 不是 project 根目录下的目录时照常遍历 root，不使用 project
+    """
     changed: List[str] = []
     roots = package_paths or [root]
+    target = os.path.abspath(root)
+    project_root = os.path.abspath(project.root) if project is not None else None
+    if project is not None and os.path.isdir(target) and (target == project_root or target.startswith(project_root.rstrip(os.sep) + os.sep)):
+        prefix = target.rstrip(os.sep) + os.sep
+        for path in project.paths:
+            if os.path.abspath(path).startswith(prefix) and rewrite_abs_file(path, roots, project):
+                changed.append(path)
+        return changed
     for dirpath, dirnames, filenames in os.walk(root):
         dirnames[:] = [d for d in dirnames if d != "__pycache__" and not d.startswith(".")]
         for fn in filenames:
@@ -0,0 +1,51 @@
+import os
+import time
+import socket
+import socketserver
+from typing import Any, Tuple
+
+# 协调器/worker 与常驻服务共用的地址解析和连接工具，只依赖标准库，客户端导入它不会拖入执行引擎。
+
+
+def parse_address(spec: str) -> Tuple[int, Any]:
+    """解析地址：unix:/path/to/sock 或 tcp:host:port（tcp: 前缀可省略）"""
+    if spec.startswith("unix:"):
+        return socket.AF_UNIX, spec[len("unix:"):]
+    if spec.startswith("tcp:"):
+        spec = spec[len("tcp:"):]
+    host, _, port = spec.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"无效的地址 {spec!r}，应为 unix:/path 或 tcp:host:port")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_stream_server(family: int, addr: Any, handler: Any) -> socketserver.BaseServer:
+    """为每个连接起一个守护线程的流式服务；Unix socket 文件已存在时先删除"""
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            os.unlink(addr)
+        server = socketserver.ThreadingUnixStreamServer(addr, handler)
+        server.daemon_threads = True
+        return server
+    return _TCPServer(addr, handler)
+
+
+def connect(address: str, connect_timeout: float) -> socket.socket:
+    """连接 address，在 connect_timeout 秒内每 0.1 秒重试一次（等待服务端启动）"""
+    family, addr = parse_address(address)
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(addr)
+            return sock
+        except OSError:
+            sock.close()
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.1)
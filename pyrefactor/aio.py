@@ -0,0 +1,55 @@
+import asyncio
+import functools
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Callable, Deque, Iterable, NamedTuple, Optional
+
+# asyncio 接口：阻塞的逐文件转换放到调用方提供的 executor（默认为事件循环的默认线程池）中执行，
+# 事件循环只负责调度和按文件顺序交付结果，因此多个调用可以在同一个循环里并发进行。
+# 使用 ProcessPoolExecutor 时 func 必须是模块顶层函数，context 会随每个任务序列化一次。
+
+# 未指定 limit 时同时在途的任务数
+DEFAULT_LIMIT = 32
+
+_DONE = object()
+
+
+class FileResult(NamedTuple):
+    """异步目录接口逐个产出的单文件结果：diff 仅在 dry_run 时提供，output 为处理该文件时截获的输出"""
+    path: str
+    changed: bool
+    diff: str = ""
+    output: str = ""
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, executor: Optional[Executor] = None, **kwargs: Any) -> Any:
+    """在 executor 中执行 func(*args, **kwargs) 并等待结果，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+async def stream_ordered(func: Callable[[Any, Any], Any], items: Iterable[Any], context: Any = None, executor: Optional[Executor] = None, limit: Optional[int] = None) -> AsyncIterator[Any]:
+    """以 func(context, item) 在 executor 中处理每个 item，按输入顺序异步产出结果
+
+    最多同时提交 limit 个任务：前面的结果被消费后才提交后续任务，调用方停止迭代时未开始的任务不会提交。
+    """
+    loop = asyncio.get_running_loop()
+    limit = max(1, limit or DEFAULT_LIMIT)
+    iterator = iter(items)
+    pending: Deque[asyncio.Future] = deque()
+
+    def submit() -> None:
+        item = next(iterator, _DONE)
+        if item is not _DONE:
+            pending.append(loop.run_in_executor(executor, func, context, item))
+
+    try:
+        for _ in range(limit):
+            submit()
+        while pending:
+            result = await pending.popleft()
+            submit()
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
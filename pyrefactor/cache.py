@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+# 结果缓存：以 (文件内容哈希, 命令, 选项, pyrefactor 版本, libcst 版本) 为键，记录逐文件任务的结果
+# （"没有变化"或 diff 与截获的输出）。查询前先比较 stat 索引中的 mtime/size/inode，未变化的文件不必重新读取和哈希。
+# 结果中指向该文件的路径（diff 头、发现和错误信息，见 dedup.retarget）以占位符保存，同样内容的文件在别的路径上也能命中。
+# 条目按最近使用时间（文件 mtime）淘汰，总大小超过上限时在 close 中删除最久未用的条目。
+# 另可指定共享后端（共享目录或 HTTP GET/PUT 存储），本地未命中时从共享后端读取，新结果同时写入两处，
+# 供多台机器复用。条目带有载荷的 sha256，校验不通过（损坏或写了一半）的条目按未命中处理。
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 淘汰后保留到上限的比例，避免每次运行都触发一次淘汰扫描
+EVICT_TO = 0.8
+# mtime 距今不足该秒数的文件不写入 stat 索引：同一时间粒度内的再次修改可能不改变 mtime
+RACY_SECONDS = 2.0
+_PATH = "\0"
+# 条目格式变化时递增，旧条目按未命中处理（2：只有 diff 头、发现和错误信息中的路径换成占位符）
+_MAGIC = b"pyrefactor-result-2 "
+
+
+def default_cache_dir() -> str:
+    """PYREFACTOR_CACHE_DIR，否则 $XDG_CACHE_HOME/pyrefactor，否则 ~/.cache/pyrefactor"""
+    if os.environ.get("PYREFACTOR_CACHE_DIR"):
+        return os.environ["PYREFACTOR_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pyrefactor")
+
+
+def _version(dist: str) -> str:
+    try:
+        from importlib.metadata import version
+        return version(dist)
+    except Exception:
+        return "unknown"
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _encode(result: Any, path: str) -> List[Any]:
+    from .dedup import retarget
+    return list(retarget(tuple(result), path, _PATH))
+
+
+def _decode(value: List[Any], path: str) -> tuple:
+    from .dedup import retarget
+    return retarget(tuple(value), _PATH, path)
+
+
+def seal(value: Any) -> bytes:
+    """把结果编码为条目：魔数、载荷的 sha256 和 JSON 载荷"""
+    payload = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _MAGIC + hashlib.sha256(payload).hexdigest().encode("ascii") + b"\n" + payload
+
+
+def unseal(data: bytes) -> Optional[List[Any]]:
+    """校验并解码条目；格式或哈希不符时返回 None"""
+    if not data.startswith(_MAGIC):
+        return None
+    checksum, sep, payload = data[len(_MAGIC):].partition(b"\n")
+    if not sep or hashlib.sha256(payload).hexdigest().encode("ascii") != checksum:
+        return None
+    try:
+        value = json.loads(payload.decode("utf-8"))
+    except ValueError:
+        return None
+    return value if isinstance(value, list) else None
+
+
+class FileBackend:
+    """目录中的条目存储（results/xx/key），也用于多台机器共享的 NFS 目录；写入均为原子替换"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # 记录最近使用时间
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 临时文件名带随机部分：共享目录中不同机器的进程号可能相同
+            tmp = f"{path}.tmp{uuid.uuid4().hex}"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def discard(self, key: str) -> None:
+        try:
+            os.unlink(self.path(key))
+        except OSError:
+            pass
+
+    def evict(self, limit: int) -> int:
+        """按最近使用时间删除条目，直到总大小不超过 limit，返回剩余大小"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for fn in filenames:
+                path = os.path.join(dirpath, fn)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+        return total
+
+
+class HttpBackend:
+    """HTTP 条目存储：GET/PUT {url}/{key}；请求失败按未命中处理，不影响本次运行"""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def get(self, key: str) -> Optional[bytes]:
+        import urllib.request
+        try:
+            with urllib.request.urlopen(f"{self.url}/{key}", timeout=self.timeout) as resp:
+                return resp.read()
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        import urllib.request
+        request = urllib.request.Request(f"{self.url}/{key}", data=data, method="PUT", headers={"Content-Type": "application/octet-stream"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+                resp.read()
+        except (OSError, ValueError):
+            pass
+
+    def discard(self, key: str) -> None:
+        # 损坏的条目会被随后重新计算的结果覆盖
+        pass
+
+
+def open_backend(spec: str):
+    """http:// 或 https:// 地址使用 HttpBackend，其余（可带 file: 前缀）视为共享目录"""
+    if spec.startswith(("http://", "https://")):
+        return HttpBackend(spec)
+    return FileBackend(spec[len("file:"):] if spec.startswith("file:") else spec)
+
+
+class ResultCache:
+    """本地目录中的持久结果缓存，可附加共享后端；同一目录可被多个进程同时使用"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES, shared: Any = None):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.versions = (_version("pyrefactor"), _version("libcst"))
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.local = FileBackend(os.path.join(self.directory, "results"))
+        self.shared = open_backend(shared) if isinstance(shared, str) else shared
+        self._index_path = os.path.join(self.directory, "stat-index.json")
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._index: Dict[str, List[Any]] = self._load_json(self._index_path)
+        self._index_dirty = False
+        self._seen: Dict[str, List[Any]] = {}
+        self._added = 0
+
+    @staticmethod
+    def _load_json(path: str) -> Dict[str, Any]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write_json(self, path: str, data: Any) -> None:
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def digest(self, path: str) -> Optional[str]:
+        """文件内容的 sha256；stat 签名与索引一致时直接返回索引中的值，无法读取时返回 None"""
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        signature = [st.st_mtime_ns, st.st_size, st.st_ino]
+        known = self._seen.get(key) or self._index.get(key)
+        if known is not None and known[:3] == signature:
+            return known[3]
+        try:
+            digest = file_digest(path)
+        except OSError:
+            return None
+        # 本次运行内（例如缓存与内容去重各查询一次）不重复哈希刚修改过、尚不能写入索引的文件
+        self._seen[key] = signature + [digest]
+        if time.time() - st.st_mtime_ns / 1e9 >= RACY_SECONDS:
+            self._index[key] = signature + [digest]
+            self._index_dirty = True
+        return digest
+
+    def _verified(self, backend: Any, key: str) -> Optional[List[Any]]:
+        data = backend.get(key)
+        if data is None:
+            return None
+        value = unseal(data)
+        if value is None:
+            self.rejected += 1
+            backend.discard(key)
+        return value
+
+    def get(self, key: str) -> Optional[Any]:
+        """先查本地，再查共享后端；共享后端命中的条目复制到本地"""
+        value = self._verified(self.local, key)
+        if value is None and self.shared is not None:
+            value = self._verified(self.shared, key)
+            if value is not None:
+                self._store(self.local, key, seal(value))
+        return value
+
+    def _store(self, backend: Any, key: str, data: bytes) -> None:
+        backend.put(key, data)
+        if backend is self.local:
+            self._added += len(data)
+
+    def put(self, key: str, value: Any) -> None:
+        data = seal(value)
+        self._store(self.local, key, data)
+        if self.shared is not None:
+            self._store(self.shared, key, data)
+
+    def scope(self, command: str, options: Sequence[Any], store_changed: bool = True, task_key: Optional[Callable[[Any], Any]] = None) -> "CacheScope":
+        """绑定命令与选项；store_changed 为 False 时只缓存"没有变化"的结果（直接写回文件的运行中，
+        有变化的文件内容随之改变，其结果不会再被查到）。task_key(task) 给出结果还依赖的任务属性（例如模块名）"""
+        return CacheScope(self, [list(self.versions), command, list(options)], store_changed, task_key)
+
+    def evict(self) -> None:
+        """按最近使用时间删除本地条目，直到总大小不超过上限的 EVICT_TO；共享后端的容量由其自身管理"""
+        total = self.local.evict(int(self.max_bytes * EVICT_TO))
+        self._write_json(self._meta_path, {"bytes": total})
+
+    def close(self) -> None:
+        """保存 stat 索引；估计总大小超过上限时淘汰"""
+        if self._index_dirty:
+            self._write_json(self._index_path, self._index)
+            self._index_dirty = False
+        if self._added:
+            total = self._load_json(self._meta_path).get("bytes", 0) + self._added
+            self._added = 0
+            if total > self.max_bytes:
+                self.evict()
+            else:
+                self._write_json(self._meta_path, {"bytes": total})
+
+    def __enter__(self) -> "ResultCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class CacheScope:
+    """某个命令与选项下的缓存视图，由 parallel.run_files 使用"""
+
+    def __init__(self, cache: ResultCache, prefix: List[Any], store_changed: bool, task_key: Optional[Callable[[Any], Any]] = None):
+        self.cache = cache
+        self.prefix = prefix
+        self.store_changed = store_changed
+        self.task_key = task_key
+
+    def key(self, task: Any, path: str) -> Optional[str]:
+        digest = self.cache.digest(path)
+        if digest is None:
+            return None
+        extra = self.task_key(task) if self.task_key is not None else None
+        return hashlib.sha256(json.dumps(self.prefix + [extra, digest], separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    def run(self, tasks: Sequence[Any], paths: Sequence[str], runner: Callable[[Sequence[Any], Sequence[str]], Iterator[Any]]) -> Iterator[Any]:
+        """命中的文件直接产出缓存的结果，未命中的交给 runner(tasks, paths) 处理并写入缓存；结果按输入顺序产出
+
+        只缓存首项为"是否变化"的元组结果（guard 跳过的文件等不缓存）。
+        """
+        keys = [self.key(t, p) for t, p in zip(tasks, paths)]
+        cached: Dict[int, Any] = {}
+        for i, key in enumerate(keys):
+            value = self.cache.get(key) if key is not None else None
+            if value is not None:
+                cached[i] = _decode(value, paths[i])
+        self.cache.hits += len(cached)
+        self.cache.misses += len(paths) - len(cached)
+        missing = [i for i in range(len(paths)) if i not in cached]
+        results = runner([tasks[i] for i in missing], [paths[i] for i in missing]) if missing else iter(())
+        for i in range(len(paths)):
+            if i in cached:
+                yield cached[i]
+                continue
+            result = next(results)
+            if keys[i] is not None and isinstance(result, tuple) and result and isinstance(result[0], bool) and (self.store_changed or not result[0]):
+                self.cache.put(keys[i], _encode(result, paths[i]))
+            yield result
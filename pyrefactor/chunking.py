@@ -0,0 +1,105 @@
+import io
+import re
+import tokenize
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import libcst as cst
+
+from .parallel import resolve_jobs, run_ordered
+
+# 超大模块的文件内并行：用 tokenize 廉价地找出顶层语句边界，把模块切成若干段分别解析、转换，再按顺序拼接。
+# libcst 的解析是无损的，每段 code 与原文逐字节一致，因此未被修改的部分拼接后与整文件处理完全相同。
+# 需要模块级上下文的转换器（类属性 MODULE_CONTEXT 为 True，例如 ImportLifter 在 leave_Module 中插入导入）
+# 不能分段处理，调用方应回退到整文件处理。
+
+# 每个 worker 分到的段数，段数略多于 worker 数以便负载均衡
+CHUNKS_PER_WORKER = 4
+# 跟在顶层语句之后、属于同一语句的关键字，不能在其前面切分
+_CONTINUATIONS = frozenset(("else", "elif", "except", "finally"))
+_FUTURE_RE = re.compile(r"^from\s+__future__\s+import\s+\(?([\w\s,]+)\)?", re.MULTILINE)
+
+Chunk = Tuple[int, str, Dict[str, Any]]
+
+
+def supports_chunking(transformer_cls: type) -> bool:
+    """转换器是否可以在模块分段上独立运行；未声明 MODULE_CONTEXT 的转换器按需要模块上下文处理"""
+    return not getattr(transformer_cls, "MODULE_CONTEXT", True)
+
+
+def _scan(src: str) -> Tuple[List[int], str]:
+    """返回 (可切分的顶层语句起始行号列表, 第一个缩进单位)；tokenize 失败时返回空列表"""
+    starts: List[int] = []
+    indent = ""
+    depth = 0
+    at_line_start = True
+    after_decorator = False
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(src).readline):
+            if tok.type == tokenize.INDENT:
+                depth += 1
+                indent = indent or tok.string
+            elif tok.type == tokenize.DEDENT:
+                depth -= 1
+            elif tok.type == tokenize.NEWLINE:
+                at_line_start = True
+            elif tok.type in (tokenize.NL, tokenize.COMMENT, tokenize.ENDMARKER):
+                continue
+            elif at_line_start:
+                at_line_start = False
+                if depth == 0:
+                    if not after_decorator and tok.string not in _CONTINUATIONS and tok.start[1] == 0:
+                        starts.append(tok.start[0])
+                    after_decorator = tok.string == "@"
+    except (tokenize.TokenError, SyntaxError):
+        return [], indent
+    return starts, indent
+
+
+def parser_config(src: str, indent: str) -> Dict[str, Any]:
+    """各段共用的解析配置，使每段生成的代码与整文件解析时的缩进、换行、__future__ 一致"""
+    newline = "\n"
+    first = io.StringIO(src).readline()
+    if first.endswith("\r\n"):
+        newline = "\r\n"
+    elif first.endswith("\r"):
+        newline = "\r"
+    futures = set()
+    for match in _FUTURE_RE.finditer(src):
+        futures.update(n.strip() for n in match.group(1).split(",") if n.strip())
+    return {"default_indent": indent or "    ", "default_newline": newline, "future_imports": frozenset(futures)}
+
+
+def split_top_level(src: str, max_chunks: int) -> List[Chunk]:
+    """在顶层语句边界把源码切成至多 max_chunks 段，各段行数大致相等
+
+    返回 [(行号偏移, 段源码, 解析配置)]；无法切分时只返回一段。
+    """
+    lines = io.StringIO(src).readlines()
+    starts, indent = _scan(src) if max_chunks > 1 else ([], "")
+    config = parser_config(src, indent)
+    cuts: List[int] = []
+    target = len(lines) / max(1, max_chunks)
+    for line in starts:
+        if line - 1 >= target * (len(cuts) + 1) and line > 1:
+            cuts.append(line - 1)
+            if len(cuts) == max_chunks - 1:
+                break
+    bounds = [0] + cuts + [len(lines)]
+    return [(lo, "".join(lines[lo:hi]), config) for lo, hi in zip(bounds, bounds[1:])]
+
+
+def parse_chunk(chunk: Chunk) -> cst.Module:
+    _, text, config = chunk
+    return cst.parse_module(text, config=cst.PartialParserConfig(**config))
+
+
+def transform_chunked(src: str, task: Callable[[Any, Chunk], Any], context: Any = None, jobs: Optional[int] = 1, backend: str = "auto") -> Optional[List[Any]]:
+    """把 src 切段后以 task(context, chunk) 并行处理，按段顺序返回结果
+
+    task 必须是模块顶层函数。源码无法切分（tokenize 失败或只有一个顶层语句）时返回 None，调用方应回退到整文件处理。
+    """
+    workers = resolve_jobs(jobs)
+    chunks = split_top_level(src, workers * CHUNKS_PER_WORKER)
+    if len(chunks) <= 1:
+        return None
+    return list(run_ordered(task, chunks, jobs=workers, context=context, backend=backend))
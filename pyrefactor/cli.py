@@ -1,9 +1,233 @@
 import argparse
+import os
 import sys
-from .imports_refactor import rewrite_directory
+from .imports_refactor import rewrite_directory, rewrite_roots, parse_manifest, RootSpec
 from .graph import build_import_graph_mermaid, build_call_graph_mermaid, build_function_flow_mermaid
 from .functions import rewrite_directory_for_functions
 from .defensive_try_except import rewrite_directory_for_defensive_try_except
+from .shard import parse_shard, merge_partials
+from .parallel import AUTO, parse_jobs
+from .tuning import RunSummary
+from .project import Project
+
+
+def _report_changes(changes, dry_run: bool, output_diff, empty_message: str) -> None:
+    if not changes:
+        print(empty_message)
+        return
+    if dry_run:
+        if output_diff:
+            print(f"已写出 diff 到 {output_diff}")
+        else:
+            print("已生成 diff")
+    else:
+        print(f"已更新 {len(changes)} 个文件")
+
+
+def _summary_from_args(args: argparse.Namespace):
+    # 运行摘要只在 --jobs auto 时输出，默认输出不随缓存状态变化
+    return RunSummary() if args.jobs == AUTO else None
+
+
+def _report_summary(summary) -> None:
+    if summary is not None:
+        for line in summary.lines():
+            print(line)
+
+
+def _guard_from_args(args: argparse.Namespace):
+    from .parallel import Guard
+    max_rss = args.max_rss * 1024 * 1024 if args.max_rss else None
+    return Guard(args.file_timeout, max_rss) if args.file_timeout or max_rss else None
+
+
+def _add_guard_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--file-timeout", type=float, help="单个文件的处理时限（秒），超时的文件被跳过并报告 skipped: timeout")
+    p.add_argument("--max-rss", type=int, help="worker 常驻内存上限（MB），超限的文件被跳过并报告 skipped: memory")
+
+
+def _add_cache_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--no-cache", action="store_false", dest="cache", help="不使用结果缓存，所有文件都重新解析和转换")
+    p.add_argument("--cache-dir", help="结果缓存目录（默认 $PYREFACTOR_CACHE_DIR，否则 $XDG_CACHE_HOME/pyrefactor 或 ~/.cache/pyrefactor）")
+    p.add_argument("--shared-cache", default=os.environ.get("PYREFACTOR_SHARED_CACHE"), help="多台机器共用的缓存：共享目录（如 NFS 挂载点）或 http(s):// 地址（以 GET/PUT 存取条目），默认 $PYREFACTOR_SHARED_CACHE")
+    p.add_argument("--dedup", action="store_true", help="内容相同的文件只转换一次，结果复用到其余文件（需要哈希所有未命中缓存的文件）")
+
+
+def _cache_from_args(args: argparse.Namespace):
+    from .cache import ResultCache
+    return ResultCache(args.cache_dir, shared=args.shared_cache) if args.cache else None
+
+
+def _close_cache(cache) -> None:
+    if cache is not None:
+        cache.close()
+
+
+def _add_vcs_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--since", metavar="REF", help="只转换自 REF（与 HEAD 的合并基）以来改动的文件，包括未提交和未跟踪的文件；依赖图仍覆盖整个目录")
+    p.add_argument("--staged", action="store_true", help="只转换暂存区中改动的文件；与 --since 同时给出时取并集")
+
+
+def _only_from_args(parser: argparse.ArgumentParser, args: argparse.Namespace, paths):
+    """--since/--staged 给出的改动文件集合，未指定时为 None"""
+    if not (args.since or args.staged):
+        return None
+    from .vcs import changed_files
+    only = set()
+    try:
+        for path in paths:
+            only |= changed_files(path, since=args.since, staged=args.staged)
+    except ValueError as e:
+        parser.error(str(e))
+    return only
+
+
+def _run_coordinator(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    from .distributed import run_coordinator
+    run_args = args.run[1:] if args.run and args.run[0] == "--" else args.run
+    inner = parser.parse_args(run_args)
+    if inner.cmd == "refc_import":
+        from .imports_refactor import collect_tasks, load_or_build_graph
+        if len(inner.path) != 1 or inner.manifest:
+            parser.error("coordinator 分发 refc_import 时只支持单个根目录")
+        inner.path = inner.path[0]
+        project = Project(inner.path, inner.package_path)
+        if inner.absimport:
+            from .abs_imports import rewrite_abs_directory
+            rewrite_abs_directory(inner.modify_under or inner.path, package_paths=inner.package_path, project=project)
+        graph = load_or_build_graph(inner.path, graph_file=inner.graph_file, package_paths=inner.package_path, jobs=inner.jobs, project=project)
+        tasks = collect_tasks(inner.path, modify_under=inner.modify_under, package_paths=inner.package_path, resolver=project.resolver)
+        options = {"dry_run": inner.dry_run, "include_relative": inner.include_relative, "allow_control_blocks": inner.allow_control_blocks, "failfirst": inner.failfirst}
+        empty_message = "没有发现需要更新的导入"
+    elif inner.cmd == "remove_defensive_try":
+        from .defensive_try_except import collect_files
+        graph = None
+        tasks = [(p, "") for p in collect_files(inner.path)]
+        options = {
+            "dry_run": inner.dry_run,
+            "want_diff": bool(inner.output_diff),
+            "max_try_length": inner.max_length,
+            "check_print_log": inner.check_print_log,
+            "check_rethrow": inner.check_rethrow,
+            "check_return_none": inner.check_return_none,
+        }
+        empty_message = "没有发现需要移除的防御式 try-except 语句"
+    else:
+        parser.error("coordinator 只支持分发 refc_import 和 remove_defensive_try")
+    changes = run_coordinator(args.listen, inner.cmd, options, tasks, graph=graph, output_diff=inner.output_diff, cost_history=inner.cost_history, timeout=args.timeout)
+    _report_changes(changes, inner.dry_run, inner.output_diff, empty_message)
+
+
+def _run_workers(address: str, jobs: int) -> None:
+    from .distributed import run_worker
+    from .parallel import resolve_jobs
+    count = resolve_jobs(jobs)
+    if count <= 1:
+        run_worker(address)
+        return
+    import multiprocessing
+    procs = [multiprocessing.Process(target=run_worker, args=(address,)) for _ in range(count)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+STDIN = "-"
+
+
+def _stdin_refc_import(args, source: str):
+    """refc_import -：模块名取自 --stdin-filename 相对包根目录（默认当前目录）的位置，依赖图按磁盘内容构建或从 --graph-file 加载
+
+    未指定 --stdin-filename 时无从定位模块，使用空依赖图。
+    """
+    from .imports_refactor import refactor_source, load_or_build_graph
+    module_name, is_init, graph = "__stdin__", False, {}
+    if args.stdin_filename:
+        from .deps import module_name_from_path_multi
+        roots = args.package_path or [os.getcwd()]
+        module_name = module_name_from_path_multi(os.path.abspath(args.stdin_filename), [os.path.abspath(r) for r in roots])
+        is_init = os.path.basename(args.stdin_filename) == "__init__.py"
+        index = None
+        if args.cache:
+            from .graph_index import default_index_path
+            index = default_index_path(roots[0], args.package_path, args.cache_dir)
+        graph = load_or_build_graph(roots[0], graph_file=args.graph_file, package_paths=args.package_path, jobs=args.jobs, index=index)
+    if args.absimport:
+        from .abs_imports import refactor_source as absolutize
+        source = absolutize(source, module_name, is_init)[0]
+    new_source, lifted = refactor_source(source, module_name, is_init, graph, args.include_relative, args.allow_control_blocks, args.failfirst)
+    return new_source, [f"提升导入: {code}" for code in lifted]
+
+
+def _run_stdin(args) -> None:
+    """`-` 路径：从 stdin 读源码，把新源码（--dry-run 时为 diff）写到 stdout，发现写到 stderr，不读写源文件"""
+    import difflib
+    source = sys.stdin.read()
+    name = args.stdin_filename or "<stdin>"
+    tofile = name
+    try:
+        if args.cmd == "refc_import":
+            new_source, report = _stdin_refc_import(args, source)
+        elif args.cmd == "remove_defensive_try":
+            from .defensive_try_except import refactor_source, format_findings
+            new_source, findings = refactor_source(source, args.max_length, args.check_print_log, args.check_rethrow, args.check_return_none, name)
+            report = format_findings(name, findings).splitlines()
+            tofile = f"{name}.modified"
+        else:
+            from .functions import refactor_source
+            new_source, created = refactor_source(source, args.process_methods)
+            report = [f"创建子函数: {n}" for n in created]
+    except Exception as e:
+        print(f"解析 {name} 时出错: {e}", file=sys.stderr)
+        sys.exit(1)
+    for line in report:
+        print(line, file=sys.stderr)
+    if args.dry_run:
+        sys.stdout.write("".join(difflib.unified_diff(source.splitlines(True), new_source.splitlines(True), fromfile=name, tofile=tofile)))
+    else:
+        sys.stdout.write(new_source)
+
+
+def _check_stdin(parser, args, paths) -> bool:
+    """路径为 `-` 时校验与之冲突的选项，返回是否为 stdin 模式"""
+    if STDIN not in paths:
+        return False
+    if len(paths) > 1 or getattr(args, "manifest", None):
+        parser.error("`-` 不能与其他路径或 --manifest 同时使用")
+    conflicts = [opt for opt, attr in (("--output-diff", "output_diff"), ("--shard", "shard"), ("--journal", "journal"), ("--watch", "watch"), ("--modify-under", "modify_under"), ("--since", "since"), ("--staged", "staged")) if getattr(args, attr, None)]
+    if conflicts:
+        parser.error(f"`-` 不能与 {'、'.join(conflicts)} 同时使用")
+    return True
+
+
+def _run_symbols(args: argparse.Namespace) -> None:
+    import tempfile
+    from .graph_index import GraphIndex, default_index_path
+    with tempfile.TemporaryDirectory() as tmp:
+        path = default_index_path(args.path, args.package_path, args.cache_dir) if args.cache else os.path.join(tmp, "graph.idx")
+        index = GraphIndex(path, args.path, args.package_path)
+        index.refresh()
+        if args.unused:
+            for rel, line, name, target in index.unused_imports():
+                label = name if name == target or target.endswith("." + name) else f"{name}（{target}）"
+                print(f"{os.path.join(args.path, rel)}:{line}: 未使用的导入 {label}")
+        else:
+            for rel, line, scope, qualified in index.users(args.users):
+                print(f"{os.path.join(args.path, rel)}:{line}: {'函数级' if scope == 'function' else '模块级'} {qualified}")
+
+
+def _run_watch(watcher, loop, path, **kwargs) -> None:
+    """运行 --watch 循环直到 Ctrl-C；每行输出后立即 flush，便于管道另一端实时显示"""
+    def emit(text: str) -> None:
+        sys.stdout.write(text + "\n")
+        sys.stdout.flush()
+    try:
+        loop(path, watcher, emit=emit, **kwargs)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
 
 def main() -> None:
@@ -11,7 +235,8 @@ def main() -> None:
     subparsers = parser.add_subparsers(dest="cmd", required=True)
 
     p_refactor = subparsers.add_parser("refc_import", help="提升安全的 import 到顶层")
-    p_refactor.add_argument("path", help="要处理的目录或文件路径")
+    p_refactor.add_argument("path", nargs="*", help="要处理的目录或文件路径，可指定多个根目录（共用同一个 worker 池，各自独立分析）；- 表示从 stdin 读源码并把结果写到 stdout")
+    p_refactor.add_argument("--manifest", help="根目录清单文件，每行: path [--package-path P]... [--modify-under D] [--output-diff F]")
     p_refactor.add_argument("--include-relative", action="store_true", help="包含相对导入")
     p_refactor.add_argument("--allow-control-blocks", action="store_true", help="允许控制块导入提升")
     p_refactor.add_argument("--dry-run", action="store_true", help="仅输出 diff")
@@ -20,23 +245,54 @@ def main() -> None:
     p_refactor.add_argument("--modify-under", help="仅修改此子目录下的文件，分析范围仍为path")
     p_refactor.add_argument("--failfirst", action="store_true", help="将 try/except ImportError 中的导入提前并移除 ImportError 处理")
     p_refactor.add_argument("--package-path", action="append", help="额外的包根目录，可重复指定", dest="package_path")
+    p_refactor.add_argument("-j", "--jobs", type=parse_jobs, default=1, help="并行 worker 数（默认 1 串行，0 表示使用全部 CPU，auto 表示校准后自动选择 worker 数和批大小）")
+    p_refactor.add_argument("--cost-history", help="记录各文件处理耗时的 JSON 文件，下次运行据此优先调度耗时长的文件")
+    p_refactor.add_argument("--shard", type=parse_shard, help="只处理第 i/n 片文件（按路径稳定哈希分配，i 从 1 开始）")
+    p_refactor.add_argument("--shard-output", help="分片结果文件，供 merge 子命令合并")
+    p_refactor.add_argument("--graph-file", help="依赖图文件：存在则直接加载，否则构建后写入，供各分片共享")
+    p_refactor.add_argument("--stdin-filename", help="路径为 - 时源码所对应的文件名，用于报告和 diff，以及确定模块名和依赖图")
+    p_refactor.add_argument("--backend", choices=["auto", "process", "thread"], default="auto", help="并行后端（默认 auto：free-threaded 解释器用线程，否则用进程）")
+    _add_guard_arguments(p_refactor)
+    _add_cache_arguments(p_refactor)
+    _add_vcs_arguments(p_refactor)
 
     p_graph = subparsers.add_parser("graph", help="生成 Mermaid 图")
     p_graph.add_argument("type", choices=["imports", "calls"], help="图类型")
     p_graph.add_argument("path", help="目录路径")
+    p_graph.add_argument("--watch", action="store_true", help="持续监视 imports 图：先输出完整的图和导入环，之后只输出变化的节点、边和导入环")
+    p_graph.add_argument("--interval", type=float, default=0.5, help="--watch 无法使用 inotify 时的轮询间隔秒数（默认: 0.5）")
+    p_graph.add_argument("--no-cache", action="store_false", dest="cache", help="不使用持久依赖图索引，重新解析所有文件")
+    p_graph.add_argument("--cache-dir", help="依赖图索引所在的缓存目录（默认同 refc_import）")
+    p_graph.add_argument("--first-party", action="store_true", help="imports 图只保留指向本项目模块的边，去掉标准库和第三方包")
+
+    p_symbols = subparsers.add_parser("symbols", help="查询符号级导入索引：未使用的导入，或谁导入/使用了某个名字")
+    p_symbols.add_argument("path", help="目录路径")
+    group = p_symbols.add_mutually_exclusive_group(required=True)
+    group.add_argument("--unused", action="store_true", help="列出没有被使用的导入（__init__.py 中的导入视为重新导出）")
+    group.add_argument("--users", metavar="NAME", help="列出导入或使用 NAME（例如 pkg.mod.func）及其属性的位置")
+    p_symbols.add_argument("--package-path", action="append", help="额外的包根目录，可重复指定", dest="package_path")
+    p_symbols.add_argument("--no-cache", action="store_false", dest="cache", help="不使用持久索引，重新解析所有文件")
+    p_symbols.add_argument("--cache-dir", help="索引所在的缓存目录（默认同 refc_import）")
 
     p_flow = subparsers.add_parser("flow", help="生成函数流程图（Mermaid）")
     p_flow.add_argument("file", help="文件路径")
     p_flow.add_argument("--function", required=True, help="函数名")
     
     p_split = subparsers.add_parser("split_func", help="将大函数切割为多个小函数（基于注释边界，非嵌套函数）")
-    p_split.add_argument("path", help="要处理的目录或文件路径")
+    p_split.add_argument("path", help="要处理的目录或文件路径；- 表示从 stdin 读源码并把结果写到 stdout")
     p_split.add_argument("--dry-run", action="store_true", help="仅输出 diff")
     p_split.add_argument("--output-diff", help="将统一 diff 输出到文件")
     p_split.add_argument("--process-methods", action="store_true", help="同时处理类内部的方法")
+    p_split.add_argument("-j", "--jobs", type=parse_jobs, default=1, help="并行 worker 数（默认 1 串行，0 表示使用全部 CPU，auto 表示校准后自动选择 worker 数和批大小）")
+    p_split.add_argument("--cost-history", help="记录各文件处理耗时的 JSON 文件，下次运行据此优先调度耗时长的文件")
+    p_split.add_argument("--stdin-filename", help="路径为 - 时源码所对应的文件名，用于报告和 diff")
+    p_split.add_argument("--backend", choices=["auto", "process", "thread"], default="auto", help="并行后端（默认 auto：free-threaded 解释器用线程，否则用进程）")
+    _add_guard_arguments(p_split)
+    _add_cache_arguments(p_split)
+    _add_vcs_arguments(p_split)
 
     p_remove_try = subparsers.add_parser("remove_defensive_try", help="移除防御式 try-except 语句（捕获所有异常且 try 块过长的）")
-    p_remove_try.add_argument("path", help="要处理的目录或文件路径")
+    p_remove_try.add_argument("path", help="要处理的目录或文件路径；- 表示从 stdin 读源码并把结果写到 stdout")
     p_remove_try.add_argument("--max-length", type=int, default=30, help="try 块长度阈值（默认: 30）")
     p_remove_try.add_argument("--dry-run", action="store_true", help="仅输出 diff")
     p_remove_try.add_argument("--output-diff", help="将统一 diff 输出到文件")
@@ -45,29 +301,105 @@ def main() -> None:
     p_remove_try.add_argument("--no-print-log", action="store_false", dest="check_print_log", help="不检查只打印日志的 except 块")
     p_remove_try.add_argument("--no-rethrow", action="store_false", dest="check_rethrow", help="不检查重新抛出异常的 except 块")
     p_remove_try.add_argument("--no-return-none", action="store_false", dest="check_return_none", help="不检查返回 None 的 except 块")
+    p_remove_try.add_argument("-j", "--jobs", type=parse_jobs, default=1, help="并行 worker 数（默认 1 串行，0 表示使用全部 CPU，auto 表示校准后自动选择 worker 数和批大小）")
+    p_remove_try.add_argument("--cost-history", help="记录各文件处理耗时的 JSON 文件，下次运行据此优先调度耗时长的文件")
+    p_remove_try.add_argument("--stdin-filename", help="路径为 - 时源码所对应的文件名，用于报告和 diff")
+    p_remove_try.add_argument("--backend", choices=["auto", "process", "thread"], default="auto", help="并行后端（默认 auto：free-threaded 解释器用线程，否则用进程）")
+    p_remove_try.add_argument("--shard", type=parse_shard, help="只处理第 i/n 片文件（按路径稳定哈希分配，i 从 1 开始）")
+    p_remove_try.add_argument("--shard-output", help="分片结果文件，供 merge 子命令合并")
+    _add_guard_arguments(p_remove_try)
+    _add_cache_arguments(p_remove_try)
+    _add_vcs_arguments(p_remove_try)
+    p_remove_try.add_argument("--split-lines", type=int, help="不少于该行数的超大文件按顶层语句分段，用 -j 个 worker 在文件内并行处理")
+    p_remove_try.add_argument("--journal", help="进度日志文件：每处理完一个文件追加一条记录（内容哈希与结果）")
+    p_remove_try.add_argument("--resume", action="store_true", help="从 --journal 续跑：跳过已完成且内容未变的文件，diff 从中断处继续追加")
+    p_remove_try.add_argument("--watch", action="store_true", help="与 --dry-run 一起使用：先完整检查一次，之后只重新检查变化的文件并输出增减的发现")
+    p_remove_try.add_argument("--interval", type=float, default=0.5, help="--watch 无法使用 inotify 时的轮询间隔秒数（默认: 0.5）")
+
+    p_merge = subparsers.add_parser("merge", help="合并 --shard 运行产生的分片结果，输出与单机运行一致")
+    p_merge.add_argument("parts", nargs="+", help="各分片的结果文件")
+    p_merge.add_argument("--output-diff", help="将合并后的统一 diff 输出到文件")
+
+    p_coord = subparsers.add_parser("coordinator", help="作为协调器向 worker 分发文件任务（refc_import / remove_defensive_try）")
+    p_coord.add_argument("--listen", required=True, help="监听地址：unix:/path/to/sock 或 tcp:host:port")
+    p_coord.add_argument("--timeout", type=float, help="等待全部结果的最长秒数")
+    p_coord.add_argument("run", nargs=argparse.REMAINDER, help="要分发的命令及其参数，例如 remove_defensive_try src --dry-run")
+
+    p_serve = subparsers.add_parser("serve", help="常驻服务：缓存文件索引、解析结果和依赖图，通过 JSON-RPC 响应 pyrefactor-client 的 refc_import / graph 请求")
+    p_serve.add_argument("--socket", required=True, help="监听地址：unix:/path/to/sock 或 tcp:host:port")
+    p_serve.add_argument("--preload", action="append", help="启动时预先建立缓存的根目录，可重复指定")
+
+    subparsers.add_parser("lsp", help="Language Server（stdio）：把移除防御式 try、提升 import、拆分大函数作为代码操作提供给编辑器")
+
+    p_worker = subparsers.add_parser("worker", help="连接协调器领取并处理文件任务")
+    p_worker.add_argument("--connect", required=True, help="协调器地址：unix:/path/to/sock 或 tcp:host:port")
+    p_worker.add_argument("-j", "--jobs", type=int, default=1, help="本机启动的 worker 进程数（默认 1，0 表示使用全部 CPU）")
 
     args = parser.parse_args()
+    if args.cmd in ("refc_import", "split_func", "remove_defensive_try") and _check_stdin(parser, args, args.path if args.cmd == "refc_import" else [args.path]):
+        _run_stdin(args)
+        return
     if args.cmd == "refc_import":
+        roots = [RootSpec(p, args.package_path, args.modify_under) for p in args.path]
+        if args.manifest:
+            try:
+                roots.extend(parse_manifest(args.manifest))
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+        if not roots:
+            parser.error("refc_import 需要至少一个路径或 --manifest")
+        if len(roots) > 1 and (args.shard or args.graph_file):
+            parser.error("--shard 和 --graph-file 只能用于单个根目录")
+        projects = None
         if args.absimport:
+            # 每个根目录一个 Project：--absimport 解析过且没有改动的文件在提升时复用 libcst 模块
             from .abs_imports import rewrite_abs_directory
-            rewrite_abs_directory(args.modify_under or args.path, package_paths=args.package_path)
-        changes = rewrite_directory(args.path, include_relative=args.include_relative, allow_control_blocks=args.allow_control_blocks, dry_run=args.dry_run, output_diff=args.output_diff, modify_under=args.modify_under, failfirst=args.failfirst, package_paths=args.package_path)
-        if not changes:
-            print("没有发现需要更新的导入")
+            projects = [Project(spec.path, spec.package_paths) for spec in roots]
+            for spec, project in zip(roots, projects):
+                rewrite_abs_directory(spec.modify_under or spec.path, package_paths=spec.package_paths, project=project)
+        only = _only_from_args(parser, args, [spec.path for spec in roots])
+        summary = _summary_from_args(args)
+        cache = _cache_from_args(args)
+        if len(roots) > 1 or args.manifest:
+            try:
+                changes = rewrite_roots(roots, include_relative=args.include_relative, allow_control_blocks=args.allow_control_blocks, dry_run=args.dry_run, output_diff=args.output_diff, failfirst=args.failfirst, jobs=args.jobs, cost_history=args.cost_history, backend=args.backend, guard=_guard_from_args(args), summary=summary, cache=cache, only=only, dedup=args.dedup, projects=projects)
+            finally:
+                _close_cache(cache)
+            _report_summary(summary)
+            _report_changes(changes, args.dry_run, args.output_diff, "没有发现需要更新的导入")
             return
-        if args.dry_run:
-            if args.output_diff:
-                print(f"已写出 diff 到 {args.output_diff}")
-            else:
-                print("已生成 diff")
-        else:
-            print(f"已更新 {len(changes)} 个文件")
+        spec = roots[0]
+        try:
+            changes = rewrite_directory(spec.path, include_relative=args.include_relative, allow_control_blocks=args.allow_control_blocks, dry_run=args.dry_run, output_diff=args.output_diff, modify_under=spec.modify_under, failfirst=args.failfirst, package_paths=spec.package_paths, jobs=args.jobs, cost_history=args.cost_history, backend=args.backend, shard=args.shard, shard_output=args.shard_output, graph_file=args.graph_file, guard=_guard_from_args(args), summary=summary, cache=cache, only=only, dedup=args.dedup, project=projects[0] if projects else None)
+        finally:
+            _close_cache(cache)
+        _report_summary(summary)
+        if args.shard and args.shard_output:
+            print(f"已写出分片结果到 {args.shard_output}")
+            return
+        _report_changes(changes, args.dry_run, args.output_diff, "没有发现需要更新的导入")
     elif args.cmd == "graph":
+        if args.watch:
+            if args.type != "imports":
+                parser.error("--watch 只支持 imports 图")
+            if args.first_party:
+                parser.error("--first-party 不能与 --watch 同时使用")
+            from .watch import open_watcher, watch_import_graph
+            _run_watch(open_watcher(args.path, args.interval), watch_import_graph, args.path)
+            return
+        if args.first_party and args.type != "imports":
+            parser.error("--first-party 只支持 imports 图")
         if args.type == "imports":
-            out = build_import_graph_mermaid(args.path)
+            index = None
+            if args.cache:
+                from .graph_index import default_index_path
+                index = default_index_path(args.path, directory=args.cache_dir)
+            out = build_import_graph_mermaid(args.path, index=index, first_party_only=args.first_party)
         else:
             out = build_call_graph_mermaid(args.path)
         sys.stdout.write(out + "\n")
+    elif args.cmd == "symbols":
+        _run_symbols(args)
     elif args.cmd == "flow":
         out = build_function_flow_mermaid(args.file, args.function)
         if not out:
@@ -75,44 +407,93 @@ def main() -> None:
             return
         sys.stdout.write(out + "\n")
     elif args.cmd == "split_func":
-        changes = rewrite_directory_for_functions(args.path, dry_run=args.dry_run, output_diff=args.output_diff, process_methods=args.process_methods)
-        if not changes:
-            print("没有发现需要拆分的函数")
-            return
-        if args.dry_run:
-            if args.output_diff:
-                print(f"已写出 diff 到 {args.output_diff}")
-            else:
-                print("已生成 diff")
-        else:
-            print(f"已更新 {len(changes)} 个文件")
+        only = _only_from_args(parser, args, [args.path])
+        summary = _summary_from_args(args)
+        cache = _cache_from_args(args)
+        try:
+            changes = rewrite_directory_for_functions(args.path, dry_run=args.dry_run, output_diff=args.output_diff, process_methods=args.process_methods, jobs=args.jobs, cost_history=args.cost_history, backend=args.backend, guard=_guard_from_args(args), summary=summary, cache=cache, only=only, dedup=args.dedup)
+        finally:
+            _close_cache(cache)
+        _report_summary(summary)
+        _report_changes(changes, args.dry_run, args.output_diff, "没有发现需要拆分的函数")
     elif args.cmd == "remove_defensive_try":
-        # 准备输出 diff 文件
-        if args.output_diff:
+        if args.resume and not args.journal:
+            parser.error("--resume 需要同时指定 --journal")
+        if args.journal and args.shard and args.shard_output:
+            parser.error("--journal 不能与 --shard-output 同时使用")
+        if args.watch:
+            if not args.dry_run:
+                parser.error("--watch 需要同时指定 --dry-run")
+            if args.output_diff or args.shard or args.journal or args.since or args.staged:
+                parser.error("--watch 不能与 --output-diff、--shard、--journal、--since 或 --staged 同时使用")
+            from .watch import open_watcher, watch_defensive_try
+            _run_watch(
+                open_watcher(args.path, args.interval), watch_defensive_try, args.path,
+                max_try_length=args.max_length, check_print_log=args.check_print_log, check_rethrow=args.check_rethrow,
+                check_return_none=args.check_return_none, jobs=args.jobs,
+            )
+            return
+        # 准备输出 diff 文件（分片运行时 diff 由 merge 写出；使用进度日志时由日志决定保留到哪里）
+        if args.output_diff and not (args.shard and args.shard_output) and not args.journal:
             with open(args.output_diff, 'w', encoding='utf-8') as f:
                 pass  # 清空文件
         
-        changes = rewrite_directory_for_defensive_try_except(
-            args.path,
-            max_try_length=args.max_length,
-            dry_run=args.dry_run,
-            output_diff=args.output_diff,
-            check_print_log=args.check_print_log,
-            check_rethrow=args.check_rethrow,
-            check_return_none=args.check_return_none
-        )
+        only = _only_from_args(parser, args, [args.path])
+        summary = _summary_from_args(args)
+        cache = _cache_from_args(args)
+        try:
+            changes = rewrite_directory_for_defensive_try_except(
+                args.path,
+                max_try_length=args.max_length,
+                dry_run=args.dry_run,
+                output_diff=args.output_diff,
+                check_print_log=args.check_print_log,
+                check_rethrow=args.check_rethrow,
+                check_return_none=args.check_return_none,
+                jobs=args.jobs,
+                cost_history=args.cost_history,
+                backend=args.backend,
+                shard=args.shard,
+                shard_output=args.shard_output,
+                split_lines=args.split_lines,
+                guard=_guard_from_args(args),
+                journal=args.journal,
+                resume=args.resume,
+                summary=summary,
+                cache=cache,
+                only=only,
+                dedup=args.dedup
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        finally:
+            _close_cache(cache)
         
-        if not changes:
-            print("没有发现需要移除的防御式 try-except 语句")
+        _report_summary(summary)
+        if args.shard and args.shard_output:
+            print(f"已写出分片结果到 {args.shard_output}")
             return
-        
-        if args.dry_run:
-            if args.output_diff:
-                print(f"已写出 diff 到 {args.output_diff}")
-            else:
-                print("已生成 diff")
-        else:
-            print(f"已更新 {len(changes)} 个文件")
+        _report_changes(changes, args.dry_run, args.output_diff, "没有发现需要移除的防御式 try-except 语句")
+    elif args.cmd == "coordinator":
+        _run_coordinator(parser, args)
+    elif args.cmd == "serve":
+        from .daemon import serve
+        serve(args.socket, preload=args.preload)
+    elif args.cmd == "lsp":
+        from .lsp import main as lsp_main
+        lsp_main()
+    elif args.cmd == "worker":
+        _run_workers(args.connect, args.jobs)
+    elif args.cmd == "merge":
+        try:
+            command, dry_run, changes = merge_partials(args.parts, output_diff=args.output_diff)
+        except ValueError as e:
+            parser.error(str(e))
+        empty_messages = {
+            "refc_import": "没有发现需要更新的导入",
+            "remove_defensive_try": "没有发现需要移除的防御式 try-except 语句",
+        }
+        _report_changes(changes, dry_run, args.output_diff, empty_messages[command])
 
 
 if __name__ == "__main__":
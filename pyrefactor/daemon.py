@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+import socketserver
+from typing import Any, Dict, List, Optional, Tuple
+
+from .address import parse_address, make_stream_server, connect
+from .workspace import Workspace
+
+# 常驻服务：`pyrefactor serve` 在 Unix socket（或 tcp）上提供 JSON-RPC 2.0，每行一条 JSON 消息。
+# 服务为每个 (根目录, 包根目录) 保留一个 Workspace（见 workspace.py），每次请求只 stat 整棵树，
+# 重新读取和解析变化的文件；依赖图不变时直接复用上次的转换结果。
+# 本模块顶层只依赖标准库，客户端（pyrefactor-client）因此可以快速启动；
+# 分析模块和 libcst 只在服务进程中按需导入。
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class RPCError(Exception):
+    """JSON-RPC 错误响应"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def _write_message(wfile, obj: Dict[str, Any]) -> None:
+    wfile.write(json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n")
+    wfile.flush()
+
+
+def _read_message(rfile) -> Optional[Dict[str, Any]]:
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line.decode("utf-8"))
+
+
+class Daemon:
+    """按 (根目录, 包根目录) 保存 Workspace，串行处理请求"""
+
+    def __init__(self):
+        self.workspaces: Dict[Tuple[str, Tuple[str, ...]], Workspace] = {}
+        self.lock = threading.Lock()
+        self.server: Optional[socketserver.BaseServer] = None
+
+    def workspace(self, root: str, package_paths: Optional[List[str]]) -> Workspace:
+        key = (os.path.abspath(root), tuple(os.path.abspath(p) for p in package_paths or ()))
+        ws = self.workspaces.get(key)
+        if ws is None:
+            ws = self.workspaces[key] = Workspace(root, package_paths)
+        return ws
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Any:
+        cwd = params.get("cwd") or os.getcwd()
+
+        def resolve(p: Optional[str]) -> Optional[str]:
+            return None if p is None else os.path.join(cwd, p)
+
+        if method == "ping":
+            return {"pid": os.getpid(), "workspaces": len(self.workspaces)}
+        if method == "shutdown":
+            if self.server is not None:
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return True
+        if method not in ("refc_import", "graph"):
+            raise RPCError(METHOD_NOT_FOUND, f"未知的方法: {method}")
+        if "path" not in params:
+            raise RPCError(INVALID_PARAMS, "缺少参数 path")
+        root = params["path"]
+        if method == "refc_import":
+            package_paths = [resolve(p) for p in params["package_path"]] if params.get("package_path") else None
+            ws = self.workspace(resolve(root), package_paths)
+            return ws.refc_import(
+                root,
+                dry_run=params.get("dry_run", True),
+                include_relative=params.get("include_relative", False),
+                allow_control_blocks=params.get("allow_control_blocks", False),
+                failfirst=params.get("failfirst", False),
+                modify_under=resolve(params.get("modify_under")),
+            )
+        if method == "graph":
+            graph_type = params.get("type", "imports")
+            if graph_type == "imports":
+                return self.workspace(resolve(root), None).import_graph()
+            if graph_type == "calls":
+                from .graph import build_call_graph_mermaid
+                return build_call_graph_mermaid(resolve(root))
+            raise RPCError(INVALID_PARAMS, f"未知的图类型: {graph_type}")
+
+    def respond(self, request: Any) -> Dict[str, Any]:
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": INVALID_REQUEST, "message": "无效的请求"}}
+        rid = request.get("id")
+        try:
+            with self.lock:
+                result = self.handle(request["method"], request.get("params") or {})
+        except RPCError as e:
+            return {"jsonrpc": "2.0", "id": rid, "error": {"code": e.code, "message": str(e)}}
+        except Exception as e:
+            return {"jsonrpc": "2.0", "id": rid, "error": {"code": INTERNAL_ERROR, "message": f"{type(e).__name__}: {e}"}}
+        return {"jsonrpc": "2.0", "id": rid, "result": result}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        daemon: Daemon = self.server.rpc
+        while True:
+            try:
+                request = _read_message(self.rfile)
+            except ValueError:
+                _write_message(self.wfile, {"jsonrpc": "2.0", "id": None, "error": {"code": PARSE_ERROR, "message": "无法解析的 JSON"}})
+                continue
+            except OSError:
+                return
+            if request is None:
+                return
+            _write_message(self.wfile, daemon.respond(request))
+
+
+def make_server(address: str, daemon: Optional[Daemon] = None) -> socketserver.BaseServer:
+    server = make_stream_server(*parse_address(address), _Handler)
+    server.rpc = daemon or Daemon()
+    server.rpc.server = server
+    return server
+
+
+def serve(address: str, preload: Optional[List[str]] = None) -> None:
+    """在 address 上提供服务直到收到 shutdown 请求；preload 中的根目录在启动时预先建立缓存"""
+    import libcst  # noqa: F401  在服务进程中预先导入，首个请求不再付出导入开销
+    server = make_server(address)
+    for root in preload or ():
+        server.rpc.workspace(root, None).refresh()
+    family, addr = parse_address(address)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+
+
+class Client:
+    """保持一个连接的 JSON-RPC 客户端"""
+
+    def __init__(self, address: str, connect_timeout: float = 5.0):
+        self.sock = connect(address, connect_timeout)
+        self.rfile = self.sock.makefile("rb")
+        self.wfile = self.sock.makefile("wb")
+        self._next_id = 0
+
+    def call(self, method: str, **params: Any) -> Any:
+        self._next_id += 1
+        _write_message(self.wfile, {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params})
+        response = _read_message(self.rfile)
+        if response is None:
+            raise EOFError("连接已关闭")
+        if "error" in response:
+            raise RPCError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def close(self) -> None:
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def client_main(argv: Optional[List[str]] = None) -> None:
+    """pyrefactor-client：把 refc_import / graph 请求转发给常驻服务，输出与 pyrefactor 对应命令一致"""
+    parser = argparse.ArgumentParser(prog="pyrefactor-client", description="pyrefactor serve 的轻量客户端")
+    parser.add_argument("--socket", default=os.environ.get("PYREFACTOR_SOCKET"), help="服务地址：unix:/path/to/sock 或 tcp:host:port（默认取 PYREFACTOR_SOCKET）")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_refactor = sub.add_parser("refc_import", help="提升安全的 import 到顶层")
+    p_refactor.add_argument("path")
+    p_refactor.add_argument("--include-relative", action="store_true")
+    p_refactor.add_argument("--allow-control-blocks", action="store_true")
+    p_refactor.add_argument("--dry-run", action="store_true", help="仅输出 diff（未指定 --output-diff 时写到 stdout）")
+    p_refactor.add_argument("--output-diff")
+    p_refactor.add_argument("--modify-under")
+    p_refactor.add_argument("--failfirst", action="store_true")
+    p_refactor.add_argument("--package-path", action="append", dest="package_path")
+    p_graph = sub.add_parser("graph", help="生成 Mermaid 图")
+    p_graph.add_argument("type", choices=["imports", "calls"])
+    p_graph.add_argument("path")
+    sub.add_parser("ping", help="检查服务是否在运行")
+    sub.add_parser("shutdown", help="停止服务")
+    args = parser.parse_args(argv)
+    if not args.socket:
+        parser.error("需要 --socket 或环境变量 PYREFACTOR_SOCKET")
+    cwd = os.getcwd()
+    try:
+        with Client(args.socket) as client:
+            if args.cmd == "refc_import":
+                result = client.call(
+                    "refc_import", path=args.path, cwd=cwd, dry_run=args.dry_run, include_relative=args.include_relative,
+                    allow_control_blocks=args.allow_control_blocks, failfirst=args.failfirst,
+                    modify_under=args.modify_under, package_path=args.package_path,
+                )
+                if args.dry_run:
+                    if not result["diff"]:
+                        print("没有发现需要更新的导入")
+                    elif args.output_diff:
+                        with open(args.output_diff, "w", encoding="utf-8") as f:
+                            f.write(result["diff"])
+                        print(f"已写出 diff 到 {args.output_diff}")
+                    else:
+                        sys.stdout.write(result["diff"])
+                elif result["changes"]:
+                    print(f"已更新 {len(result['changes'])} 个文件")
+                else:
+                    print("没有发现需要更新的导入")
+            elif args.cmd == "graph":
+                sys.stdout.write(client.call("graph", type=args.type, path=args.path, cwd=cwd) + "\n")
+            elif args.cmd == "ping":
+                print(json.dumps(client.call("ping"), ensure_ascii=False))
+            else:
+                client.call("shutdown")
+    except RPCError as e:
+        print(f"服务返回错误 ({e.code}): {e}", file=sys.stderr)
+        sys.exit(1)
+    except OSError as e:
+        print(f"无法连接服务 {args.socket}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    client_main()
@@ -0,0 +1,100 @@
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 内容去重：内容相同（且 task_key 相同，例如 refc_import 的模块名）的文件只转换第一个，
+# 结果中指向该文件的路径（diff 头、发现和错误信息，不含 diff 正文）替换为各自的路径后分发给其余文件；直接写回的运行中，有变化的文件把第一个文件的新内容复制过去。
+
+
+# 输出中以文件路径开头的错误信息
+_ERROR_PREFIXES = ("解析文件 ", "处理文件 ")
+
+
+def _retarget_text(text: str, src: str, dst: str) -> str:
+    """把工具生成的、指向文件本身的路径由 src 换成 dst：diff 的 ---/+++ 头（第一个 @@ 之前）、
+    以 "路径:" 开头的发现和以 "解析文件 路径 " 等开头的错误信息；diff 正文中出现的路径是文件内容，保持原样"""
+    if src not in text:
+        return text
+    lines = text.splitlines(True)
+    in_header = True
+    for i, line in enumerate(lines):
+        if line.startswith("@@"):
+            in_header = False
+        if in_header and line[:4] in ("--- ", "+++ ") and line.startswith(src, 4):
+            lines[i] = line[:4] + dst + line[4 + len(src):]
+        elif line.startswith(src + ":"):
+            lines[i] = dst + line[len(src):]
+        else:
+            for prefix in _ERROR_PREFIXES:
+                if line.startswith(prefix + src + " "):
+                    lines[i] = prefix + dst + line[len(prefix) + len(src):]
+    return "".join(lines)
+
+
+def retarget(result: Any, src: str, dst: str) -> Any:
+    """文件任务的结果元组中指向 src 的路径换成 dst（见 _retarget_text），其他结果原样返回"""
+    if isinstance(result, tuple):
+        return tuple(_retarget_text(v, src, dst) if isinstance(v, str) else v for v in result)
+    return result
+
+
+class Dedup:
+    """parallel.run_files 的去重视图
+
+    task_key(task) 给出结果还依赖的任务属性；write_back 为 True 时（非 dry-run）把代表文件的新内容复制给同组文件；
+    digest(path) 计算内容哈希，默认读取整个文件做 sha256，可传入 cache.ResultCache.digest 复用 stat 索引。
+    给出 project（project.Project）时，复制给同组文件的新内容同时更新到其缓存，之后的使用者不会读到旧源码。
+    """
+
+    def __init__(self, task_key: Optional[Callable[[Any], Any]] = None, write_back: bool = False, digest: Optional[Callable[[str], Optional[str]]] = None, project: Any = None):
+        self.task_key = task_key
+        self.write_back = write_back
+        self.project = project
+        if digest is None:
+            from .cache import file_digest
+
+            def digest(path: str) -> Optional[str]:
+                try:
+                    return file_digest(path)
+                except OSError:
+                    return None
+        self.digest = digest
+        self.hits = 0
+
+    def _key(self, task: Any, path: str) -> Optional[Tuple[str, str]]:
+        digest = self.digest(path)
+        if digest is None:
+            return None
+        return digest, json.dumps(self.task_key(task) if self.task_key is not None else None)
+
+    def _copy(self, src: str, dst: str) -> None:
+        with open(src, "rb") as f:
+            data = f.read()
+        with open(dst, "wb") as f:
+            f.write(data)
+        if self.project is not None:
+            self.project.update(dst, data.decode("utf-8"))
+
+    def run(self, tasks: Sequence[Any], paths: Sequence[str], runner: Callable[[Sequence[Any], Sequence[str]], Iterator[Any]], summary: Any = None) -> Iterator[Any]:
+        """每组只把第一个文件交给 runner(tasks, paths)；结果按输入顺序产出"""
+        first: Dict[Tuple[str, str], int] = {}
+        leader: List[int] = []
+        for i, (task, path) in enumerate(zip(tasks, paths)):
+            key = self._key(task, path)
+            leader.append(first.setdefault(key, i) if key is not None else i)
+        unique = [i for i in range(len(paths)) if leader[i] == i]
+        hits = len(paths) - len(unique)
+        self.hits += hits
+        if summary is not None:
+            summary.record_dedup(hits)
+        results = runner([tasks[i] for i in unique], [paths[i] for i in unique]) if unique else iter(())
+        done: Dict[int, Any] = {}
+        for i in range(len(paths)):
+            j = leader[i]
+            if j == i:
+                done[i] = next(results)
+                yield done[i]
+                continue
+            result = done[j]
+            if self.write_back and isinstance(result, tuple) and result and result[0] is True:
+                self._copy(paths[j], paths[i])
+            yield retarget(result, paths[j], paths[i])
@@ -1,6 +1,8 @@
 import libcst as cst
+from libcst.metadata import MetadataWrapper, PositionProvider
 from typing import List, Optional, Set, Tuple
 import os
+import sys
 import difflib
 
 
@@ -257,7 +259,16 @@ def has_raise_statement(stmt: cst.CSTNode) -> bool:
 
 
 class DefensiveTryExceptTransformer(cst.CSTTransformer):
-    """用于移除防御式 try-except 的转换器"""
+    """用于移除防御式 try-except 的转换器
+    
+    行号来自 PositionProvider 元数据（需通过 MetadataWrapper 访问），转换过程中不读取文件，
+    除 changes_made 和 findings（逐条的 (行号, 处理方式, 原因)）外不保存跨节点的可变状态，也不输出，
+    由调用方用 format_findings 排版；每个文件使用独立实例即可在线程中并发运行。
+    只处理单个 try 语句、不依赖模块级上下文，因此也可以在模块分段上运行（line_offset 为分段首行的偏移）。
+    """
+    
+    METADATA_DEPENDENCIES = (PositionProvider,)
+    MODULE_CONTEXT = False
     
     def __init__(self, 
                  max_try_length: int = 30,
@@ -265,14 +276,17 @@ class DefensiveTryExceptTransformer(cst.CSTTransformer):
                  check_print_log: bool = True,
                  check_rethrow: bool = True,
                  check_return_none: bool = True,
-                 filename: str = ""):
+                 filename: str = "",
+                 line_offset: int = 0):
         self.max_try_length = max_try_length
         self.dry_run = dry_run
         self.changes_made = False
+        self.findings: List[Tuple[int, str, str]] = []
         self.check_print_log = check_print_log
         self.check_rethrow = check_rethrow
         self.check_return_none = check_return_none
         self.filename = filename
+        self.line_offset = line_offset
     
     def visit_Everything(self, node: cst.CSTNode) -> Optional[bool]:
         """访问所有节点，专门寻找 Try 节点"""
@@ -280,30 +294,16 @@ class DefensiveTryExceptTransformer(cst.CSTTransformer):
             return True
         return True
     
+    def _line_number(self, node: cst.CSTNode) -> int:
+        """获取节点起始行号；未通过 MetadataWrapper 访问时返回 0"""
+        positions = self.metadata.get(PositionProvider)
+        if not positions or node not in positions:
+            return 0
+        return positions[node].start.line + self.line_offset
+    
     def leave_Try(self, original_node: cst.Try, updated_node: cst.Try) -> cst.CSTNode:
         """处理 Try 节点"""
-        # 获取行号信息的最简单方法：
-        # 我们使用自定义状态变量在访问过程中跟踪行号
-        if not hasattr(self, '_line_counter'):
-            self._line_counter = 0
-            
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                source_lines = f.readlines()
-                
-            # 使用简单的模式匹配查找 try 语句的行号
-            self._line_mapping = []
-            for i, line in enumerate(source_lines):
-                if 'try:' in line:
-                    self._line_mapping.append(i + 1)
-        
-        line_number = 0
-        if hasattr(self, '_line_mapping') and len(self._line_mapping) > self._line_counter:
-            line_number = self._line_mapping[self._line_counter]
-            self._line_counter += 1
-        else:
-            # 如果未找到匹配，使用简单估算方法
-            node_str = str(original_node)
-            line_number = node_str.count('\n') + 1
+        line_number = self._line_number(original_node)
         
         # 找到所有防御式的 except Exception 处理程序
         defensive_handlers = []
@@ -363,155 +363,421 @@ class DefensiveTryExceptTransformer(cst.CSTTransformer):
             if non_defensive_handlers or original_node.finalbody:
                 # 还有其他处理程序或 finally 块，只移除防御式的 handler
                 decision = "✓ 移除防御式的 except Exception 处理"
-                print(f"{self.filename}:{line_number} - {decision}")
-                print(f"  原因：{reason}")
-                return original_node.with_changes(
+                result = original_node.with_changes(
                     handlers=non_defensive_handlers
                 )
             elif original_node.orelse:
                 # 只有 else 块而没有 except 或 finally 块，这是无效的，需要移除整个 try 块
                 decision = "✓ 移除整个防御式 try-except (else 块无效)"
-                print(f"{self.filename}:{line_number} - {decision}")
-                print(f"  原因：{reason}")
-                return cst.FlattenSentinel(original_node.body.body)
+                result = cst.FlattenSentinel(original_node.body.body)
             else:
                 # 没有其他结构，移除整个 try 块
                 decision = "✓ 移除整个防御式 try-except"
-                print(f"{self.filename}:{line_number} - {decision}")
-                print(f"  原因：{reason}")
-                return cst.FlattenSentinel(original_node.body.body)
+                result = cst.FlattenSentinel(original_node.body.body)
+            self.findings.append((line_number, decision, reason))
+            return result
         
         return updated_node
 
 
-def rewrite_file_for_defensive_try_except(
+def _defensive_chunk_task(
+    context: Tuple[int, bool, bool, bool, bool, str],
+    chunk: Tuple[int, str, dict]
+) -> Tuple[Optional[str], bool, str]:
+    """分段任务：转换模块的一段，返回 (新代码, 是否修改, 排版后的发现)；该段解析失败时新代码为 None"""
+    from .chunking import parse_chunk
+    max_try_length, dry_run, check_print_log, check_rethrow, check_return_none, file_path = context
+    try:
+        module = parse_chunk(chunk)
+    except Exception:
+        return None, False, ""
+    transformer = DefensiveTryExceptTransformer(
+        max_try_length,
+        dry_run,
+        check_print_log,
+        check_rethrow,
+        check_return_none,
+        file_path,
+        line_offset=chunk[0]
+    )
+    transformed_module = MetadataWrapper(module, unsafe_skip_copy=True).visit(transformer)
+    return transformed_module.code, transformer.changes_made, format_findings(file_path, transformer.findings)
+
+
+def _transform_in_chunks(
+    source_code: str,
     file_path: str,
+    max_try_length: int,
+    dry_run: bool,
+    check_print_log: bool,
+    check_rethrow: bool,
+    check_return_none: bool,
+    jobs: Optional[int],
+    backend: str
+) -> Optional[Tuple[Optional[str], str]]:
+    """按顶层语句分段并行转换，返回 (新代码或 None 表示未修改, 输出)；无法分段时返回 None"""
+    from .chunking import transform_chunked
+    context = (max_try_length, dry_run, check_print_log, check_rethrow, check_return_none, file_path)
+    results = transform_chunked(source_code, _defensive_chunk_task, context, jobs=jobs, backend=backend)
+    if results is None or any(code is None for code, _, _ in results):
+        return None
+    output = "".join(out for _, _, out in results)
+    if not any(changed for _, changed, _ in results):
+        return None, output
+    return "".join(code for code, _, _ in results), output
+
+
+def format_findings(filename: str, findings: List[Tuple[int, str, str]]) -> str:
+    """排版 DefensiveTryExceptTransformer 的发现，每条为 "文件:行号 - 处理方式" 加一行原因"""
+    return "".join(f"{filename}:{line} - {decision}\n  原因：{reason}\n" for line, decision, reason in findings)
+
+
+def refactor_source(
+    source_code: str,
     max_try_length: int = 30,
-    dry_run: bool = False,
     check_print_log: bool = True,
     check_rethrow: bool = True,
-    check_return_none: bool = True
-) -> Optional[str]:
-    """重写单个文件以移除防御式 try-except"""
+    check_return_none: bool = True,
+    filename: str = "<string>"
+) -> Tuple[str, List[Tuple[int, str, str]]]:
+    """内存接口：移除源码中的防御式 try-except，返回 (新源码, 发现)，不读写文件也不输出
+
+    发现为 (行号, 处理方式, 原因)，可用 format_findings 排版；没有可移除的 try 时新源码即原源码。
+    源码无法解析时抛出 libcst.ParserSyntaxError。
+    """
+    return _refactor_module(cst.parse_module(source_code), source_code, max_try_length, check_print_log, check_rethrow, check_return_none, filename)
+
+
+def _refactor_module(
+    module: cst.Module,
+    source_code: str,
+    max_try_length: int,
+    check_print_log: bool,
+    check_rethrow: bool,
+    check_return_none: bool,
+    filename: str
+) -> Tuple[str, List[Tuple[int, str, str]]]:
+    """refactor_source 在已解析模块上的部分"""
+    transformer = DefensiveTryExceptTransformer(
+        max_try_length,
+        True,
+        check_print_log,
+        check_rethrow,
+        check_return_none,
+        filename
+    )
+    # 模块刚解析出来、不与他人共享，可以跳过 MetadataWrapper 的深拷贝
+    transformed_module = MetadataWrapper(module, unsafe_skip_copy=True).visit(transformer)
+    if not transformer.changes_made:
+        return source_code, []
+    return transformed_module.code, transformer.findings
+
+
+def _rewrite_file(
+    file_path: str,
+    max_try_length: int,
+    dry_run: bool,
+    check_print_log: bool,
+    check_rethrow: bool,
+    check_return_none: bool,
+    jobs: Optional[int],
+    backend: str
+) -> Optional[Tuple[str, str]]:
+    """rewrite_file_for_defensive_try_except 的实现，返回 (原源码, 新源码)，文件只读一次，供 diff 复用"""
+    from .parallel import resolve_jobs
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             source_code = f.read()
         
-        # 解析代码
-        try:
-            module = cst.parse_module(source_code)
-        except Exception as e:
-            print(f"解析文件 {file_path} 时出错: {e}")
-            return None
-        
-        # 创建转换器
-        transformer = DefensiveTryExceptTransformer(
-            max_try_length, 
-            dry_run,
-            check_print_log,
-            check_rethrow,
-            check_return_none,
-            file_path  # 传递完整路径
-        )
-        
-        # 应用转换
-        transformed_module = module.visit(transformer)
-        
-        # 检查是否有变化
-        if not transformer.changes_made:
-            return None
-        
-        transformed_code = transformed_module.code
+        chunked = None
+        if resolve_jobs(jobs) > 1:
+            chunked = _transform_in_chunks(source_code, file_path, max_try_length, dry_run, check_print_log, check_rethrow, check_return_none, jobs, backend)
+        if chunked is not None:
+            transformed_code, output = chunked
+            sys.stdout.write(output)
+            if transformed_code is None:
+                return None
+        else:
+            try:
+                module = cst.parse_module(source_code)
+            except Exception as e:
+                print(f"解析文件 {file_path} 时出错: {e}")
+                return None
+            transformed_code, findings = _refactor_module(module, source_code, max_try_length, check_print_log, check_rethrow, check_return_none, file_path)
+            sys.stdout.write(format_findings(file_path, findings))
+            
+            # 检查是否有变化
+            if not findings:
+                return None
         
         if not dry_run:
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(transformed_code)
         
-        return transformed_code
+        return source_code, transformed_code
     
     except Exception as e:
         print(f"处理文件 {file_path} 时出错: {e}")
         return None
 
 
-def rewrite_directory_for_defensive_try_except(
-    path: str,
+def rewrite_file_for_defensive_try_except(
+    file_path: str,
     max_try_length: int = 30,
     dry_run: bool = False,
-    output_diff: Optional[str] = None,
     check_print_log: bool = True,
     check_rethrow: bool = True,
-    check_return_none: bool = True
-) -> List[str]:
-    """重写目录或单个文件中的所有 Python 文件以移除防御式 try-except"""
-    modified_files = []
+    check_return_none: bool = True,
+    jobs: Optional[int] = 1,
+    backend: str = "auto"
+) -> Optional[str]:
+    """重写单个文件以移除防御式 try-except
+
+    jobs > 1 时在顶层语句边界把模块分段，并行解析和转换各段后拼接（用于超大的单个模块）；
+    无法分段或某段解析失败时回退到整文件处理。只处理内存中的源码时使用 refactor_source。
+    """
+    result = _rewrite_file(file_path, max_try_length, dry_run, check_print_log, check_rethrow, check_return_none, jobs, backend)
+    return None if result is None else result[1]
+
+
+def _defensive_file_task(
+    context: Tuple[int, bool, bool, bool, bool, bool, Optional[int], str],
+    file_path: str
+) -> Tuple[bool, str, str]:
+    """worker 任务：处理单个文件，返回 (是否修改, diff 文本, 截获的输出)
+
+    context 末尾的 (chunk_jobs, backend) 用于超大文件的文件内分段并行，普通文件 chunk_jobs 为 1。
+    """
+    from .parallel import captured
+    max_try_length, dry_run, want_diff, check_print_log, check_rethrow, check_return_none, chunk_jobs, backend = context
     
-    if os.path.isfile(path) and path.endswith('.py'):
-        # 处理单个文件
-        transformed_code = rewrite_file_for_defensive_try_except(
-            path,
+    def run() -> Tuple[bool, str]:
+        result = _rewrite_file(
+            file_path,
             max_try_length,
             dry_run,
             check_print_log,
             check_rethrow,
-            check_return_none
+            check_return_none,
+            chunk_jobs,
+            backend
         )
+        if result is None:
+            return False, ""
+        original_code, transformed_code = result
         
-        if transformed_code is not None:
-            modified_files.append(path)
-            
-            # 如果需要输出 diff 且是 dry_run
-            if dry_run and output_diff:
-                with open(path, 'r', encoding='utf-8') as f:
-                    original_code = f.read()
-                
-                # 生成 diff
-                diff_text = ''.join(difflib.unified_diff(
-                    original_code.splitlines(True),
-                    transformed_code.splitlines(True),
-                    fromfile=path,
-                    tofile=f"{path}.modified"
-                ))
-                
-                # 写入 diff 文件
-                with open(output_diff, 'a', encoding='utf-8') as f:
-                    f.write(diff_text)
+        # 如果需要输出 diff 且是 dry_run
+        diff_text = ""
+        if dry_run and want_diff:
+            # 生成 diff（原源码来自转换时的同一次读取）
+            diff_text = ''.join(difflib.unified_diff(
+                original_code.splitlines(True),
+                transformed_code.splitlines(True),
+                fromfile=file_path,
+                tofile=f"{file_path}.modified"
+            ))
+        return True, diff_text
     
+    (changed, diff_text), output = captured(run)
+    return changed, diff_text, output
+
+
+def collect_files(path: str) -> List[str]:
+    """按遍历顺序列出需要处理的 Python 文件（path 可以是单个文件）"""
+    file_paths: List[str] = []
+    if os.path.isfile(path) and path.endswith('.py'):
+        # 处理单个文件
+        file_paths.append(path)
     elif os.path.isdir(path):
         # 遍历目录
         for root, dirs, files in os.walk(path):
             for file_name in files:
                 if file_name.endswith('.py'):
-                    file_path = os.path.join(root, file_name)
-                    
-                    # 重写文件
-                    transformed_code = rewrite_file_for_defensive_try_except(
-                        file_path,
-                        max_try_length,
-                        dry_run,
-                        check_print_log,
-                        check_rethrow,
-                        check_return_none
-                    )
-                    
-                    if transformed_code is not None:
-                        modified_files.append(file_path)
-                        
-                        # 如果需要输出 diff 且是 dry_run
-                        if dry_run and output_diff:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                original_code = f.read()
-                            
-                            # 生成 diff
-                            diff_text = ''.join(difflib.unified_diff(
-                                original_code.splitlines(True),
-                                transformed_code.splitlines(True),
-                                fromfile=file_path,
-                                tofile=f"{file_path}.modified"
-                            ))
-                            
-                            # 写入 diff 文件
-                            with open(output_diff, 'a', encoding='utf-8') as f:
-                                f.write(diff_text)
+                    file_paths.append(os.path.join(root, file_name))
+    return file_paths
+
+
+def _count_lines(file_path: str) -> int:
+    with open(file_path, 'rb') as f:
+        return f.read().count(b"\n")
+
+
+def rewrite_directory_for_defensive_try_except(
+    path: str,
+    max_try_length: int = 30,
+    dry_run: bool = False,
+    output_diff: Optional[str] = None,
+    check_print_log: bool = True,
+    check_rethrow: bool = True,
+    check_return_none: bool = True,
+    jobs: Optional[int] = 1,
+    cost_history: Optional[str] = None,
+    backend: str = "auto",
+    shard: Optional[Tuple[int, int]] = None,
+    shard_output: Optional[str] = None,
+    split_lines: Optional[int] = None,
+    guard=None,
+    journal: Optional[str] = None,
+    resume: bool = False,
+    summary=None,
+    cache=None,
+    only: Optional[Set[str]] = None,
+    dedup: bool = False
+) -> List[str]:
+    """重写目录或单个文件中的所有 Python 文件以移除防御式 try-except
+    
+    jobs 为并行 worker 数（1 为串行，0 表示使用全部 CPU），输出和 diff 始终按文件顺序写出。
+    cost_history 为记录各文件耗时的 JSON 文件，下次运行据此优先派发耗时最长的文件。
+    backend 为执行后端 process/thread/auto，auto 仅在 free-threaded 解释器上使用线程。
+    shard 为 (i, n) 时只处理按路径稳定哈希分到第 i 片的文件；同时给出 shard_output 时，
+    输出与 diff 写入分片结果文件而不是 stdout/output_diff，由 merge 子命令合并。
+    split_lines 为行数阈值：不少于该行数的文件先逐个在主进程中按顶层语句分段，用全部 worker 并行处理，
+    其余文件再按文件并行；输出顺序不变。
+    guard 为 parallel.Guard(timeout, max_rss) 时每个文件在受保护的子进程中处理，
+    超时或内存超限的文件被跳过并输出 "skipped: timeout/memory"，其余文件继续处理。
+    journal 为进度日志文件（见 journal.py），每处理完一个文件追加一条记录；resume 为 True 时
+    跳过日志中已完成且内容未变的文件（回放其输出），并把 output_diff 截断到最后一条记录处继续追加。
+    被 guard 跳过的文件不记入日志，续跑时会重新处理。
+    jobs 为 "auto" 时校准后自动选择 worker 数和批大小，所选的值和实测吞吐记入 summary（tuning.RunSummary）。
+    cache 为 cache.ResultCache 时，内容与选项都未变的文件直接使用上次的结果（按 split_lines 分段处理的超大文件除外）。
+    only 为 vcs.changed_files 给出的绝对路径集合时，只处理其中的文件。
+    dedup 为 True 时内容相同的文件只处理一次，结果复用到其余文件，去重数记入 summary。
+    """
+    from .parallel import run_files, Skipped
+    from .shard import select_shard, make_entry, write_partial
+    from .vcs import select_only
+    from .dedup import Dedup
+    modified_files = []
+    
+    file_paths = select_only(collect_files(path), only)
+    total = len(file_paths)
+    indices = select_shard(file_paths, path if os.path.isdir(path) else os.path.dirname(path), shard)
+    file_paths = [file_paths[k] for k in indices]
+    partial = shard is not None and bool(shard_output)
+    entries = []
+    if journal and partial:
+        raise ValueError("进度日志不能与分片结果文件同时使用")
+    
+    log = None
+    done = {}
+    if journal:
+        from .journal import Journal
+        options = {
+            "path": os.path.abspath(path),
+            "max_try_length": max_try_length,
+            "dry_run": dry_run,
+            "output_diff": output_diff,
+            "check_print_log": check_print_log,
+            "check_rethrow": check_rethrow,
+            "check_return_none": check_return_none,
+            "shard": list(shard) if shard else None,
+        }
+        log = Journal(journal, "remove_defensive_try", options, resume=resume)
+        if output_diff:
+            # 丢弃中断时已写出但未记入日志的 diff
+            with open(output_diff, 'a', encoding='utf-8') as f:
+                f.truncate(log.diff_end)
+        done = {k: entry for k, entry in ((k, log.lookup(p)) for k, p in enumerate(file_paths)) if entry is not None}
+    
+    context = (max_try_length, dry_run, bool(output_diff) or partial, check_print_log, check_rethrow, check_return_none, 1, backend)
+    pending = [k for k in range(len(file_paths)) if k not in done]
+    large = [k for k in pending if split_lines and _count_lines(file_paths[k]) >= split_lines]
+    large_results = {k: _defensive_file_task(context[:-2] + (jobs, backend), file_paths[k]) for k in large}
+    small = [file_paths[k] for k in pending if k not in large_results]
+    scope = cache.scope("remove_defensive_try", list(context[:-2]), store_changed=dry_run) if cache is not None else None
+    dedup_scope = Dedup(write_back=not dry_run, digest=cache.digest if cache is not None else None) if dedup else None
+    small_results = run_files(_defensive_file_task, small, small, jobs=jobs, context=context, cost_history=cost_history, backend=backend, guard=guard, summary=summary, cache=scope, dedup=dedup_scope)
+    
+    def result_at(k: int):
+        if k in done:
+            return done[k]
+        if k in large_results:
+            return large_results[k]
+        return next(small_results)
+    
+    try:
+        for index, file_path, result in zip(indices, file_paths, map(result_at, range(len(file_paths)))):
+            if isinstance(result, dict):
+                # 日志中已完成的文件：回放记录的输出，其 diff 已在上次运行写出
+                sys.stdout.write(result["output"])
+                if result["changed"]:
+                    modified_files.append(file_path)
+                continue
+            skipped = isinstance(result, Skipped)
+            if skipped:
+                result = (False, "", result.message(file_path))
+            changed, diff_text, output = result
+            if partial:
+                if changed or output:
+                    entries.append(make_entry(index, file_path, changed, diff_text, output))
+                if changed:
+                    modified_files.append(file_path)
+                continue
+            sys.stdout.write(output)
+            diff_end = log.diff_end if log is not None else 0
+            if changed:
+                modified_files.append(file_path)
+                
+                # 写入 diff 文件
+                if diff_text:
+                    with open(output_diff, 'a', encoding='utf-8') as f:
+                        f.write(diff_text)
+                        diff_end = f.tell()
+            if log is not None and not skipped:
+                log.record(file_path, changed, output, diff_end)
+    finally:
+        if log is not None:
+            log.close()
+    
+    if partial:
+        write_partial(shard_output, "remove_defensive_try", shard, total, dry_run, entries)
     
     return modified_files
+
+
+async def rewrite_file_for_defensive_try_except_async(
+    file_path: str,
+    max_try_length: int = 30,
+    dry_run: bool = False,
+    check_print_log: bool = True,
+    check_rethrow: bool = True,
+    check_return_none: bool = True,
+    executor=None
+) -> Optional[str]:
+    """rewrite_file_for_defensive_try_except 的 asyncio 版本，在 executor（默认为事件循环的线程池）中执行"""
+    from .aio import run_blocking
+    return await run_blocking(
+        rewrite_file_for_defensive_try_except,
+        file_path,
+        max_try_length,
+        dry_run,
+        check_print_log,
+        check_rethrow,
+        check_return_none,
+        executor=executor
+    )
+
+
+async def rewrite_directory_for_defensive_try_except_async(
+    path: str,
+    max_try_length: int = 30,
+    dry_run: bool = False,
+    check_print_log: bool = True,
+    check_rethrow: bool = True,
+    check_return_none: bool = True,
+    executor=None,
+    limit: Optional[int] = None
+):
+    """rewrite_directory_for_defensive_try_except 的 asyncio 版本：按文件顺序逐个产出 aio.FileResult
+
+    不写 stdout 也不写 diff 文件：每个文件截获的输出在 FileResult.output 中，dry_run 时 diff 在 FileResult.diff 中。
+    executor 由调用方提供（线程池或进程池），limit 为同时在途的文件数。
+    """
+    from .aio import FileResult, stream_ordered
+    context = (max_try_length, dry_run, dry_run, check_print_log, check_rethrow, check_return_none, 1, "auto")
+    file_paths = collect_files(path)
+    results = stream_ordered(_defensive_file_task, file_paths, context=context, executor=executor, limit=limit)
+    index = 0
+    async for changed, diff_text, output in results:
+        yield FileResult(file_paths[index], changed, diff_text, output)
+        index += 1
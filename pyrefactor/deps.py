@@ -1,6 +1,13 @@
 import os
 import ast
-from typing import Dict, Set, List, Optional
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Dict, Set, List, Optional, Tuple
+from .parallel import WorkerPool, Guard, Skipped, run_files
+from .shared_graph import CSRGraph
+
+if TYPE_CHECKING:
+    from .project import Project
+    from .resolve import ModuleResolver
 
 
 def list_python_files(root: str) -> List[str]:
@@ -113,19 +120,40 @@ def _imports_in_module(tree: ast.Module, current_module: str, is_init: bool) ->
     return deps
 
 
-def build_dependency_graph(root: str, package_paths: Optional[List[str]] = None) -> Dict[str, Set[str]]:
-    graph: Dict[str, Set[str]] = {}
-    roots = package_paths or [root]
-    for f in _py_files(root):
+def _scan_file(project: Optional["Project"], task: Tuple[str, str]) -> Optional[Set[str]]:
+    path, mod = task
+    if project is not None:
+        tree = project.tree(path)
+        project.release_scanned(path)
+        if tree is None:
+            return None
+    else:
         try:
-            with open(f, "r", encoding="utf-8") as fh:
+            with open(path, "r", encoding="utf-8") as fh:
                 src = fh.read()
             tree = ast.parse(src)
         except Exception:
-            continue
-        mod = module_name_from_path_multi(f, roots)
-        is_init = os.path.basename(f) == "__init__.py"
-        graph[mod] = _imports_in_module(tree, mod, is_init)
+            return None
+    is_init = os.path.basename(path) == "__init__.py"
+    return _imports_in_module(tree, mod, is_init)
+
+
+def build_dependency_graph(root: str, package_paths: Optional[List[str]] = None, jobs: Optional[int] = 1, pool: Optional[WorkerPool] = None, guard: Optional[Guard] = None, resolver: Optional["ModuleResolver"] = None, project: Optional["Project"] = None) -> Dict[str, Set[str]]:
+    """resolver 为同一 root / package_paths 的 resolve.ModuleResolver 时复用其文件列表和模块名，不再重新遍历
+
+    给出 project（project.Project）时文件索引和已缓存的内容取自其中；扫描完的 ast 树随即释放。
+    """
+    from .resolve import ModuleResolver
+    graph: Dict[str, Set[str]] = {}
+    if project is not None:
+        resolver = project.resolver
+    elif resolver is None:
+        resolver = ModuleResolver(root, package_paths)
+    tasks = list(resolver.paths.items())
+    for (f, mod), deps in zip(tasks, run_files(_scan_file, tasks, [t[0] for t in tasks], jobs=jobs, context=project, pool=pool, guard=guard)):
+        # 解析失败或被保护阈值跳过的文件不进入依赖图
+        if deps is not None and not isinstance(deps, Skipped):
+            graph[mod] = deps
     return graph
 
 
@@ -144,5 +172,150 @@ def _reachable(graph: Dict[str, Set[str]], src: str, dst: str) -> bool:
     return False
 
 
+def reverse_graph(graph: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    """依赖图的反向边：模块 -> 直接导入它的模块"""
+    reverse: Dict[str, Set[str]] = {}
+    for mod, deps in graph.items():
+        for d in deps:
+            reverse.setdefault(d, set()).add(mod)
+    return reverse
+
+
+def reaching_modules(reverse: Dict[str, Set[str]], module: str) -> Set[str]:
+    """能到达 module 的模块（含 module 本身），即 would_create_cycle(graph, module, d) 为真的全部 d；reverse 为 reverse_graph(graph)"""
+    seen: Set[str] = {module}
+    stack: List[str] = [module]
+    while stack:
+        for prev in reverse.get(stack.pop(), ()):
+            if prev not in seen:
+                seen.add(prev)
+                stack.append(prev)
+    return seen
+
+
 def would_create_cycle(graph: Dict[str, Set[str]], src: str, dst: str) -> bool:
+    """src 新增对 dst 的导入是否成环（dst 能否到达 src）
+
+    graph 为 ReachabilityIndex 时查询可达性索引；CSRGraph（进程 worker attach 的共享图）直接在整数 id 上
+    做深度优先搜索，不把图解码回 Python 集合，也不在每个 worker 中各建一份索引；
+    其他映射（例如 LSP 中叠加了未保存缓冲区的 ChainMap）每次做一次深度优先搜索。
+    """
+    index = reachability_index(graph)
+    if index is not None:
+        return index.reachable(dst, src)
+    if isinstance(graph, CSRGraph):
+        return graph.reachable(dst, src)
     return _reachable(graph, dst, src)
+
+
+def reachability_index(graph: Dict[str, Set[str]]) -> Optional["ReachabilityIndex"]:
+    """graph 本身是 ReachabilityIndex 时返回它，否则为 None（索引由持有整个依赖图的一方构建一次后传入）"""
+    if isinstance(graph, ReachabilityIndex):
+        return graph
+    return None
+
+
+def strongly_connected_components(graph: Dict[str, Set[str]]) -> List[List[str]]:
+    """Tarjan 算法（迭代实现）求强连通分量；只考虑图中有出边表的模块，外部模块被忽略
+
+    分量按逆拓扑序产出（被依赖的分量在前），分量内按模块名排序。
+    """
+    index: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    on_stack: Set[str] = set()
+    stack: List[str] = []
+    components: List[List[str]] = []
+    for start in sorted(graph):
+        if start in index:
+            continue
+        index[start] = low[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(sorted(d for d in graph[start] if d in graph)))]
+        while work:
+            node, neighbors = work[-1]
+            advanced = False
+            for nxt in neighbors:
+                if nxt not in index:
+                    index[nxt] = low[nxt] = len(index)
+                    stack.append(nxt)
+                    on_stack.add(nxt)
+                    work.append((nxt, iter(sorted(d for d in graph[nxt] if d in graph))))
+                    advanced = True
+                    break
+                if nxt in on_stack:
+                    low[node] = min(low[node], index[nxt])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                component: List[str] = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(sorted(component))
+    return components
+
+
+def import_cycles(graph: Dict[str, Set[str]]) -> List[Tuple[str, ...]]:
+    """图中的导入环：包含多个模块或存在自环的强连通分量，按首个模块名排序"""
+    components = graph.components if isinstance(graph, ReachabilityIndex) else strongly_connected_components(graph)
+    cycles = [tuple(c) for c in components if len(c) > 1 or c[0] in graph[c[0]]]
+    return sorted(cycles)
+
+
+class ReachabilityIndex(Mapping):
+    """依赖图的可达性索引，只读地包装 graph（读取接口与 graph 相同）
+
+    强连通分量缩点后，按 Tarjan 产出的逆拓扑序在 DAG 上计算传递闭包，每个分量的可达集合是一个整数位集合
+    （第 i 位对应第 i 个分量）。构建一次后，可达性查询只需两次字典查找和一次位运算。
+    只作为导入目标出现的外部模块没有出边，记录直接导入它的分量，查询结果与深度优先搜索一致。
+    """
+
+    def __init__(self, graph: Dict[str, Set[str]]):
+        self.graph = graph
+        self.components = strongly_connected_components(graph)
+        self._component: Dict[str, int] = {m: i for i, comp in enumerate(self.components) for m in comp}
+        self._closure: List[int] = []
+        self._importers: Dict[str, int] = {}
+        for i, comp in enumerate(self.components):
+            bits = 1 << i
+            for m in comp:
+                for d in graph[m]:
+                    j = self._component.get(d)
+                    if j is None:
+                        self._importers[d] = self._importers.get(d, 0) | 1 << i
+                    elif j != i:
+                        # 被依赖的分量先产出，其闭包已经算好
+                        bits |= self._closure[j]
+            self._closure.append(bits)
+
+    def component_of(self, module: str) -> Optional[int]:
+        """module 所在强连通分量在 components 中的下标，外部模块为 None"""
+        return self._component.get(module)
+
+    def reachable(self, src: str, dst: str) -> bool:
+        if src == dst:
+            return True
+        i = self._component.get(src)
+        if i is None:
+            return False
+        j = self._component.get(dst)
+        if j is None:
+            return bool(self._closure[i] & self._importers.get(dst, 0))
+        return bool(self._closure[i] >> j & 1)
+
+    def __getitem__(self, name: str):
+        return self.graph[name]
+
+    def __iter__(self):
+        return iter(self.graph)
+
+    def __len__(self) -> int:
+        return len(self.graph)
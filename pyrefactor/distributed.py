@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import socket
+import struct
+import difflib
+import hashlib
+import threading
+import socketserver
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .address import parse_address, make_stream_server, connect as _connect
+from .parallel import CostModel
+from .shard import make_entry, replay_entries
+from .shared_graph import CSRGraph, encode_graph
+
+# 协调器/worker 之间的消息帧：!II 头（JSON 长度, 附加二进制长度）+ JSON + 二进制载荷。
+# 二进制载荷目前只用于在握手时下发 CSR 编码的依赖图，worker 直接在收到的字节上建立只读视图。
+# 每个任务携带协调器读到的源码及其 sha256：worker 只处理收到的源码，不读取自己的工作目录；
+# 协调器只接受哈希与分发时一致的结果，写回前再确认磁盘上的文件没有在处理期间被修改。
+_FRAME = struct.Struct("!II")
+
+COMMANDS = ("refc_import", "remove_defensive_try")
+
+
+def _send(wfile, obj: Dict[str, Any], payload: bytes = b"") -> None:
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    wfile.write(_FRAME.pack(len(data), len(payload)) + data + payload)
+    wfile.flush()
+
+
+def _read_exact(rfile, n: int) -> bytes:
+    data = rfile.read(n)
+    if len(data) < n:
+        raise EOFError("连接已关闭")
+    return data
+
+
+def _recv(rfile) -> Tuple[Dict[str, Any], bytes]:
+    json_len, payload_len = _FRAME.unpack(_read_exact(rfile, _FRAME.size))
+    obj = json.loads(_read_exact(rfile, json_len).decode("utf-8"))
+    payload = _read_exact(rfile, payload_len) if payload_len else b""
+    return obj, payload
+
+
+def source_digest(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def error_entry(index: int, path: str, message: str) -> Dict[str, Any]:
+    return make_entry(index, path, False, output=f"处理文件 {path} 时出错: {message}\n")
+
+
+def compute_entry(command: str, options: Dict[str, Any], graph: Optional[CSRGraph], index: int, path: str, module: str, source: str) -> Dict[str, Any]:
+    """在 worker 上处理协调器发来的源码，不读写磁盘；非 dry_run 时新源码随条目返回，由协调器写回
+
+    条目带上所处理源码的 sha256；处理出错时返回带错误信息的未变化条目，而不是让 worker 退出。
+    """
+    try:
+        entry = _compute_entry(command, options, graph, index, path, module, source)
+    except Exception as e:
+        entry = error_entry(index, path, str(e))
+    entry["sha256"] = source_digest(source)
+    return entry
+
+
+def _compute_entry(command: str, options: Dict[str, Any], graph: Optional[CSRGraph], index: int, path: str, module: str, src: str) -> Dict[str, Any]:
+    dry_run = options["dry_run"]
+    if command == "refc_import":
+        from .imports_refactor import transform_source
+        is_init = os.path.basename(path) == "__init__.py"
+        new_src = transform_source(src, module, is_init, graph, options["include_relative"], options["allow_control_blocks"], options["failfirst"])
+        if new_src is None or new_src == src:
+            return make_entry(index, path, False)
+        if dry_run:
+            diff = "".join(difflib.unified_diff(src.splitlines(True), new_src.splitlines(True), fromfile=path, tofile=path))
+            return make_entry(index, path, True, diff)
+        return make_entry(index, path, True, source=new_src)
+    if command == "remove_defensive_try":
+        import libcst as cst
+        from .defensive_try_except import _refactor_module, format_findings
+        try:
+            module = cst.parse_module(src)
+        except Exception as e:
+            return make_entry(index, path, False, output=f"解析文件 {path} 时出错: {e}\n")
+        transformed_code, findings = _refactor_module(module, src, options["max_try_length"], options["check_print_log"], options["check_rethrow"], options["check_return_none"], path)
+        output = format_findings(path, findings)
+        if not findings:
+            return make_entry(index, path, False, output=output)
+        diff = ""
+        if dry_run and options["want_diff"]:
+            diff = "".join(difflib.unified_diff(
+                src.splitlines(True),
+                transformed_code.splitlines(True),
+                fromfile=path,
+                tofile=f"{path}.modified"
+            ))
+        return make_entry(index, path, True, diff, output, source=None if dry_run else transformed_code)
+    raise ValueError(f"不支持分发的命令: {command}")
+
+
+class Coordinator:
+    """向 worker 分发文件任务并收集结果
+
+    任务按预估代价从大到小出队；worker 断开时其未完成的任务重新入队，因此 worker 可以随时加入或退出。
+    """
+
+    def __init__(self, command: str, options: Dict[str, Any], tasks: List[Tuple[str, str]], graph: Any = None, cost_history: Optional[str] = None):
+        if command not in COMMANDS:
+            raise ValueError(f"不支持分发的命令: {command}")
+        self.command = command
+        self.options = options
+        self.tasks = tasks
+        if graph is None:
+            self.graph_bytes = b""
+        elif isinstance(graph, CSRGraph):
+            self.graph_bytes = graph.tobytes()
+        else:
+            self.graph_bytes = encode_graph(graph)
+        costs = CostModel(cost_history).estimate([t[0] for t in tasks])
+        self._pending = sorted(range(len(tasks)), key=lambda i: (costs[i], -i))  # 末尾是代价最大的任务
+        self._inflight: Set[int] = set()
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._digests: Dict[int, str] = {}
+        self._cond = threading.Condition()
+
+    def next_task(self) -> Optional[int]:
+        """返回下一个任务下标；暂无可分配任务返回 None，全部完成返回 -1"""
+        with self._cond:
+            if self._pending:
+                index = self._pending.pop()
+                self._inflight.add(index)
+                return index
+            if self._inflight:
+                return None
+            return -1
+
+    def task_message(self, index: int) -> Optional[Dict[str, Any]]:
+        """读取任务文件，返回发给 worker 的消息；文件无法读取时直接记录错误条目并返回 None"""
+        path, module = self.tasks[index]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                source = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            self.complete(error_entry(index, path, str(e)))
+            return None
+        digest = source_digest(source)
+        with self._cond:
+            self._digests[index] = digest
+        return {"index": index, "path": path, "module": module, "source": source, "sha256": digest}
+
+    def complete(self, entry: Dict[str, Any]) -> None:
+        with self._cond:
+            index = entry["index"]
+            if "sha256" in entry and entry["sha256"] != self._digests.get(index):
+                # 结果不是基于分发出去的内容计算的，不接受
+                path = self.tasks[index][0]
+                entry = error_entry(index, path, "worker 结果与分发的源码不一致，已丢弃")
+            self._inflight.discard(index)
+            self._entries[index] = entry
+            self._cond.notify_all()
+
+    def requeue(self, indices: Set[int]) -> None:
+        with self._cond:
+            for index in indices:
+                if index in self._inflight:
+                    self._inflight.discard(index)
+                    self._pending.append(index)
+            self._cond.notify_all()
+
+    def finished(self) -> bool:
+        return len(self._entries) == len(self.tasks)
+
+    def serve(self, address: str, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """在 address 上提供任务直到所有文件完成，返回按文件顺序排列的结果条目"""
+        family, addr = parse_address(address)
+        server = _make_server(family, addr, self)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            with self._cond:
+                while not self.finished():
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"协调器超时，已完成 {len(self._entries)}/{len(self.tasks)} 个文件")
+                    self._cond.wait(remaining)
+        finally:
+            server.shutdown()
+            server.server_close()
+            if family == socket.AF_UNIX and os.path.exists(addr):
+                os.unlink(addr)
+        return [self._entries[i] for i in range(len(self.tasks))]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        coord: Coordinator = self.server.coordinator
+        inflight: Set[int] = set()
+        try:
+            while True:
+                msg, _ = _recv(self.rfile)
+                op = msg.get("op")
+                if op == "hello":
+                    _send(self.wfile, {"command": coord.command, "options": coord.options}, coord.graph_bytes)
+                elif op == "next":
+                    index = coord.next_task()
+                    if index is None:
+                        _send(self.wfile, {"wait": 0.05})
+                    elif index < 0:
+                        _send(self.wfile, {"done": True})
+                        return
+                    else:
+                        task = coord.task_message(index)
+                        if task is None:
+                            _send(self.wfile, {"wait": 0})
+                            continue
+                        inflight.add(index)
+                        _send(self.wfile, task)
+                elif op == "result":
+                    inflight.discard(msg["entry"]["index"])
+                    coord.complete(msg["entry"])
+        except (EOFError, OSError):
+            pass
+        finally:
+            coord.requeue(inflight)
+
+
+def _make_server(family: int, addr: Any, coordinator: Coordinator) -> socketserver.BaseServer:
+    server = make_stream_server(family, addr, _Handler)
+    server.coordinator = coordinator
+    return server
+
+
+def run_worker(address: str, connect_timeout: float = 30.0) -> int:
+    """连接协调器并循环领取任务，直到协调器通知全部完成；返回处理的文件数"""
+    sock = _connect(address, connect_timeout)
+    processed = 0
+    with sock, sock.makefile("rb") as rfile, sock.makefile("wb") as wfile:
+        _send(wfile, {"op": "hello"})
+        job, payload = _recv(rfile)
+        graph = CSRGraph(payload) if payload else None
+        while True:
+            try:
+                _send(wfile, {"op": "next"})
+                msg, _ = _recv(rfile)
+            except (EOFError, OSError):
+                # 协调器收齐结果后会直接关闭服务，等同于 done
+                break
+            if msg.get("done"):
+                break
+            if "wait" in msg:
+                time.sleep(msg["wait"])
+                continue
+            entry = compute_entry(job["command"], job["options"], graph, msg["index"], msg["path"], msg["module"], msg["source"])
+            _send(wfile, {"op": "result", "entry": entry})
+            processed += 1
+    return processed
+
+
+def run_coordinator(address: str, command: str, options: Dict[str, Any], tasks: List[Tuple[str, str]], graph: Any = None, output_diff: Optional[str] = None, cost_history: Optional[str] = None, timeout: Optional[float] = None) -> List[str]:
+    """分发任务并回放结果，返回值与单机运行对应目录函数的返回值一致"""
+    coordinator = Coordinator(command, options, tasks, graph=graph, cost_history=cost_history)
+    entries = coordinator.serve(address, timeout=timeout)
+    return replay_entries(command, options["dry_run"], entries, output_diff=output_diff)
@@ -154,45 +154,46 @@ def create_subfunction_name(original_func_name: str, context_desc: str, suffix_c
 class FunctionSplitter(cst.CSTTransformer):
     """
     将大函数切割为多个小函数的 CST 转换器
+    
+    每个函数的拆分状态（当前上下文、收集中的语句、生成的子函数）都是 leave_FunctionDef 内的局部变量，
+    类方法生成的子函数挂在对应类的栈帧上，因此不同函数之间不会互相串扰。
     """
+    # 子函数名需要在整个模块内去重（existing_function_names），不能分段处理
+    MODULE_CONTEXT = True
     
     def __init__(self, source_lines: List[str], metadata, existing_function_names: List[str], process_methods: bool = False):
         self.source_lines = source_lines
         self.metadata = metadata
         self._in_function = 0
         self._in_class = 0  # 跟踪当前是否在类定义内部
-        self._subfunctions: List[cst.FunctionDef] = []
-        self._current_subfunction: List[cst.CSTNode] = []
-        self._current_context: Optional[str] = None
-        self._function_levels: List[int] = []
-        self._class_levels: List[int] = []
+        # 每层类定义一个列表，保存其方法拆分出的子函数，在 leave_ClassDef 中统一追加到类体
+        self._class_subfunctions: List[List[cst.FunctionDef]] = []
         # 跟踪所有已存在的和已创建的函数名称
         self._function_names: Dict[str, int] = {}
         for func_name in existing_function_names:
             self._function_names[func_name] = 0
-        self._suffix_counter: int = 0  # 每个函数的后缀计数器
-        self._original_func_name: str = ""  # 当前正在处理的原函数名
         self._process_methods: bool = process_methods  # 控制是否处理类内部的方法
+        # 按创建顺序记录新建的子函数名
+        self.created: List[str] = []
     
     def visit_ClassDef(self, node: cst.ClassDef) -> bool:
         """访问类定义节点"""
         self._in_class += 1
-        self._class_levels.append(self._in_class)
+        self._class_subfunctions.append([])
         print(f"访问类: {node.name.value}, 嵌套级别: {self._in_class}")
         return True  # 继续访问类的内部节点
     
     def leave_ClassDef(self, original_node: cst.ClassDef, updated_node: cst.ClassDef) -> cst.CSTNode:
         """离开类定义节点"""
         self._in_class -= 1
-        self._class_levels.pop()
+        subfunctions = self._class_subfunctions.pop()
         print(f"离开类: {original_node.name.value}")
         
         # 如果有子函数需要添加到类的 body 中
-        if self._subfunctions:
-            print(f"添加 {len(self._subfunctions)} 个子函数到类中")
+        if subfunctions:
+            print(f"添加 {len(subfunctions)} 个子函数到类中")
             new_body = list(updated_node.body.body)
-            new_body.extend(self._subfunctions)
-            self._subfunctions = []  # 清空子函数列表
+            new_body.extend(subfunctions)
             return updated_node.with_changes(
                 body=updated_node.body.with_changes(body=tuple(new_body))
             )
@@ -201,15 +202,9 @@ class FunctionSplitter(cst.CSTTransformer):
     
     def visit_FunctionDef(self, node: cst.FunctionDef) -> bool:
         self._in_function += 1
-        self._function_levels.append(self._in_function)
         
         print(f"访问函数: {node.name.value}, 嵌套级别: {self._in_function}, 是否在类内部: {self._in_class > 0}")
         
-        # 对于每个新的顶级函数或类内部的方法（如果启用），初始化后缀计数器
-        if self._in_function == 1 or (self._in_class > 0 and self._process_methods):
-            self._suffix_counter = 1
-            self._original_func_name = node.name.value
-        
         # 确定是否应该处理当前函数：
         # 1. 顶级函数总是处理
         # 2. 类内部的方法只有在 process_methods 为 True 时才处理
@@ -218,9 +213,60 @@ class FunctionSplitter(cst.CSTTransformer):
             return False
         return True
     
+    def _unique_name(self, subfunc_name: str) -> str:
+        """确保子函数名称不重复"""
+        if subfunc_name in self._function_names:
+            # 如果名称已存在，添加数字后缀
+            counter = self._function_names[subfunc_name] + 1
+            while f"{subfunc_name}_{counter}" in self._function_names:
+                counter += 1
+            subfunc_name = f"{subfunc_name}_{counter}"
+            self._function_names[subfunc_name] = counter
+        else:
+            self._function_names[subfunc_name] = 0
+        return subfunc_name
+    
+    def _build_subfunction(self, subfunc_name: str, context: str, statements: List[cst.CSTNode]) -> Tuple[cst.FunctionDef, cst.SimpleStatementLine]:
+        """构造子函数定义及其调用语句"""
+        # 创建新的子函数，包含文档字符串
+        docstring = cst.SimpleStatementLine(
+            body=(
+                cst.Expr(
+                    value=cst.SimpleString(
+                        value=f'"""{" ".join(context.splitlines())}"""'
+                    )
+                ),
+            )
+        )
+        subfunc_body = [docstring]
+        subfunc_body.extend(statements)
+        
+        # 如果是在类内部，我们需要添加 self 参数，以便子函数可以访问实例属性，调用时也需要传递 self
+        if self._in_class > 0:
+            params = (cst.Param(name=cst.Name(value="self")),)
+            args = (cst.Arg(value=cst.Name(value="self")),)
+        else:
+            params = ()
+            args = ()
+        subfunc = cst.FunctionDef(
+            name=cst.Name(value=subfunc_name),
+            params=cst.Parameters(params=params),
+            body=cst.IndentedBlock(body=tuple(subfunc_body))
+        )
+        call = cst.SimpleStatementLine(
+            body=(
+                cst.Expr(
+                    value=cst.Call(
+                        func=cst.Name(value=subfunc_name),
+                        args=args,
+                    )
+                ),
+            )
+        )
+        return subfunc, call
+    
     def leave_FunctionDef(self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef) -> cst.CSTNode:
         self._in_function -= 1
-        self._function_levels.pop()
         
         print(f"离开函数: {original_node.name.value}")
         
@@ -228,9 +274,25 @@ class FunctionSplitter(cst.CSTTransformer):
         if self._in_function > 0:
             return updated_node
         
-        # 重构函数体
+        # 本函数的拆分状态
+        original_func_name = original_node.name.value
+        suffix_counter = 1
+        current_context: Optional[str] = None
+        current_subfunction: List[cst.CSTNode] = []
+        subfunctions: List[cst.FunctionDef] = []
         new_body: List[cst.CSTNode] = []
         
+        def flush() -> None:
+            nonlocal suffix_counter, current_subfunction
+            subfunc_name = self._unique_name(create_subfunction_name(original_func_name, current_context, suffix_counter))
+            suffix_counter += 1
+            print(f"创建子函数: {subfunc_name}")
+            self.created.append(subfunc_name)
+            subfunc, call = self._build_subfunction(subfunc_name, current_context, current_subfunction)
+            new_body.append(call)
+            subfunctions.append(subfunc)
+            current_subfunction = []
+        
         print(f"函数体语句数量: {len(original_node.body.body)}")
         
         for i, node in enumerate(original_node.body.body):
@@ -240,201 +302,91 @@ class FunctionSplitter(cst.CSTTransformer):
             context = extract_comment_context(node, self.source_lines, self.metadata)
             print(f"提取到的上下文: {repr(context)}")
             
-            if context and self._current_subfunction:
+            if context and current_subfunction:
                 # 如果有新的上下文描述且当前正在收集子函数，保存当前子函数
-                subfunc_name = create_subfunction_name(self._original_func_name, self._current_context, self._suffix_counter)
-                self._suffix_counter += 1
-                
-                # 确保子函数名称不重复
-                if subfunc_name in self._function_names:
-                    # 如果名称已存在，添加数字后缀
-                    counter = self._function_names[subfunc_name] + 1
-                    while f"{subfunc_name}_{counter}" in self._function_names:
-                        counter += 1
-                    subfunc_name = f"{subfunc_name}_{counter}"
-                    self._function_names[subfunc_name] = counter
-                else:
-                    self._function_names[subfunc_name] = 0
-                
-                print(f"创建子函数: {subfunc_name}")
-                
-                # 创建新的子函数，包含文档字符串
-                docstring = None
-                if self._current_context:
-                    docstring = cst.SimpleStatementLine(
-                        body=(
-                            cst.Expr(
-                                value=cst.SimpleString(
-                                    value=f'"""{" ".join(self._current_context.splitlines())}"""'
-                                )
-                            ),
-                        )
-                    )
-                
-                # 构造子函数体
-                subfunc_body = []
-                if docstring:
-                    subfunc_body.append(docstring)
-                subfunc_body.extend(self._current_subfunction)
-                
-                # 为子函数添加适当的参数：
-                # 如果是在类内部，我们需要添加 self 参数，以便子函数可以访问实例属性
-                if self._in_class > 0:
-                    subfunc = cst.FunctionDef(
-                        name=cst.Name(value=subfunc_name),
-                        params=cst.Parameters(params=(cst.Param(name=cst.Name(value="self")),)),
-                        body=cst.IndentedBlock(body=tuple(subfunc_body))
-                    )
-                    # 在调用子函数时也需要传递 self
-                    new_body.append(
-                        cst.SimpleStatementLine(
-                            body=(
-                                cst.Expr(
-                                    value=cst.Call(
-                                        func=cst.Name(value=subfunc_name),
-                                        args=(cst.Arg(value=cst.Name(value="self")),),
-                                    )
-                                ),
-                            )
-                        )
-                    )
-                else:
-                    subfunc = cst.FunctionDef(
-                        name=cst.Name(value=subfunc_name),
-                        params=cst.Parameters(params=()),
-                        body=cst.IndentedBlock(body=tuple(subfunc_body))
-                    )
-                    # 顶级函数的子函数调用不需要 self
-                    new_body.append(
-                        cst.SimpleStatementLine(
-                            body=(
-                                cst.Expr(
-                                    value=cst.Call(
-                                        func=cst.Name(value=subfunc_name),
-                                        args=(),
-                                    )
-                                ),
-                            )
-                        )
-                    )
-                
-                self._subfunctions.append(subfunc)
-                
-                self._current_subfunction = []
+                flush()
             
             if context:
                 # 开始新的子函数
                 print(f"开始新的子函数，上下文: {context}")
-                self._current_context = context
+                current_context = context
             
             # 添加到当前子函数或主函数体
-            if self._current_context:
-                self._current_subfunction.append(node)
-                print(f"添加到当前子函数 (共 {len(self._current_subfunction)} 个语句)")
+            if current_context:
+                current_subfunction.append(node)
+                print(f"添加到当前子函数 (共 {len(current_subfunction)} 个语句)")
             else:
                 new_body.append(node)
                 print("添加到主函数体")
         
         # 处理最后一个子函数
-        if self._current_subfunction and self._current_context:
-            subfunc_name = create_subfunction_name(self._original_func_name, self._current_context, self._suffix_counter)
-            self._suffix_counter += 1
-            
-            # 确保子函数名称不重复
-            if subfunc_name in self._function_names:
-                # 如果名称已存在，添加数字后缀
-                counter = self._function_names[subfunc_name] + 1
-                while f"{subfunc_name}_{counter}" in self._function_names:
-                    counter += 1
-                subfunc_name = f"{subfunc_name}_{counter}"
-                self._function_names[subfunc_name] = counter
-            else:
-                self._function_names[subfunc_name] = 0
-            
-            print(f"创建最后一个子函数: {subfunc_name}")
-            
-            # 创建新的子函数，包含文档字符串
-            docstring = None
-            if self._current_context:
-                docstring = cst.SimpleStatementLine(
-                    body=(
-                        cst.Expr(
-                            value=cst.SimpleString(
-                                value=f'"""{" ".join(self._current_context.splitlines())}"""'
-                            )
-                        ),
-                    )
-                )
-            
-            # 构造子函数体
-            subfunc_body = []
-            if docstring:
-                subfunc_body.append(docstring)
-            subfunc_body.extend(self._current_subfunction)
-            
-            # 根据是否在类内部来确定子函数的参数
-            if self._in_class > 0:
-                subfunc = cst.FunctionDef(
-                    name=cst.Name(value=subfunc_name),
-                    params=cst.Parameters(params=(cst.Param(name=cst.Name(value="self")),)),
-                    body=cst.IndentedBlock(body=tuple(subfunc_body))
-                )
-                new_body.append(
-                    cst.SimpleStatementLine(
-                        body=(
-                            cst.Expr(
-                                value=cst.Call(
-                                    func=cst.Name(value=subfunc_name),
-                                    args=(cst.Arg(value=cst.Name(value="self")),),
-                                )
-                            ),
-                        )
-                    )
-                )
-            else:
-                subfunc = cst.FunctionDef(
-                    name=cst.Name(value=subfunc_name),
-                    params=cst.Parameters(params=()),
-                    body=cst.IndentedBlock(body=tuple(subfunc_body))
-                )
-                new_body.append(
-                    cst.SimpleStatementLine(
-                        body=(
-                            cst.Expr(
-                                value=cst.Call(
-                                    func=cst.Name(value=subfunc_name),
-                                    args=(),
-                                )
-                            ),
-                        )
-                    )
-                )
-            
-            self._subfunctions.append(subfunc)
+        if current_subfunction and current_context:
+            flush()
         
         # 创建重构后的主函数
         new_func = updated_node.with_changes(
             body=cst.IndentedBlock(body=tuple(new_body))
         )
         
-        print(f"子函数数量: {len(self._subfunctions)}")
+        print(f"子函数数量: {len(subfunctions)}")
         
         # 组合主函数和子函数
-        if self._subfunctions:
+        if subfunctions:
             if self._in_class > 0:
-                # 如果是在类内部，我们不能直接返回 FlattenSentinel，而是需要将子函数添加到类的 body 中
-                # 这里我们需要特殊处理，但 LibCST 不允许在 FunctionDef 内部直接返回其他类型
-                # 我们将子函数保留到 self._subfunctions 中，在 leave_ClassDef 中统一处理
+                # LibCST 不允许在类体内的 FunctionDef 位置直接返回多个节点，子函数在 leave_ClassDef 中统一追加
+                self._class_subfunctions[-1].extend(subfunctions)
                 return new_func
             else:
                 # 如果是顶级函数，可以直接使用 FlattenSentinel
                 result = [new_func]
-                result.extend(self._subfunctions)
+                result.extend(subfunctions)
                 return cst.FlattenSentinel(result)
         
         return new_func
 
 
+def _split_source(source_code: str, process_methods: bool) -> Tuple[str, List[str]]:
+    """拆分大函数，返回 (新源码, 新建的子函数名)；解析失败时抛出异常"""
+    lines = source_code.splitlines()
+    
+    # 使用 metadata wrapper 来获取位置信息
+    wrapper = MetadataWrapper(cst.parse_module(source_code))
+    
+    # 收集所有已存在的函数名称（包括类内部的方法）
+    existing_function_names: List[str] = []
+    
+    # 收集顶级函数
+    for node in wrapper.module.body:
+        if isinstance(node, cst.FunctionDef):
+            existing_function_names.append(node.name.value)
+        elif isinstance(node, cst.ClassDef):
+            # 收集类内部的方法
+            for body_node in node.body.body:
+                if isinstance(body_node, cst.FunctionDef):
+                    existing_function_names.append(body_node.name.value)
+    
+    # 获取 PositionProvider 元数据
+    metadata = wrapper.resolve(PositionProvider)
+    
+    # 访问模块以建立完整的元数据
+    wrapper.module.visit(cst.CSTVisitor())
+    
+    # 使用我们的转换器进行重构，传递已存在的函数名称和方法处理标志
+    transformer = FunctionSplitter(lines, metadata, existing_function_names, process_methods)
+    new_module = wrapper.module.visit(transformer)
+    
+    return new_module.code, transformer.created
+
+
+def refactor_source(source_code: str, process_methods: bool = False) -> Tuple[str, List[str]]:
+    """内存接口：返回 (新源码, 新建的子函数名)，不读写文件，拆分过程的跟踪输出被丢弃
+
+    源码无法解析时抛出 libcst.ParserSyntaxError。
+    """
+    from .parallel import captured
+    return captured(_split_source, source_code, process_methods)[0]
+
+
 def rewrite_file_for_functions(source_code: str, process_methods: bool = False) -> str:
     """
     重写文件，将大函数切割为小函数
@@ -443,42 +395,33 @@ def rewrite_file_for_functions(source_code: str, process_methods: bool = False)
         source_code: 源代码字符串
         process_methods: 是否同时处理类内部的方法，默认为 False
     """
-    lines = source_code.splitlines()
-    
     try:
-        # 使用 metadata wrapper 来获取位置信息
-        wrapper = MetadataWrapper(cst.parse_module(source_code))
-        
-        # 收集所有已存在的函数名称（包括类内部的方法）
-        existing_function_names: List[str] = []
-        
-        # 收集顶级函数
-        for node in wrapper.module.body:
-            if isinstance(node, cst.FunctionDef):
-                existing_function_names.append(node.name.value)
-            elif isinstance(node, cst.ClassDef):
-                # 收集类内部的方法
-                for body_node in node.body.body:
-                    if isinstance(body_node, cst.FunctionDef):
-                        existing_function_names.append(body_node.name.value)
-        
-        # 获取 PositionProvider 元数据
-        metadata = wrapper.resolve(PositionProvider)
-        
-        # 访问模块以建立完整的元数据
-        wrapper.module.visit(cst.CSTVisitor())
-        
-        # 使用我们的转换器进行重构，传递已存在的函数名称和方法处理标志
-        transformer = FunctionSplitter(lines, metadata, existing_function_names, process_methods)
-        new_module = wrapper.module.visit(transformer)
-        
-        return new_module.code
+        return _split_source(source_code, process_methods)[0]
     except Exception as e:
         print(f"解析错误: {e}")
         return source_code
 
 
-def rewrite_directory_for_functions(path: str, dry_run: bool = False, output_diff: str = None, process_methods: bool = False) -> List[str]:
+def _split_file_task(context: Tuple[bool, bool], file_path: str) -> Tuple[bool, str]:
+    """worker 任务：拆分单个文件，返回 (是否变化, 截获的输出)"""
+    from .parallel import captured
+    dry_run, process_methods = context
+    
+    def run() -> bool:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        rewritten = rewrite_file_for_functions(source, process_methods)
+        if rewritten == source:
+            return False
+        if not dry_run:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(rewritten)
+        return True
+    
+    return captured(run)
+
+
+def rewrite_directory_for_functions(path: str, dry_run: bool = False, output_diff: str = None, process_methods: bool = False, jobs: Optional[int] = 1, cost_history: Optional[str] = None, backend: str = "auto", guard=None, summary=None, cache=None, only=None, dedup: bool = False) -> List[str]:
     """
     重写目录中的所有文件，将大函数切割为小函数
     
@@ -487,10 +430,21 @@ def rewrite_directory_for_functions(path: str, dry_run: bool = False, output_dif
         dry_run: 是否进行干运行（只检查不修改），默认为 False
         output_diff: 是否输出差异，默认为 None
         process_methods: 是否同时处理类内部的方法，默认为 False
+        jobs: 并行 worker 数，1 为串行，0 表示使用全部 CPU，"auto" 表示校准后自动选择
+        cost_history: 记录各文件耗时的 JSON 文件，用于下次运行的调度，默认为 None
+        backend: 执行后端 process/thread/auto，auto 仅在 free-threaded 解释器上使用线程
+        guard: parallel.Guard(timeout, max_rss)，超时或内存超限的文件被跳过并输出 "skipped: timeout/memory"
+        summary: tuning.RunSummary，jobs 为 "auto" 时记录所选的 worker 数、批大小和实测吞吐
+        cache: cache.ResultCache，内容与选项都未变的文件直接使用上次的结果
+        only: vcs.changed_files 给出的绝对路径集合，只处理其中的文件，默认为 None（全部处理）
+        dedup: 内容相同的文件只拆分一次，结果复用到其余文件（去重数记入 summary），默认为 False
     """
     import os
-    import difflib
+    import sys
     from .deps import list_python_files
+    from .parallel import run_files, Skipped
+    from .vcs import select_only
+    from .dedup import Dedup
     
     changes: List[str] = []
     
@@ -502,21 +456,47 @@ def rewrite_directory_for_functions(path: str, dry_run: bool = False, output_dif
     else:
         print(f"错误：路径 '{path}' 不存在")
         return changes
-    
-    for file_path in file_paths:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            source = f.read()
-        
-        rewritten = rewrite_file_for_functions(source, process_methods)
-        
-        if rewritten != source:
-            if not dry_run:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(rewritten)
-            
+    file_paths = select_only(file_paths, only)
+    
+    # 大文件优先派发，结果仍按文件顺序回放，保证输出与 worker 数无关
+    scope = cache.scope("split_func", [dry_run, process_methods], store_changed=dry_run) if cache is not None else None
+    dedup_scope = Dedup(write_back=not dry_run, digest=cache.digest if cache is not None else None) if dedup else None
+    results = run_files(_split_file_task, file_paths, file_paths, jobs=jobs, context=(dry_run, process_methods), cost_history=cost_history, backend=backend, guard=guard, summary=summary, cache=scope, dedup=dedup_scope)
+    for file_path, result in zip(file_paths, results):
+        if isinstance(result, Skipped):
+            result = (False, result.message(file_path))
+        changed, output = result
+        sys.stdout.write(output)
+        if changed:
             changes.append(file_path)
     
     if output_diff and changes:
         pass  # TODO: 实现 diff 生成
     
-    return changes
\ No newline at end of file
+    return changes
+
+
+async def rewrite_file_for_functions_async(source_code: str, process_methods: bool = False, executor=None) -> str:
+    """rewrite_file_for_functions 的 asyncio 版本，在 executor（默认为事件循环的线程池）中执行"""
+    from .aio import run_blocking
+    return await run_blocking(rewrite_file_for_functions, source_code, process_methods, executor=executor)
+
+
+async def rewrite_directory_for_functions_async(path: str, dry_run: bool = False, process_methods: bool = False, executor=None, limit: Optional[int] = None):
+    """rewrite_directory_for_functions 的 asyncio 版本：按文件顺序逐个产出 aio.FileResult
+
+    不写 stdout：每个文件截获的输出在 FileResult.output 中。executor 由调用方提供，limit 为同时在途的文件数。
+    """
+    import os
+    from .aio import FileResult, stream_ordered
+    from .deps import list_python_files
+    if os.path.isfile(path):
+        file_paths = [path]
+    elif os.path.isdir(path):
+        file_paths = list_python_files(path)
+    else:
+        return
+    index = 0
+    async for changed, output in stream_ordered(_split_file_task, file_paths, context=(dry_run, process_methods), executor=executor, limit=limit):
+        yield FileResult(file_paths[index], changed, "", output)
+        index += 1
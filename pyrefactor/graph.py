@@ -1,6 +1,9 @@
 import os
 import ast
-from typing import Dict, List, Set, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from .project import Project
 
 
 def _py_files(root: str) -> List[str]:
@@ -24,29 +27,23 @@ def _module_name_from_path(path: str, root: str) -> str:
     return ".".join(parts)
 
 
-def build_import_graph_mermaid(root: str) -> str:
-    files = _py_files(root)
-    nodes: Set[str] = set()
+def import_edges(tree: ast.Module, mod: str) -> Set[Tuple[str, str]]:
+    """单个模块在导入图中的出边（相对导入保留前导点号）"""
     edges: Set[Tuple[str, str]] = set()
-    for f in files:
-        try:
-            with open(f, "r", encoding="utf-8") as fh:
-                src = fh.read()
-            tree = ast.parse(src)
-        except Exception:
-            continue
-        mod = _module_name_from_path(f, root)
-        nodes.add(mod)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Import):
-                for alias in node.names:
-                    edges.add((mod, alias.name))
-            elif isinstance(node, ast.ImportFrom):
-                base = node.module or ""
-                if node.level and base:
-                    edges.add((mod, "." * node.level + base))
-                elif base:
-                    edges.add((mod, base))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                edges.add((mod, alias.name))
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level and base:
+                edges.add((mod, "." * node.level + base))
+            elif base:
+                edges.add((mod, base))
+    return edges
+
+
+def render_import_graph(nodes: Set[str], edges: Set[Tuple[str, str]]) -> str:
     lines = ["graph TD"]
     for n in sorted(nodes):
         lines.append(f'    "{n}"')
@@ -55,6 +52,27 @@ def build_import_graph_mermaid(root: str) -> str:
     return "\n".join(lines)
 
 
+def build_import_graph_mermaid(root: str, index: Optional[str] = None, first_party_only: bool = False, project: Optional["Project"] = None) -> str:
+    """root 的 Mermaid 导入图；给出 index（graph_index.GraphIndex 的文件）时只重新扫描变化的文件
+
+    first_party_only 为 True 时去掉指向标准库、第三方包和未知模块的边（见 resolve.ModuleResolver.classify）。
+    project 为 root 的 project.Project 时复用其中已解析的 ast 树。
+    """
+    from .project import Project
+    if project is None:
+        project = Project(root)
+    if index:
+        from .graph_index import GraphIndex
+        graph_index = GraphIndex(index, root)
+        graph_index.refresh(project=project)
+        nodes, edges = graph_index.import_graph()
+    else:
+        nodes, edges = project.import_graph()
+    if first_party_only:
+        edges = {(a, b) for a, b in edges if not project.resolver.is_external(b)}
+    return render_import_graph(nodes, edges)
+
+
 def build_call_graph_mermaid(root: str) -> str:
     files = _py_files(root)
     edges: Set[Tuple[str, str]] = set()
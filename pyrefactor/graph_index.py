@@ -0,0 +1,235 @@
+import os
+import ast
+import json
+import mmap
+import time
+import struct
+import hashlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .shared_graph import CSRGraph, encode_graph
+
+# 持久依赖图索引：模块 -> 导入 的依赖图与逐文件记录保存在同一个文件中，之后的运行只重新扫描内容变化的文件。
+# 布局：header | 依赖图（shared_graph 的 CSR 编码，mmap 后直接作为 CSRGraph 交给 worker） | 文件表（JSON）
+# 文件表按遍历顺序记录每个文件的 [stat 签名, 内容哈希, 依赖, 导入图出边, 符号索引（symbols.scan_symbols）]；
+# 依赖为 None 表示解析失败，不进入依赖图。
+# 签名未变的文件直接沿用记录；签名变了但内容哈希相同的文件只读取不解析。
+MAGIC = b"PRGI"
+VERSION = 2
+_HEADER = struct.Struct("<4sIQQ")
+# mtime 距今不足该秒数的文件不记录签名，下次运行重新计算哈希（同一时间粒度内的修改可能不改变 mtime）
+RACY_SECONDS = 2.0
+
+
+def default_index_path(root: str, package_paths: Optional[List[str]] = None, directory: Optional[str] = None) -> str:
+    """根目录与包根目录对应的索引文件，位于缓存目录（cache.default_cache_dir）的 graphs/ 下"""
+    from .cache import default_cache_dir
+    key = json.dumps([os.path.abspath(root), [os.path.abspath(p) for p in package_paths or []]])
+    name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(directory or default_cache_dir(), "graphs", f"{name}.idx")
+
+
+def _scan_task(project: Any, task: Tuple[str, str, Optional[str]]) -> Optional[Tuple[str, Optional[List[Any]]]]:
+    """worker 任务：返回 (内容哈希, [依赖, 导入图出边, 符号索引])；内容与索引中的哈希相同时第二项为 None，无法读取时返回 None
+
+    project（project.Project）不为 None 时文件内容和 ast 树取自其缓存，扫描后释放。
+    """
+    from .deps import _imports_in_module
+    from .graph import import_edges
+    from .symbols import scan_symbols
+    path, mod, known = task
+    if project is not None:
+        data = project.data(path)
+        if data is None:
+            project.release_scanned(path)
+            return None
+    else:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+    digest = hashlib.sha256(data).hexdigest()
+    if digest == known:
+        if project is not None:
+            project.release_scanned(path)
+        return digest, None
+    if project is not None:
+        tree = project.tree(path)
+        project.release_scanned(path)
+    else:
+        try:
+            tree = ast.parse(data.decode("utf-8"))
+        except Exception:
+            tree = None
+    if tree is None:
+        return digest, [None, [], None]
+    is_init = os.path.basename(path) == "__init__.py"
+    deps = _imports_in_module(tree, mod, is_init)
+    # 导入图出边只记录目标，源模块名由路径决定
+    return digest, [sorted(deps), sorted({target for _, target in import_edges(tree, "")}), scan_symbols(tree, mod, is_init)]
+
+
+def open_index_graph(path: str) -> CSRGraph:
+    """mmap 索引文件中的依赖图（worker 按 ("index", path) 句柄 attach 时使用）"""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, graph_len, _ = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        mm.close()
+        raise ValueError("不是有效的依赖图索引")
+    view = memoryview(mm)[_HEADER.size:_HEADER.size + graph_len]
+    return CSRGraph(view, handle=("index", os.path.abspath(path)), owner=mm)
+
+
+class GraphIndex:
+    """root 的持久依赖图索引，可供 refc_import 的成环判断、`graph imports` 和 `symbols` 查询共用
+
+    用法：
+        index = GraphIndex(path, root)
+        graph = index.refresh(jobs=4)   # CSRGraph，与 build_dependency_graph(root) 内容相同
+    """
+
+    def __init__(self, path: str, root: str, package_paths: Optional[List[str]] = None):
+        self.path = path
+        self.root = os.path.abspath(root)
+        self.roots = [os.path.abspath(p) for p in package_paths] if package_paths else [self.root]
+        self.files: Dict[str, List[Any]] = {}
+        self.graph: Optional[CSRGraph] = None
+        self.resolver: Any = None
+        # 最近一次 refresh 中重新解析的文件数，以及是否重写了索引
+        self.parsed = 0
+        self.written = False
+
+    def _load(self) -> Tuple[Optional[CSRGraph], Dict[str, List[Any]]]:
+        try:
+            graph = open_index_graph(self.path)
+        except (OSError, ValueError, struct.error):
+            return None, {}
+        try:
+            mm = graph._owner
+            _, _, graph_len, table_len = _HEADER.unpack_from(mm, 0)
+            start = _HEADER.size + graph_len
+            table = json.loads(mm[start:start + table_len].decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            return None, {}
+        if table.get("roots") != [self.root] + self.roots:
+            return None, {}
+        return graph, table.get("files", {})
+
+    def _write(self, graph: Dict[str, Set[str]]) -> None:
+        data = encode_graph(graph)
+        table = json.dumps({"roots": [self.root] + self.roots, "files": self.files}, separators=(",", ":")).encode("utf-8")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(data), len(table)))
+            f.write(data)
+            f.write(table)
+        os.replace(tmp, self.path)
+
+    def refresh(self, jobs: Optional[int] = 1, pool: Any = None, guard: Any = None, resolver: Any = None, project: Any = None) -> CSRGraph:
+        """stat 整棵树，只重新扫描变化的文件；有变化时重写索引。返回 mmap 的依赖图
+
+        resolver 为同一 root / package_paths 的 resolve.ModuleResolver 时复用其文件列表和模块名；
+        给出 project（project.Project）时还从其缓存读取文件内容和 ast 树。
+        """
+        from .parallel import Skipped, run_files
+        from .resolve import ModuleResolver
+        if project is not None:
+            resolver = project.resolver
+        self.resolver = resolver if resolver is not None else ModuleResolver(self.root, self.roots)
+        old_graph, old = self._load()
+        files: Dict[str, List[Any]] = {}
+        pending: List[Tuple[str, str, Optional[str]]] = []
+        signatures: Dict[str, Optional[List[int]]] = {}
+        now = time.time()
+        for path, mod in self.resolver.paths.items():
+            rel = os.path.relpath(path, self.root)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signature = [st.st_mtime_ns, st.st_size]
+            record = old.get(rel)
+            if record is not None and record[0] == signature:
+                files[rel] = record
+                continue
+            files[rel] = None
+            signatures[rel] = signature if now - st.st_mtime_ns / 1e9 >= RACY_SECONDS else None
+            pending.append((path, mod, record[1] if record else None))
+        self.parsed = 0
+        results = run_files(_scan_task, pending, [t[0] for t in pending], jobs=jobs, context=project, pool=pool, guard=guard)
+        for (path, _, _), result in zip(pending, results):
+            rel = os.path.relpath(path, self.root)
+            # 无法读取或被保护阈值跳过的文件不记录，下次重新扫描
+            if result is None or isinstance(result, Skipped):
+                del files[rel]
+                continue
+            digest, scanned = result
+            if scanned is None:
+                scanned = old[rel][2:]
+            else:
+                self.parsed += 1
+            files[rel] = [signatures[rel], digest] + scanned
+        files = {rel: record for rel, record in files.items() if record is not None}
+        self.files = files
+        self.written = old_graph is None or list(files.items()) != list(old.items())
+        if not self.written:
+            self.graph = old_graph
+            return old_graph
+        if old_graph is not None:
+            old_graph.release()
+        self._write(self.dependency_graph())
+        self.graph = open_index_graph(self.path)
+        return self.graph
+
+    def dependency_graph(self) -> Dict[str, Set[str]]:
+        """按遍历顺序由文件表重建依赖图（同名模块以后出现的文件为准，与 build_dependency_graph 一致）"""
+        from .resolve import ModuleResolver
+        if self.resolver is None:
+            self.resolver = ModuleResolver(self.root, self.roots)
+        graph: Dict[str, Set[str]] = {}
+        for rel, record in self.files.items():
+            if record[2] is not None:
+                graph[self.resolver.module_name(os.path.join(self.root, rel))] = set(record[2])
+        return graph
+
+    def import_graph(self) -> Tuple[Set[str], Set[Tuple[str, str]]]:
+        """`graph imports` 的节点与边（模块名相对 root，与 build_import_graph_mermaid 相同）"""
+        from .deps import module_name_from_path
+        nodes: Set[str] = set()
+        edges: Set[Tuple[str, str]] = set()
+        for rel, record in self.files.items():
+            if record[2] is None:
+                continue
+            mod = module_name_from_path(os.path.join(self.root, rel), self.root)
+            nodes.add(mod)
+            edges.update((mod, target) for target in record[3])
+        return nodes, edges
+
+    def unused_imports(self) -> List[Tuple[str, int, str, str]]:
+        """没有被使用的导入 (相对路径, 行号, 名字, 导入目标)；__init__.py 中的导入视为重新导出，不报告"""
+        from .symbols import unused_bindings
+        out: List[Tuple[str, int, str, str]] = []
+        for rel, record in self.files.items():
+            if record[4] is None or os.path.basename(rel) == "__init__.py":
+                continue
+            out.extend((rel, line, name, target) for name, target, line, _ in unused_bindings(record[4]))
+        return out
+
+    def users(self, name: str) -> List[Tuple[str, int, str, str]]:
+        """导入或使用 name（及其属性、子模块）的位置 (相对路径, 行号, 作用域, 完整名)，按文件与行号排序"""
+        from .symbols import matches
+        out = set()
+        for rel, record in self.files.items():
+            symbols = record[4]
+            if symbols is None:
+                continue
+            for _, target, line, scope in symbols["bindings"]:
+                if matches(target, name):
+                    out.add((rel, line, scope, target))
+            for _, qualified, line, scope in symbols["uses"]:
+                if matches(qualified, name):
+                    out.add((rel, line, scope, qualified))
+        return sorted(out)
@@ -0,0 +1,168 @@
+import os
+import time
+import signal
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+# 受保护运行：每个 worker 是独立子进程，父进程监视每个文件的处理时长和 worker 的 RSS，
+# 超限时直接杀掉该 worker、把文件记为跳过并补一个新 worker，其余文件继续处理。
+# 线程无法被强制中断，因此受保护运行总是使用子进程（即使只有 1 个 worker）。
+
+_POLL_INTERVAL = 0.05
+
+
+class Guard(NamedTuple):
+    """单文件保护阈值：timeout 为墙钟秒数，max_rss 为 worker 常驻内存字节数；None 表示不限制"""
+    timeout: Optional[float] = None
+    max_rss: Optional[int] = None
+
+    def __bool__(self) -> bool:
+        return self.timeout is not None or self.max_rss is not None
+
+
+class Skipped(NamedTuple):
+    """因超时或内存超限被跳过的任务结果，reason 为 timeout / memory / crash"""
+    reason: str
+
+    def message(self, path: str) -> str:
+        return f"{path} - skipped: {self.reason}\n"
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """读取进程的常驻内存；没有 /proc 的平台返回 None（此时只能依靠 worker 内的 MemoryError）"""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _worker_main(conn, func: Callable[[Any, Any], Any], context: Any) -> None:
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        index, item = msg
+        start = time.perf_counter()
+        try:
+            result = func(context, item)
+        except MemoryError:
+            result = Skipped("memory")
+        except Exception as e:
+            conn.send((index, 0.0, False, e))
+            continue
+        conn.send((index, time.perf_counter() - start, True, result))
+
+
+class _Slot:
+    def __init__(self, ctx, func: Callable[[Any, Any], Any], context: Any):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, func, context), daemon=True)
+        self.proc.start()
+        child.close()
+        self.index: Optional[int] = None
+        self.started = 0.0
+
+    def assign(self, index: int, item: Any) -> None:
+        self.conn.send((index, item))
+        self.index = index
+        self.started = time.monotonic()
+
+    def kill(self) -> None:
+        self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.proc.join(1.0)
+        if self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join()
+        self.conn.close()
+
+
+def run_guarded(func: Callable[[Any, Any], Any], tasks: Sequence[Any], workers: int, guard: Guard, context: Any = None, order: Optional[Sequence[int]] = None, timings: Optional[Dict[int, float]] = None) -> Iterator[Any]:
+    """在受保护的子进程中以 func(context, item) 处理 tasks，按输入顺序产出结果
+
+    超时或 RSS 超限的任务产出 Skipped(reason)，worker 异常退出（例如被 OOM killer 杀掉）产出
+    Skipped("memory") 或 Skipped("crash")。order 为派发顺序（例如 LPT），默认按输入顺序。
+    """
+    ctx = multiprocessing.get_context()
+    pending = deque(range(len(tasks)) if order is None else order)
+    done: Dict[int, Any] = {}
+    elapsed_by_index: Dict[int, float] = {}
+    slots: List[Optional[_Slot]] = []
+
+    def dispatch(slot: _Slot) -> None:
+        slot.index = None
+        if pending:
+            index = pending.popleft()
+            slot.assign(index, tasks[index])
+
+    def retire(k: int, reason: Optional[str]) -> None:
+        slot = slots[k]
+        if reason is not None and slot.index is not None:
+            done[slot.index] = Skipped(reason)
+            elapsed_by_index[slot.index] = time.monotonic() - slot.started
+        slot.kill()
+        if pending:
+            slots[k] = _Slot(ctx, func, context)
+            dispatch(slots[k])
+        else:
+            # 没有待派发的文件时不再补充 worker
+            slots[k] = None
+
+    try:
+        for _ in range(max(1, min(workers, len(tasks)))):
+            slots.append(_Slot(ctx, func, context))
+            dispatch(slots[-1])
+        next_index = 0
+        while next_index < len(tasks):
+            ready = wait([s.conn for s in slots if s is not None and s.index is not None], timeout=_POLL_INTERVAL)
+            now = time.monotonic()
+            for k, slot in enumerate(slots):
+                if slot is None or slot.index is None:
+                    continue
+                if slot.conn in ready:
+                    try:
+                        index, elapsed, ok, value = slot.conn.recv()
+                    except (EOFError, OSError):
+                        slot.proc.join()
+                        retire(k, "memory" if slot.proc.exitcode == -signal.SIGKILL else "crash")
+                        continue
+                    if not ok:
+                        raise value
+                    done[index] = value
+                    elapsed_by_index[index] = elapsed
+                    rss = rss_bytes(slot.proc.pid) if guard.max_rss else None
+                    if rss is not None and rss > guard.max_rss:
+                        # 上一个文件结束后内存没有降回水位以下，换一个干净的 worker，避免误伤下一个文件
+                        slot.index = None
+                        retire(k, None)
+                    else:
+                        dispatch(slot)
+                elif guard.timeout is not None and now - slot.started > guard.timeout:
+                    retire(k, "timeout")
+                elif guard.max_rss is not None and (rss_bytes(slot.proc.pid) or 0) > guard.max_rss:
+                    retire(k, "memory")
+                elif not slot.proc.is_alive():
+                    retire(k, "memory" if slot.proc.exitcode == -signal.SIGKILL else "crash")
+            while next_index in done:
+                elapsed = elapsed_by_index.pop(next_index)
+                if timings is not None:
+                    timings[next_index] = elapsed
+                yield done.pop(next_index)
+                next_index += 1
+    finally:
+        for slot in slots:
+            if slot is not None:
+                slot.stop()
@@ -1,12 +1,29 @@
 import os
+import sys
 import difflib
-from typing import List, Tuple, Set, Dict, Optional
+import hashlib
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, Callable, List, NamedTuple, Tuple, Set, Dict, Optional
 
 import libcst as cst
-from .deps import would_create_cycle, build_dependency_graph, module_name_from_path_multi, resolve_relative_pkg
+from .deps import ReachabilityIndex, reaching_modules, reverse_graph, would_create_cycle, build_dependency_graph, resolve_relative_pkg
+from .parallel import WorkerPool, Guard, Skipped, run_files
+from .shared_graph import SharedGraph, CSRGraph, open_graph_file, write_graph_file
+from .shard import Shard, select_shard, make_entry, write_partial
+from .tuning import RunSummary
+from .cache import ResultCache
+from .vcs import select_only
+from .dedup import Dedup
+from .graph_index import GraphIndex, default_index_path
+from .resolve import ModuleResolver
+from .project import Project
+from .aio import FileResult, run_blocking, stream_ordered
 
 
 class ImportLifter(cst.CSTTransformer):
+    # leave_Module 把收集到的导入插入模块顶部，需要整个模块，不能分段处理
+    MODULE_CONTEXT = True
+
     def __init__(self, module_name: str, is_init: bool, dep_graph: Dict[str, Set[str]], include_relative: bool = False, allow_control_blocks: bool = False, failfirst: bool = False):
         self.include_relative = include_relative
         self.allow_control_blocks = allow_control_blocks
@@ -181,18 +198,60 @@ class ImportLifter(cst.CSTTransformer):
         return updated_node.with_changes(body=tuple(new_body))
 
 
-def rewrite_file(path: str, module_name: str, dep_graph: Dict[str, Set[str]], include_relative: bool = False, allow_control_blocks: bool = False, dry_run: bool = False, failfirst: bool = False) -> Tuple[bool, str]:
-    with open(path, "r", encoding="utf-8") as f:
-        src = f.read()
+def transform_module(module: cst.Module, module_name: str, is_init: bool, dep_graph: Dict[str, Set[str]], include_relative: bool = False, allow_control_blocks: bool = False, failfirst: bool = False) -> str:
+    """对已解析的模块应用 ImportLifter；转换不修改原树，同一个 module 可以反复使用（例如 daemon 缓存的解析结果）"""
+    transformer = ImportLifter(module_name=module_name, is_init=is_init, dep_graph=dep_graph, include_relative=include_relative, allow_control_blocks=allow_control_blocks, failfirst=failfirst)
+    return module.visit(transformer).code
+
+
+def transform_source(src: str, module_name: str, is_init: bool, dep_graph: Dict[str, Set[str]], include_relative: bool = False, allow_control_blocks: bool = False, failfirst: bool = False) -> Optional[str]:
     try:
         module = cst.parse_module(src)
     except Exception:
-        return False, ""
-    is_init = os.path.basename(path) == "__init__.py"
+        return None
+    return transform_module(module, module_name, is_init, dep_graph, include_relative, allow_control_blocks, failfirst)
+
+
+def refactor_source(src: str, module_name: str, is_init: bool, dep_graph: Dict[str, Set[str]], include_relative: bool = False, allow_control_blocks: bool = False, failfirst: bool = False) -> Tuple[str, List[str]]:
+    """内存接口：返回 (新源码, 被提升的导入语句)，不读写文件；没有变化时新源码即原源码
+
+    源码无法解析时抛出 libcst.ParserSyntaxError。
+    """
+    module = cst.parse_module(src)
     transformer = ImportLifter(module_name=module_name, is_init=is_init, dep_graph=dep_graph, include_relative=include_relative, allow_control_blocks=allow_control_blocks, failfirst=failfirst)
-    new_module = module.visit(transformer)
-    new_src = new_module.code
+    new_src = module.visit(transformer).code
     if new_src == src:
+        return src, []
+    lifted = [cst.Module([cst.SimpleStatementLine(body=[node])]).code.strip() for node in transformer._collected]
+    return new_src, list(dict.fromkeys(lifted))
+
+
+def rewrite_file(path: str, module_name: str, dep_graph: Dict[str, Set[str]], include_relative: bool = False, allow_control_blocks: bool = False, dry_run: bool = False, failfirst: bool = False, project: Optional[Project] = None) -> Tuple[bool, str]:
+    """给出 project 时源码和 libcst 模块取自其缓存，处理完后释放该文件的缓存条目"""
+    if project is not None:
+        try:
+            return _rewrite_project_file(project, path, module_name, dep_graph, include_relative, allow_control_blocks, dry_run, failfirst)
+        finally:
+            project.release(path)
+    with open(path, "r", encoding="utf-8") as f:
+        src = f.read()
+    is_init = os.path.basename(path) == "__init__.py"
+    new_src = transform_source(src, module_name, is_init, dep_graph, include_relative, allow_control_blocks, failfirst)
+    return _finish_rewrite(path, src, new_src, dry_run)
+
+
+def _rewrite_project_file(project: Project, path: str, module_name: str, dep_graph: Dict[str, Set[str]], include_relative: bool, allow_control_blocks: bool, dry_run: bool, failfirst: bool) -> Tuple[bool, str]:
+    src = project.source(path)
+    if src is None:
+        raise OSError(f"无法读取 {path}")
+    module = project.cst_module(path)
+    is_init = os.path.basename(path) == "__init__.py"
+    new_src = transform_module(module, module_name, is_init, dep_graph, include_relative, allow_control_blocks, failfirst) if module is not None else None
+    return _finish_rewrite(path, src, new_src, dry_run)
+
+
+def _finish_rewrite(path: str, src: str, new_src: Optional[str], dry_run: bool) -> Tuple[bool, str]:
+    if new_src is None or new_src == src:
         return False, ""
     if dry_run:
         diff = difflib.unified_diff(src.splitlines(True), new_src.splitlines(True), fromfile=path, tofile=path)
@@ -202,33 +261,234 @@ def rewrite_file(path: str, module_name: str, dep_graph: Dict[str, Set[str]], in
     return True, ""
 
 
-def rewrite_directory(root: str, include_relative: bool = False, allow_control_blocks: bool = False, dry_run: bool = False, output_diff: Optional[str] = None, modify_under: Optional[str] = None, failfirst: bool = False, package_paths: Optional[List[str]] = None) -> List[str]:
-    changes: List[str] = []
-    graph = build_dependency_graph(root, package_paths=package_paths)
-    diff_chunks: List[str] = []
-    base_root = os.path.abspath(root)
+def _rewrite_task(context: Tuple[Dict[str, Set[str]], bool, bool, bool, bool, Optional[Project]], task: Tuple[str, str]) -> Tuple[bool, str]:
+    graph, include_relative, allow_control_blocks, dry_run, failfirst, project = context
+    path, mod = task
+    return rewrite_file(path, mod, graph, include_relative, allow_control_blocks, dry_run, failfirst, project)
+
+
+def collect_tasks(root: str, modify_under: Optional[str] = None, package_paths: Optional[List[str]] = None, resolver: Optional[ModuleResolver] = None) -> List[Tuple[str, str]]:
+    """按遍历顺序列出需要处理的 (文件路径, 模块名)；给出 resolver 时复用其文件列表，不再遍历 root"""
     target_prefix = None
     if modify_under:
         target_prefix = os.path.abspath(modify_under)
-    for dirpath, dirnames, filenames in os.walk(root):
-        dirnames[:] = [d for d in dirnames if d != "__pycache__" and not d.startswith(".")]
-        for fn in filenames:
-            if not fn.endswith(".py"):
-                continue
-            path = os.path.join(dirpath, fn)
-            roots = package_paths or [root]
-            mod = module_name_from_path_multi(path, roots)
-            if target_prefix and not os.path.abspath(path).startswith(target_prefix):
+    if resolver is None:
+        resolver = ModuleResolver(root, package_paths)
+    tasks: List[Tuple[str, str]] = []
+    for path, mod in resolver.paths.items():
+        if target_prefix and not os.path.abspath(path).startswith(target_prefix):
+            continue
+        tasks.append((path, mod))
+    return tasks
+
+
+def load_or_build_graph(root: str, graph_file: Optional[str] = None, package_paths: Optional[List[str]] = None, jobs: Optional[int] = 1, pool: Optional[WorkerPool] = None, guard: Optional[Guard] = None, index: Optional[str] = None, resolver: Optional[ModuleResolver] = None, project: Optional[Project] = None) -> Dict[str, Set[str]]:
+    """graph_file 存在时直接 mmap 加载（各分片/节点共享同一份图），否则构建完整依赖图并写入 graph_file
+
+    给出 index（graph_index.GraphIndex 的文件）时依赖图取自持久索引，只重新扫描变化的文件。
+    """
+    if graph_file and os.path.exists(graph_file):
+        return open_graph_file(graph_file)
+    if index:
+        graph = GraphIndex(index, root, package_paths).refresh(jobs=jobs, pool=pool, guard=guard, resolver=resolver, project=project)
+    else:
+        graph = build_dependency_graph(root, package_paths=package_paths, jobs=jobs, pool=pool, guard=guard, resolver=resolver, project=project)
+    if graph_file:
+        write_graph_file(graph, graph_file)
+    return graph
+
+
+def _cache_task_key(task: Tuple[str, str]) -> List[object]:
+    path, mod = task
+    return [mod, os.path.basename(path) == "__init__.py"]
+
+
+def _cycle_task_key(graph: Dict[str, Set[str]]) -> Callable[[Tuple[str, str]], List[object]]:
+    """refc_import 的缓存键中与依赖图有关的部分
+
+    转换对依赖图只问"导入目标能否到达本模块"，答案完全由能到达本模块的模块集合决定，
+    因此每个文件只以该集合的摘要作为键：其他文件增删导入但不改变这个集合时缓存仍然命中。
+    """
+    reverse = reverse_graph(graph)
+
+    def task_key(task: Tuple[str, str]) -> List[object]:
+        reaching = "\n".join(sorted(reaching_modules(reverse, task[1])))
+        return _cache_task_key(task) + [hashlib.sha256(reaching.encode("utf-8")).hexdigest()]
+
+    return task_key
+
+
+def _rewrite_root(root: str, include_relative: bool, allow_control_blocks: bool, dry_run: bool, modify_under: Optional[str], failfirst: bool, package_paths: Optional[List[str]], jobs: Optional[int], cost_history: Optional[str], backend: str, shard: Optional[Shard], graph_file: Optional[str], pool: Optional[WorkerPool], guard: Optional[Guard] = None, summary: Optional[RunSummary] = None, cache: Optional[ResultCache] = None, only: Optional[Set[str]] = None, dedup: bool = False, project: Optional[Project] = None) -> Tuple[List[str], List[str], List[Dict[str, object]], int]:
+    """处理单个根目录，返回 (变更文件, diff 片段, 分片条目, 文件总数)，不写出 diff
+
+    project 为同一 root / package_paths 的 Project（例如 --absimport 已经用过的）时复用其中的解析结果；
+    返回前释放其中剩余的条目（缓存命中、去重或未被选中而没有转换的文件）。
+    """
+    changes: List[str] = []
+    # 分片运行时也使用完整依赖图，保证各分片的成环判断一致；使用结果缓存时依赖图索引也保存在缓存目录中
+    index = default_index_path(root, package_paths, cache.directory) if cache is not None else None
+    # 文件索引和每个文件的解析结果只产生一次，依赖图构建、任务列表和转换共用
+    if project is None:
+        project = Project(root, package_paths)
+    resolver = project.resolver
+    graph = load_or_build_graph(root, graph_file=graph_file, package_paths=package_paths, jobs=jobs, pool=pool, guard=guard, index=index, resolver=resolver, project=project)
+    diff_chunks: List[str] = []
+    tasks = collect_tasks(root, modify_under=modify_under, package_paths=package_paths, resolver=resolver)
+    if only is not None:
+        # 只转换 git 给出的改动文件，依赖图仍是完整的
+        kept = set(select_only([t[0] for t in tasks], only))
+        tasks = [t for t in tasks if t[0] in kept]
+    total = len(tasks)
+    indices = select_shard([t[0] for t in tasks], root, shard)
+    tasks = [tasks[k] for k in indices]
+    entries: List[Dict[str, object]] = []
+    shared: List[SharedGraph] = []
+    scope = None
+    if cache is not None:
+        # 结果还取决于文件的模块名和依赖图中能到达该模块的部分（成环判断）
+        options = [include_relative, allow_control_blocks, dry_run, failfirst]
+        scope = cache.scope("refc_import", options, store_changed=dry_run, task_key=_cycle_task_key(graph))
+    # 内容相同且模块名、是否 __init__.py 都相同的文件只转换一次
+    dedup_scope = Dedup(_cache_task_key, write_back=not dry_run, digest=cache.digest if cache is not None else None, project=project) if dedup else None
+
+    def prepare(workers: int, backend_name: str) -> Tuple[object, ...]:
+        # 在 worker 数确定之后（--jobs auto 校准完、缓存和去重过滤之后）才选择依赖图的表示
+        dep_graph = graph
+        if workers > 1 and backend_name == "process" or guard:
+            # 多进程时依赖图放入共享内存，worker 直接 attach 而不是各自反序列化一份，成环判断在 CSR 上做深度优先搜索
+            if not isinstance(dep_graph, CSRGraph):
+                shared.append(SharedGraph(dep_graph))
+                dep_graph = shared[-1].graph
+        else:
+            # 线程或串行执行时所有文件共用一个在本进程构建一次的可达性索引
+            dep_graph = ReachabilityIndex(dep_graph)
+        return (dep_graph, include_relative, allow_control_blocks, dry_run, failfirst, project)
+
+    try:
+        results = run_files(_rewrite_task, tasks, [t[0] for t in tasks], jobs=jobs, cost_history=cost_history, backend=backend, pool=pool, guard=guard, summary=summary, cache=scope, dedup=dedup_scope, prepare=prepare)
+        for index, (path, _), result in zip(indices, tasks, results):
+            if isinstance(result, Skipped):
+                sys.stdout.write(result.message(path))
+                entries.append(make_entry(index, path, False, output=result.message(path)))
                 continue
-            changed, diff = rewrite_file(path, mod, graph, include_relative, allow_control_blocks, dry_run, failfirst)
+            changed, diff = result
             if changed:
+                entries.append(make_entry(index, path, True, diff))
                 if dry_run and diff:
                     diff_chunks.append(diff)
                 else:
                     changes.append(path)
+    finally:
+        for handle in shared:
+            handle.close()
+        project.clear()
+    return changes, diff_chunks, entries, total
+
+
+def _write_diff(output_diff: Optional[str], diff_chunks: List[str], changes: List[str]) -> None:
     if output_diff and diff_chunks:
         with open(output_diff, "w", encoding="utf-8") as f:
             for d in diff_chunks:
                 f.write(d)
         changes.append(output_diff)
+
+
+def rewrite_directory(root: str, include_relative: bool = False, allow_control_blocks: bool = False, dry_run: bool = False, output_diff: Optional[str] = None, modify_under: Optional[str] = None, failfirst: bool = False, package_paths: Optional[List[str]] = None, jobs: Optional[int] = 1, cost_history: Optional[str] = None, backend: str = "auto", shard: Optional[Shard] = None, shard_output: Optional[str] = None, graph_file: Optional[str] = None, pool: Optional[WorkerPool] = None, guard: Optional[Guard] = None, summary: Optional[RunSummary] = None, cache: Optional[ResultCache] = None, only: Optional[Set[str]] = None, dedup: bool = False, project: Optional[Project] = None) -> List[str]:
+    changes, diff_chunks, entries, total = _rewrite_root(root, include_relative, allow_control_blocks, dry_run, modify_under, failfirst, package_paths, jobs, cost_history, backend, shard, graph_file, pool, guard, summary, cache, only, dedup, project)
+    if shard is not None and shard_output:
+        # 分片结果由 merge 统一写出 diff
+        write_partial(shard_output, "refc_import", shard, total, dry_run, entries)
+        return changes
+    _write_diff(output_diff, diff_chunks, changes)
     return changes
+
+
+class RootSpec(NamedTuple):
+    """批量运行中的一个根目录及其独立选项"""
+    path: str
+    package_paths: Optional[List[str]] = None
+    modify_under: Optional[str] = None
+    output_diff: Optional[str] = None
+
+
+def parse_manifest(manifest: str) -> List[RootSpec]:
+    """解析根目录清单：每行 `path [--package-path P]... [--modify-under D] [--output-diff F]`，# 开头为注释
+
+    相对路径按清单文件所在目录解析。
+    """
+    import shlex
+    import argparse
+    parser = argparse.ArgumentParser(prog="manifest", add_help=False)
+    parser.add_argument("path")
+    parser.add_argument("--package-path", action="append", dest="package_path")
+    parser.add_argument("--modify-under")
+    parser.add_argument("--output-diff")
+    base = os.path.dirname(os.path.abspath(manifest))
+
+    def resolve(p: Optional[str]) -> Optional[str]:
+        return None if p is None else os.path.join(base, p)
+
+    specs: List[RootSpec] = []
+    with open(manifest, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            args, unknown = parser.parse_known_args(words)
+            if unknown:
+                raise ValueError(f"{manifest}:{lineno}: 无法识别的参数 {' '.join(unknown)}")
+            package_paths = [resolve(p) for p in args.package_path] if args.package_path else None
+            specs.append(RootSpec(resolve(args.path), package_paths, resolve(args.modify_under), resolve(args.output_diff)))
+    return specs
+
+
+def rewrite_roots(roots: List[RootSpec], include_relative: bool = False, allow_control_blocks: bool = False, dry_run: bool = False, output_diff: Optional[str] = None, failfirst: bool = False, jobs: Optional[int] = 1, cost_history: Optional[str] = None, backend: str = "auto", guard: Optional[Guard] = None, summary: Optional[RunSummary] = None, cache: Optional[ResultCache] = None, only: Optional[Set[str]] = None, dedup: bool = False, projects: Optional[List[Project]] = None) -> List[str]:
+    """在一次调用中依次处理多个根目录，所有根目录共用同一个常驻 worker 池
+
+    每个根目录独立构建依赖图、独立产出结果；根目录自带 output_diff 时 diff 写入该文件，
+    否则按根目录顺序汇总写入 output_diff。返回各根目录变更列表的拼接。projects 与 roots 一一对应。
+    """
+    changes: List[str] = []
+    diff_chunks: List[str] = []
+    with WorkerPool(jobs, backend=backend) as pool:
+        for k, spec in enumerate(roots):
+            project = projects[k] if projects else None
+            root_changes, root_diff, _, _ = _rewrite_root(spec.path, include_relative, allow_control_blocks, dry_run, spec.modify_under, failfirst, spec.package_paths, jobs, cost_history, backend, None, None, pool, guard, summary, cache, only, dedup, project)
+            if spec.output_diff:
+                _write_diff(spec.output_diff, root_diff, root_changes)
+            else:
+                diff_chunks.extend(root_diff)
+            changes.extend(root_changes)
+    _write_diff(output_diff, diff_chunks, changes)
+    return changes
+
+
+async def rewrite_file_async(path: str, module_name: str, dep_graph: Dict[str, Set[str]], include_relative: bool = False, allow_control_blocks: bool = False, dry_run: bool = False, failfirst: bool = False, executor: Optional[Executor] = None) -> Tuple[bool, str]:
+    """rewrite_file 的 asyncio 版本，在 executor（默认为事件循环的线程池）中执行"""
+    return await run_blocking(rewrite_file, path, module_name, dep_graph, include_relative, allow_control_blocks, dry_run, failfirst, executor=executor)
+
+
+async def rewrite_directory_async(root: str, include_relative: bool = False, allow_control_blocks: bool = False, dry_run: bool = False, modify_under: Optional[str] = None, failfirst: bool = False, package_paths: Optional[List[str]] = None, graph_file: Optional[str] = None, executor: Optional[Executor] = None, limit: Optional[int] = None) -> AsyncIterator[FileResult]:
+    """rewrite_directory 的 asyncio 版本：依赖图在 executor 中构建，之后按文件顺序逐个产出 aio.FileResult
+
+    dry_run 时 FileResult.diff 为该文件的 diff；不写 diff 文件。
+    executor 为进程池时依赖图放入共享内存，每个任务只序列化句柄。limit 为同时在途的文件数。
+    """
+    graph = await run_blocking(load_or_build_graph, root, graph_file=graph_file, package_paths=package_paths, executor=executor)
+    tasks = await run_blocking(collect_tasks, root, modify_under=modify_under, package_paths=package_paths, executor=executor)
+    shared = None
+    if isinstance(executor, ProcessPoolExecutor):
+        if not isinstance(graph, CSRGraph):
+            shared = SharedGraph(graph)
+            graph = shared.graph
+    else:
+        graph = ReachabilityIndex(graph)
+    try:
+        context = (graph, include_relative, allow_control_blocks, dry_run, failfirst, None)
+        index = 0
+        async for changed, diff in stream_ordered(_rewrite_task, tasks, context=context, executor=executor, limit=limit):
+            yield FileResult(tasks[index][0], changed, diff)
+            index += 1
+    finally:
+        if shared is not None:
+            shared.close()
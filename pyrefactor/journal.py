@@ -0,0 +1,93 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, Optional
+
+# 断点续跑日志：JSON Lines，首行为运行头（命令与影响结果的选项），其后每处理完一个文件追加一行
+# {path, hash, changed, output, diff_end}。hash 是处理后磁盘上文件内容的 sha256（未修改或 dry_run 时即原内容），
+# 续跑时内容仍一致的文件直接回放记录的输出而不再处理；diff_end 是写完该文件 diff 后 diff 文件的长度，
+# 续跑时先把 diff 文件截断到最后一条记录的位置，丢弃中断时写了一半、未记入日志的 diff。
+FORMAT = "pyrefactor-journal"
+VERSION = 1
+
+
+def file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class Journal:
+    """追加写入的进度日志
+
+    resume 为 False 或日志不存在时重新开始（覆盖旧日志）；resume 为 True 时加载已有记录并继续追加，
+    命令或选项与日志头不一致时抛出 ValueError。
+    """
+
+    def __init__(self, path: str, command: str, options: Dict[str, Any], resume: bool = False):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.diff_end = 0
+        header = {"format": FORMAT, "version": VERSION, "command": command, "options": options}
+        if resume and os.path.exists(path):
+            good = self._load(header)
+            # 截掉中断时写了一半的末行，之后的记录从完整行之后开始追加
+            with open(path, "r+b") as f:
+                f.truncate(good)
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._write(header)
+
+    def _load(self, header: Dict[str, Any]) -> int:
+        """加载日志头和记录，返回最后一个完整行末尾的字节偏移"""
+        with open(self.path, "rb") as f:
+            lines = f.readlines()
+        try:
+            first = json.loads(lines[0]) if lines and lines[0].endswith(b"\n") else None
+        except ValueError:
+            first = None
+        if not first or first.get("format") != FORMAT or first.get("version") != VERSION:
+            raise ValueError(f"{self.path} 不是进度日志")
+        if (first["command"], first["options"]) != (header["command"], header["options"]):
+            raise ValueError(f"{self.path} 记录的命令或选项与本次运行不一致，不能续跑")
+        good = len(lines[0])
+        for line in lines[1:]:
+            if not line.endswith(b"\n"):
+                break  # 中断时写了一半的最后一行
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            self.entries[entry["path"]] = entry
+            self.diff_end = entry["diff_end"]
+            good += len(line)
+        return good
+
+    def _write(self, obj: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def lookup(self, path: str) -> Optional[Dict[str, Any]]:
+        """文件已处理且内容未变时返回其记录"""
+        entry = self.entries.get(path)
+        if entry is not None and entry["hash"] == file_hash(path):
+            return entry
+        return None
+
+    def record(self, path: str, changed: bool, output: str, diff_end: int) -> None:
+        entry = {"path": path, "hash": file_hash(path), "changed": changed, "output": output, "diff_end": diff_end}
+        self.entries[path] = entry
+        self.diff_end = diff_end
+        self._write(entry)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
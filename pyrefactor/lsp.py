@@ -0,0 +1,351 @@
+import os
+import sys
+import ast
+import json
+from collections import ChainMap
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote, urlparse
+
+from .daemon import RPCError, METHOD_NOT_FOUND, INTERNAL_ERROR
+
+# Language Server：`pyrefactor lsp` 在 stdin/stdout 上说 LSP（Content-Length 分帧的 JSON-RPC 2.0），
+# 把移除防御式 try、提升 import、拆分大函数作为代码操作提供给编辑器，并把防御式 try 报告为诊断。
+# 文档全量同步，每次修改只重新解析该文档；项目的依赖图保存在 Workspace 中常驻，
+# 已打开文档的导入以缓冲区内容覆盖磁盘内容。各转换结果按文档版本缓存，光标移动时的重复请求直接命中缓存。
+# 转换使用与 CLI 相同的转换器和选项默认值，代码操作给出的新文本与对同一内容运行 CLI 的结果一致。
+
+SERVER_NOT_INITIALIZED = -32002
+
+KIND_REMOVE_TRY = "refactor.rewrite.pyrefactor.removeDefensiveTry"
+KIND_LIFT_IMPORTS = "source.organizeImports.pyrefactor.liftImports"
+KIND_SPLIT_FUNCTIONS = "refactor.extract.pyrefactor.splitFunctions"
+
+# initializationOptions 可覆盖的选项，默认值与 CLI 一致
+DEFAULT_OPTIONS: Dict[str, Any] = {
+    "maxTryLength": 30,
+    "checkPrintLog": True,
+    "checkRethrow": True,
+    "checkReturnNone": True,
+    "includeRelative": False,
+    "allowControlBlocks": False,
+    "failfirst": False,
+    "processMethods": False,
+}
+
+
+def read_message(rfile: BinaryIO) -> Optional[Dict[str, Any]]:
+    """读取一条 Content-Length 分帧的消息；输入结束时返回 None"""
+    length = None
+    while True:
+        line = rfile.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            break
+        name, _, value = line.decode("ascii").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    if length is None:
+        raise ValueError("缺少 Content-Length")
+    return json.loads(rfile.read(length).decode("utf-8"))
+
+
+def write_message(wfile: BinaryIO, obj: Dict[str, Any]) -> None:
+    body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    wfile.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    wfile.flush()
+
+
+def uri_to_path(uri: str) -> str:
+    return os.path.normpath(unquote(urlparse(uri).path))
+
+
+def path_to_uri(path: str) -> str:
+    return "file://" + quote(os.path.abspath(path))
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def text_edits(old: str, new: str) -> List[Dict[str, Any]]:
+    """去掉首尾相同的行，生成只覆盖中间变化行的单个 TextEdit（线性时间，大文件也不会拖慢响应）"""
+    old_lines = old.splitlines(True)
+    new_lines = new.splitlines(True)
+    prefix = 0
+    limit = min(len(old_lines), len(new_lines))
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+    if prefix == len(old_lines) == len(new_lines):
+        return []
+
+    def position(line: int) -> Dict[str, int]:
+        # 末行没有换行符时，(行数, 0) 不是合法位置，改用末行行尾
+        if line == len(old_lines) and old_lines and not old_lines[-1].endswith(("\n", "\r")):
+            return {"line": line - 1, "character": _utf16_len(old_lines[-1])}
+        return {"line": line, "character": 0}
+
+    text = "".join(new_lines[prefix:len(new_lines) - suffix])
+    return [{"range": {"start": position(prefix), "end": position(len(old_lines) - suffix)}, "newText": text}]
+
+
+class Document:
+    """一个已打开的文档：缓冲区文本、解析结果和按版本缓存的转换结果"""
+
+    def __init__(self, uri: str, text: str, version: int, module_name: str):
+        self.uri = uri
+        self.path = uri_to_path(uri)
+        self.module_name = module_name
+        self.is_init = os.path.basename(self.path) == "__init__.py"
+        self.set_text(text, version)
+
+    def set_text(self, text: str, version: int) -> None:
+        self.text = text
+        self.version = version
+        self._module: Any = None
+        self.results: Dict[Any, Any] = {}
+        self.deps: Optional[Set[str]] = None
+        from .deps import _imports_in_module
+        try:
+            self.deps = _imports_in_module(ast.parse(text), self.module_name, self.is_init)
+        except Exception:
+            pass
+
+    def module(self) -> Any:
+        """libcst 解析结果（每个版本只解析一次）；无法解析时返回 None"""
+        if self._module is None:
+            import libcst as cst
+            try:
+                self._module = cst.parse_module(self.text)
+            except Exception:
+                self._module = False
+        return self._module or None
+
+    def cached(self, key: Any, compute: Callable[[], Any]) -> Any:
+        if key not in self.results:
+            self.results[key] = compute()
+        return self.results[key]
+
+
+class LanguageServer:
+    """处理 LSP 请求与通知；notify 用于向客户端推送 publishDiagnostics"""
+
+    def __init__(self, notify: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.notify = notify or (lambda method, params: None)
+        self.documents: Dict[str, Document] = {}
+        self.workspace: Any = None
+        self.options: Dict[str, Any] = dict(DEFAULT_OPTIONS)
+        self.initialized = False
+        self.shutdown_requested = False
+        # 已打开文档的导入覆盖磁盘上的导入；变化时 overlay_version 加一，使提升 import 的缓存失效
+        self.overlay: Dict[str, Set[str]] = {}
+        self.overlay_version = 0
+
+    # ---- 依赖图 ----
+
+    def _module_name(self, path: str) -> str:
+        from .deps import module_name_from_path_multi
+        if self.workspace is not None and (path + os.sep).startswith(self.workspace.root + os.sep):
+            return module_name_from_path_multi(path, [self.workspace.root])
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def _set_overlay(self, doc: Document, deps: Optional[Set[str]]) -> None:
+        if deps is None:
+            changed = self.overlay.pop(doc.module_name, None) is not None
+        else:
+            changed = self.overlay.get(doc.module_name) != deps
+            self.overlay[doc.module_name] = deps
+        if changed:
+            self.overlay_version += 1
+
+    def graph(self) -> Tuple[Any, Tuple[int, int]]:
+        """(当前依赖图, 版本)；版本在磁盘依赖图或任一打开文档的导入变化时改变"""
+        base = self.workspace.graph if self.workspace is not None else {}
+        version = (self.workspace.graph_version if self.workspace is not None else 0, self.overlay_version)
+        return (ChainMap(self.overlay, base) if self.overlay else base), version
+
+    # ---- 转换 ----
+
+    def remove_defensive_try(self, doc: Document) -> Tuple[Optional[str], List[Tuple[int, str, str]]]:
+        """(新文本或 None, 发现列表)，与 remove_defensive_try 对单个文件的处理一致"""
+        def compute():
+            from .defensive_try_except import refactor_source
+            o = self.options
+            try:
+                new, findings = refactor_source(doc.text, o["maxTryLength"], o["checkPrintLog"], o["checkRethrow"], o["checkReturnNone"], doc.path)
+            except Exception:
+                return None, []
+            return (new if findings else None), findings
+        return doc.cached("remove_defensive_try", compute)
+
+    def lift_imports(self, doc: Document) -> Optional[str]:
+        graph, version = self.graph()
+
+        def compute():
+            from .imports_refactor import transform_module
+            module = doc.module()
+            if module is None:
+                return None
+            o = self.options
+            new = transform_module(module, doc.module_name, doc.is_init, graph, o["includeRelative"], o["allowControlBlocks"], o["failfirst"])
+            return new if new != doc.text else None
+        return doc.cached(("lift_imports", version), compute)
+
+    def split_functions(self, doc: Document) -> Optional[str]:
+        def compute():
+            from .functions import refactor_source
+            try:
+                new, _ = refactor_source(doc.text, self.options["processMethods"])
+            except Exception:
+                return None
+            return new if new != doc.text else None
+        return doc.cached("split_functions", compute)
+
+    # ---- 诊断与代码操作 ----
+
+    def diagnostics(self, doc: Document) -> List[Dict[str, Any]]:
+        lines = doc.text.splitlines()
+        out = []
+        for line, decision, reason in self.remove_defensive_try(doc)[1]:
+            text = lines[line - 1] if 0 < line <= len(lines) else ""
+            start = _utf16_len(text[:len(text) - len(text.lstrip())])
+            out.append({
+                "range": {"start": {"line": line - 1, "character": start}, "end": {"line": line - 1, "character": _utf16_len(text)}},
+                "severity": 2,
+                "source": "pyrefactor",
+                "code": "defensive-try",
+                "message": f"{decision.lstrip('✓ ')}：{reason}",
+            })
+        return out
+
+    def publish(self, doc: Document) -> None:
+        self.notify("textDocument/publishDiagnostics", {"uri": doc.uri, "version": doc.version, "diagnostics": self.diagnostics(doc)})
+
+    def code_actions(self, doc: Document, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        context = params.get("context") or {}
+        only = context.get("only")
+        start = params.get("range", {}).get("start", {}).get("line", 0)
+        end = params.get("range", {}).get("end", {}).get("line", start)
+        candidates = [
+            (KIND_REMOVE_TRY, "移除防御式 try-except", lambda: self.remove_defensive_try(doc)[0]),
+            (KIND_LIFT_IMPORTS, "提升安全的 import 到顶层", lambda: self.lift_imports(doc)),
+            (KIND_SPLIT_FUNCTIONS, "按注释边界拆分大函数", lambda: self.split_functions(doc)),
+        ]
+        actions = []
+        for kind, title, compute in candidates:
+            if only and not any(kind == k or kind.startswith(k + ".") for k in only):
+                continue
+            new = compute()
+            if new is None:
+                continue
+            edits = doc.cached(("edits", new), lambda: text_edits(doc.text, new))
+            action: Dict[str, Any] = {"title": title, "kind": kind, "edit": {"changes": {doc.uri: edits}}}
+            if kind == KIND_REMOVE_TRY:
+                related = [d for d in context.get("diagnostics", []) if d.get("source") == "pyrefactor" and start <= d["range"]["start"]["line"] <= end]
+                if related:
+                    action["diagnostics"] = related
+                    action["isPreferred"] = True
+            actions.append(action)
+        return actions
+
+    # ---- 协议 ----
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "initialize":
+            root = params.get("rootUri") and uri_to_path(params["rootUri"]) or params.get("rootPath")
+            if root and os.path.isdir(root):
+                from .workspace import Workspace
+                self.workspace = Workspace(root)
+                self.workspace.refresh()
+            self.options.update({k: v for k, v in (params.get("initializationOptions") or {}).items() if k in DEFAULT_OPTIONS})
+            self.initialized = True
+            return {
+                "capabilities": {
+                    "textDocumentSync": {"openClose": True, "change": 1, "save": True},
+                    "codeActionProvider": {"codeActionKinds": [KIND_REMOVE_TRY, KIND_LIFT_IMPORTS, KIND_SPLIT_FUNCTIONS]},
+                },
+                "serverInfo": {"name": "pyrefactor"},
+            }
+        if not self.initialized:
+            raise RPCError(SERVER_NOT_INITIALIZED, "尚未初始化")
+        if method == "shutdown":
+            self.shutdown_requested = True
+            return None
+        if method == "initialized":
+            return None
+        if method == "textDocument/didOpen":
+            item = params["textDocument"]
+            doc = Document(item["uri"], item["text"], item.get("version", 0), self._module_name(uri_to_path(item["uri"])))
+            self.documents[doc.uri] = doc
+            self._set_overlay(doc, doc.deps)
+            self.publish(doc)
+            return None
+        if method == "textDocument/didChange":
+            doc = self.documents.get(params["textDocument"]["uri"])
+            if doc is None or not params.get("contentChanges"):
+                return None
+            doc.set_text(params["contentChanges"][-1]["text"], params["textDocument"].get("version", doc.version + 1))
+            self._set_overlay(doc, doc.deps)
+            self.publish(doc)
+            return None
+        if method == "textDocument/didClose":
+            doc = self.documents.pop(params["textDocument"]["uri"], None)
+            if doc is not None:
+                self._set_overlay(doc, None)
+                self.notify("textDocument/publishDiagnostics", {"uri": doc.uri, "diagnostics": []})
+            return None
+        if method == "textDocument/didSave":
+            if self.workspace is not None:
+                self.workspace.update([uri_to_path(params["textDocument"]["uri"])])
+            return None
+        if method == "workspace/didChangeWatchedFiles":
+            if self.workspace is not None:
+                self.workspace.update([uri_to_path(change["uri"]) for change in params.get("changes", [])])
+            return None
+        if method == "textDocument/codeAction":
+            doc = self.documents.get(params["textDocument"]["uri"])
+            return self.code_actions(doc, params) if doc is not None else []
+        raise RPCError(METHOD_NOT_FOUND, f"未知的方法: {method}")
+
+
+def serve(rfile: BinaryIO, wfile: BinaryIO) -> int:
+    """在 rfile/wfile 上运行服务直到收到 exit；返回退出码（先 shutdown 再 exit 为 0）"""
+    server = LanguageServer(lambda method, params: write_message(wfile, {"jsonrpc": "2.0", "method": method, "params": params}))
+    while True:
+        try:
+            message = read_message(rfile)
+        except ValueError:
+            continue
+        if message is None:
+            return 1
+        method = message.get("method")
+        if not isinstance(method, str):
+            continue  # 客户端对服务端请求的响应，本服务不发请求
+        if method == "exit":
+            return 0 if server.shutdown_requested else 1
+        params = message.get("params") or {}
+        if "id" not in message:
+            try:
+                server.handle(method, params)
+            except Exception as e:
+                print(f"处理通知 {method} 时出错: {type(e).__name__}: {e}", file=sys.stderr)
+            continue
+        rid = message["id"]
+        try:
+            response = {"jsonrpc": "2.0", "id": rid, "result": server.handle(method, params)}
+        except RPCError as e:
+            response = {"jsonrpc": "2.0", "id": rid, "error": {"code": e.code, "message": str(e)}}
+        except Exception as e:
+            response = {"jsonrpc": "2.0", "id": rid, "error": {"code": INTERNAL_ERROR, "message": f"{type(e).__name__}: {e}"}}
+        write_message(wfile, response)
+
+
+def main() -> None:
+    """stdio 入口：stdout 专用于协议，转换器的输出一律改写到 stderr"""
+    rfile, wfile = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr
+    sys.exit(serve(rfile, wfile))
@@ -0,0 +1,343 @@
+import os
+import io
+import sys
+import json
+import time
+import threading
+from multiprocessing import resource_tracker
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .guard import Guard, Skipped, run_guarded
+
+# 每个 worker 进程通过 initializer 只接收一次的共享上下文（例如依赖图），避免随每个任务重复传输
+_CONTEXT: Any = None
+
+# --jobs auto：由 run_files 校准后选择 worker 数和批大小（见 tuning.py）
+AUTO = "auto"
+
+
+def parse_jobs(value: str) -> Any:
+    """argparse 的 --jobs 类型：整数或 auto"""
+    if value == AUTO:
+        return AUTO
+    try:
+        return int(value)
+    except ValueError:
+        import argparse
+        raise argparse.ArgumentTypeError(f"--jobs 需要整数或 auto，而不是 {value!r}")
+
+
+def resolve_jobs(jobs: Any) -> int:
+    """将 --jobs 参数换算为实际 worker 数：None/1 为串行，0 或负数表示使用全部 CPU；
+    auto 在这里换算为 CPU 数作为上限，实际数量由 run_files 校准后决定"""
+    if jobs is None:
+        return 1
+    if jobs == AUTO or jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def supports_parallel_threads() -> bool:
+    """当前解释器的线程能否真正并行执行 Python 代码（free-threaded 构建且 GIL 未被重新启用）
+
+    子解释器（per-interpreter GIL）暂不作为后端：libcst 的原生解析器扩展未声明支持隔离的子解释器。
+    """
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def resolve_backend(backend: str = "auto") -> str:
+    """auto 在支持真并行线程时选择 thread，否则回退到 process"""
+    if backend == "auto":
+        return "thread" if supports_parallel_threads() else "process"
+    if backend not in ("thread", "process"):
+        raise ValueError(f"未知的执行后端: {backend}")
+    return backend
+
+
+def _init_worker(context: Any) -> None:
+    global _CONTEXT
+    _CONTEXT = context
+
+
+def _call_batch(func: Callable[[Any, Any], Any], context: Any, batch: List[Any]) -> List[Tuple[float, Any]]:
+    out: List[Tuple[float, Any]] = []
+    for item in batch:
+        start = time.perf_counter()
+        result = func(context, item)
+        out.append((time.perf_counter() - start, result))
+    return out
+
+
+def _invoke_batch(func: Callable[[Any, Any], Any], batch: List[Any]) -> List[Tuple[float, Any]]:
+    return _call_batch(func, _CONTEXT, batch)
+
+
+def plan_batches(costs: Sequence[float], workers: int, batches_per_worker: int = 8) -> List[List[int]]:
+    """按最长处理时间优先（LPT）规划批次
+
+    代价不低于目标批次代价的文件单独成批，小文件按代价从大到小累积成批直到达到目标，
+    以降低 IPC 开销；返回的批次按总代价降序排列，先派发最重的任务，小批次在末尾填平各 worker 的负载。
+    """
+    order = sorted(range(len(costs)), key=lambda i: (-costs[i], i))
+    total = sum(costs)
+    target = total / max(1, workers * batches_per_worker)
+    batches: List[Tuple[float, List[int]]] = []
+    cur: List[int] = []
+    cur_cost = 0.0
+    for i in order:
+        if costs[i] >= target or target <= 0:
+            batches.append((costs[i], [i]))
+            continue
+        cur.append(i)
+        cur_cost += costs[i]
+        if cur_cost >= target:
+            batches.append((cur_cost, cur))
+            cur, cur_cost = [], 0.0
+    if cur:
+        batches.append((cur_cost, cur))
+    batches.sort(key=lambda b: (-b[0], b[1][0]))
+    return [b for _, b in batches]
+
+
+def _make_pool(backend: str, workers: int, context: Any) -> Executor:
+    if backend == "thread":
+        return ThreadPoolExecutor(max_workers=workers)
+    # 先在父进程启动 resource tracker，worker 随后 attach 的共享内存才会登记到同一个 tracker 上，
+    # 否则常驻池中每个 worker 各起一个 tracker，退出时会误报泄漏
+    resource_tracker.ensure_running()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(context,))
+
+
+def _collect_ordered(futures: List[Any], batches: List[List[int]], count: int, timings: Optional[Dict[int, float]]) -> Iterator[Any]:
+    location: Dict[int, Tuple[int, int]] = {}
+    for b, batch in enumerate(batches):
+        for pos, i in enumerate(batch):
+            location[i] = (b, pos)
+    remaining = [len(batch) for batch in batches]
+    for index in range(count):
+        b, pos = location[index]
+        elapsed, result = futures[b].result()[pos]
+        if timings is not None:
+            timings[index] = elapsed
+        remaining[b] -= 1
+        if not remaining[b]:
+            futures[b] = None  # 批次已全部交付，释放其结果
+        yield result
+
+
+def _plan(count: int, workers: int, costs: Optional[Sequence[float]], chunksize: int, batches_per_worker: int) -> List[List[int]]:
+    if costs is None:
+        step = max(1, chunksize)
+        return [list(range(i, min(i + step, count))) for i in range(0, count, step)]
+    return plan_batches(costs, workers, batches_per_worker)
+
+
+class WorkerPool:
+    """可在多次 run_ordered 调用之间复用的常驻 worker 池（例如批量处理多个仓库根目录）
+
+    与一次性的池不同，context 随每个批次发送而不是通过 initializer 只发一次，
+    因此大对象应先放入共享内存（如 SharedGraph），使序列化只传递句柄。
+    """
+
+    def __init__(self, jobs: Optional[int] = None, backend: str = "auto"):
+        self.workers = resolve_jobs(jobs)
+        self.backend = resolve_backend(backend)
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = _make_pool(self.backend, self.workers, None)
+        return self._executor
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def run_ordered(func: Callable[[Any, Any], Any], items: Iterable[Any], jobs: Optional[int] = 1, context: Any = None, chunksize: int = 1, costs: Optional[Sequence[float]] = None, timings: Optional[Dict[int, float]] = None, backend: str = "process", pool: Optional[WorkerPool] = None, guard: Optional[Guard] = None, batches_per_worker: int = 8) -> Iterator[Any]:
+    """以 func(context, item) 处理每个 item，并严格按输入顺序产出结果
+
+    func 必须是模块顶层函数（可被 pickle）。jobs <= 1 时在当前进程内串行执行，
+    因此无论 worker 数多少，调用方看到的结果顺序完全一致。
+    提供 costs（每个 item 的预估代价）时按 LPT 顺序分批派发（每个 worker 约 batches_per_worker 批），
+    否则按 chunksize 顺序分批；结果仍按输入顺序产出。
+    提供 timings 时会填入每个 item 的实际耗时（秒），用于下次运行的代价估计。
+    backend 为 process（进程池）、thread（线程池，func 直接拿到 context，不经过序列化）或 auto。
+    提供 pool 时使用该常驻池，忽略 jobs 和 backend。
+    提供 guard 时改为受保护运行（见 guard.py）：每个 item 在可被杀掉的子进程中处理，超时或内存超限的 item 产出 Skipped。
+    """
+    tasks: List[Any] = list(items)
+    workers = min(pool.workers if pool is not None else resolve_jobs(jobs), len(tasks))
+    if guard:
+        order = None if costs is None else sorted(range(len(tasks)), key=lambda i: (-costs[i], i))
+        yield from run_guarded(func, tasks, workers, guard, context=context, order=order, timings=timings)
+        return
+    if workers <= 1:
+        for index, item in enumerate(tasks):
+            start = time.perf_counter()
+            result = func(context, item)
+            if timings is not None:
+                timings[index] = time.perf_counter() - start
+            yield result
+        return
+    batches = _plan(len(tasks), workers, costs, chunksize, batches_per_worker)
+    if pool is not None:
+        executor = pool.executor
+        futures = [executor.submit(_call_batch, func, context, [tasks[i] for i in batch]) for batch in batches]
+        yield from _collect_ordered(futures, batches, len(tasks), timings)
+        return
+    backend = resolve_backend(backend)
+    with _make_pool(backend, workers, context) as executor:
+        if backend == "thread":
+            futures = [executor.submit(_call_batch, func, context, [tasks[i] for i in batch]) for batch in batches]
+        else:
+            futures = [executor.submit(_invoke_batch, func, [tasks[i] for i in batch]) for batch in batches]
+        yield from _collect_ordered(futures, batches, len(tasks), timings)
+
+
+class CostModel:
+    """文件处理代价估计：优先使用上次运行记录的耗时，否则按文件大小估算
+
+    history_path 为 None 时不读写历史记录，仅使用文件大小。
+    """
+
+    def __init__(self, history_path: Optional[str] = None):
+        self.history_path = history_path
+        self.history: Dict[str, float] = {}
+        if history_path and os.path.exists(history_path):
+            try:
+                with open(history_path, "r", encoding="utf-8") as f:
+                    self.history = {k: float(v) for k, v in json.load(f).items()}
+            except (OSError, ValueError, AttributeError):
+                self.history = {}
+
+    def estimate(self, paths: Sequence[str]) -> List[float]:
+        sizes: List[int] = []
+        for p in paths:
+            try:
+                sizes.append(os.path.getsize(p))
+            except OSError:
+                sizes.append(0)
+        known = [(self.history[p], size) for p, size in zip(paths, sizes) if p in self.history]
+        known_bytes = sum(size for _, size in known)
+        if not known or known_bytes <= 0:
+            return [float(size) for size in sizes]
+        # 用已知文件的平均 秒/字节 把未知文件的大小换算成同一单位
+        rate = sum(sec for sec, _ in known) / known_bytes
+        return [self.history.get(p, size * rate) for p, size in zip(paths, sizes)]
+
+    def record(self, paths: Sequence[str], timings: Dict[int, float]) -> None:
+        for index, seconds in timings.items():
+            self.history[paths[index]] = seconds
+
+    def save(self) -> None:
+        if not self.history_path:
+            return
+        tmp = f"{self.history_path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.history, f, sort_keys=True)
+        os.replace(tmp, self.history_path)
+
+
+def run_files(func: Callable[[Any, Any], Any], tasks: Sequence[Any], paths: Sequence[str], jobs: Any = 1, context: Any = None, cost_history: Optional[str] = None, backend: str = "auto", pool: Optional[WorkerPool] = None, guard: Optional[Guard] = None, summary: Any = None, cache: Any = None, dedup: Any = None, prepare: Optional[Callable[[int, str], Any]] = None) -> Iterator[Any]:
+    """按文件代价调度的 run_ordered：paths[i] 是 tasks[i] 对应的文件，结果按输入顺序产出
+
+    jobs 为 auto 时先校准（见 tuning.autotune）再选择 worker 数和批大小，提供 pool 时只调整批大小；
+    提供 summary（tuning.RunSummary）时记录所选的值和实测吞吐。
+    提供 cache（cache.CacheScope）时命中缓存的文件不再派发，调度、校准和耗时历史只涉及未命中的文件。
+    提供 dedup（dedup.Dedup）时内容相同的文件只派发第一个，其余复用其结果，去重数记入 summary。
+    提供 prepare 时忽略 context，在 worker 数（含 auto 的校准结果）和后端确定之后以 prepare(workers, backend)
+    取得 context，调用方可据此选择数据的表示（如 worker 为 1 时不必放入共享内存）；没有需要派发的文件时不调用。
+    耗时历史在产出最后一个结果之前保存，调用方用 zip 等方式提前停止迭代也不会丢失。
+    """
+    if cache is not None:
+        yield from cache.run(tasks, paths, lambda t, p: run_files(func, t, p, jobs, context, cost_history, backend, pool, guard, summary, dedup=dedup, prepare=prepare))
+        return
+    if dedup is not None:
+        yield from dedup.run(tasks, paths, lambda t, p: run_files(func, t, p, jobs, context, cost_history, backend, pool, guard, summary, prepare=prepare), summary)
+        return
+    model = CostModel(cost_history)
+    timings: Dict[int, float] = {}
+    batches_per_worker = 8
+    tuning = None
+    if jobs == AUTO:
+        from .tuning import autotune
+        tuning = autotune(paths, max_workers=pool.workers if pool is not None else None, backend=pool.backend if pool is not None else backend)
+        jobs = tuning.workers
+        if tuning.workers <= 1:
+            pool = None
+        batches_per_worker = tuning.batches_per_worker(len(tasks))
+    count = len(tasks)
+    if prepare is not None and count:
+        workers = min(pool.workers if pool is not None else resolve_jobs(jobs), count)
+        context = prepare(workers, pool.backend if pool is not None else resolve_backend(backend))
+    start = time.perf_counter()
+    results = run_ordered(func, tasks, jobs=jobs, context=context, costs=model.estimate(paths), timings=timings, backend=backend, pool=pool, guard=guard, batches_per_worker=batches_per_worker)
+    for index, result in enumerate(results):
+        if index == count - 1:
+            if cost_history:
+                model.record(paths, timings)
+                model.save()
+            if tuning is not None and summary is not None:
+                summary.record(tuning, count, time.perf_counter() - start)
+        yield result
+
+
+class _ThreadLocalStdout(io.TextIOBase):
+    """按线程分发写入的 stdout 代理：正在截获输出的线程写入各自的缓冲区，其余线程写入原 stdout"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.local = threading.local()
+
+    def _target(self):
+        buf = getattr(self.local, "buf", None)
+        return buf if buf is not None else self.fallback
+
+    def write(self, s: str) -> int:
+        return self._target().write(s)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+
+_capture_lock = threading.Lock()
+_capture_users = 0
+_capture_proxy: Optional[_ThreadLocalStdout] = None
+
+
+def captured(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[Any, str]:
+    """执行 func 并截获其 stdout，由调用方按文件顺序统一回放，避免多进程/多线程输出交错
+
+    与 contextlib.redirect_stdout 不同，这里按线程隔离缓冲区，线程后端下并发截获互不干扰。
+    """
+    global _capture_users, _capture_proxy
+    with _capture_lock:
+        if _capture_users == 0:
+            _capture_proxy = _ThreadLocalStdout(sys.stdout)
+            sys.stdout = _capture_proxy
+        _capture_users += 1
+        proxy = _capture_proxy
+    buf = io.StringIO()
+    previous = getattr(proxy.local, "buf", None)
+    proxy.local.buf = buf
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        proxy.local.buf = previous
+        with _capture_lock:
+            _capture_users -= 1
+            if _capture_users == 0:
+                sys.stdout = proxy.fallback
+                _capture_proxy = None
+    return result, buf.getvalue()
@@ -0,0 +1,202 @@
+import os
+import ast
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# 一次调用内共享的项目视图：文件索引（resolve.ModuleResolver）以及每个文件按需读取、解析并缓存的
+# 原始字节、源码、ast 树、libcst 模块和元数据。依赖图构建、--absimport、refc_import 的转换和 graph imports
+# 都从这里取，每个文件每种解析结果在一次调用中只产生一次。顶层只依赖标准库，libcst 按需导入。
+# 缓存只保留之后还有使用者的结果：依赖图扫描完一个文件即释放其 ast 树（源码只在 libcst 模块仍被缓存时保留），
+# 转换完一个文件即释放该文件的全部条目，因此默认运行中的内存不随文件树增长；只有 --absimport 之后未改动文件的
+# libcst 模块会保留到提升时复用。
+# 进程后端序列化 Project 时只带根目录，worker 中各自按需解析；线程后端和串行执行直接共享缓存。
+
+_FAILED = object()
+
+
+def decode_source(data: bytes) -> str:
+    """按 utf-8 解码并像文本模式的 open() 一样把 \\r\\n 和 \\r 换成 \\n，结果与直接按文本读取文件相同"""
+    return data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+class _Entry:
+    __slots__ = ("data", "source", "tree", "cst_module", "metadata")
+
+    def __init__(self) -> None:
+        self.data: Any = None
+        self.source: Any = None
+        self.tree: Any = None
+        self.cst_module: Any = None
+        self.metadata: Any = None
+
+
+class Project:
+    """root（及 package_paths）的文件索引和逐文件的解析缓存
+
+    用法：
+        project = Project(root)
+        graph = build_dependency_graph(root, project=project)      # ast 树留在缓存中
+        rewrite_directory(root, project=project)                   # libcst 模块同样只解析一次
+
+    各访问方法在文件无法读取（或无法解析）时返回 None，失败结果同样缓存，直到 release 释放。
+    parses 统计各类解析实际发生的次数（"ast"、"cst"），便于确认没有重复解析。非线程安全：线程后端下
+    同一文件可能被并发解析两次，结果相同，只是少了一次缓存命中。
+    """
+
+    def __init__(self, root: str, package_paths: Optional[List[str]] = None):
+        self.root = root
+        self.package_paths = package_paths
+        self._resolver: Any = None
+        self._entries: Dict[str, _Entry] = {}
+        self.parses: Counter = Counter()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # 发送给进程 worker 时不带文件索引和解析结果
+        return {"root": self.root, "package_paths": self.package_paths}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["root"], state["package_paths"])
+
+    @property
+    def resolver(self) -> Any:
+        """文件索引（resolve.ModuleResolver），首次使用时遍历文件树"""
+        if self._resolver is None:
+            from .resolve import ModuleResolver
+            self._resolver = ModuleResolver(self.root, self.package_paths)
+        return self._resolver
+
+    @property
+    def paths(self) -> Dict[str, str]:
+        """按遍历顺序的 文件 -> 模块名"""
+        return self.resolver.paths
+
+    def module_name(self, path: str) -> str:
+        name = self.resolver.paths.get(path)
+        return name if name is not None else self.resolver.module_name(path)
+
+    def _entry(self, path: str) -> _Entry:
+        entry = self._entries.get(path)
+        if entry is None:
+            entry = self._entries[path] = _Entry()
+        return entry
+
+    def data(self, path: str) -> Optional[bytes]:
+        entry = self._entry(path)
+        if entry.data is None:
+            try:
+                with open(path, "rb") as f:
+                    entry.data = f.read()
+            except OSError:
+                entry.data = _FAILED
+        return None if entry.data is _FAILED else entry.data
+
+    def source(self, path: str) -> Optional[str]:
+        entry = self._entry(path)
+        if entry.source is None:
+            data = self.data(path)
+            try:
+                entry.source = _FAILED if data is None else decode_source(data)
+            except UnicodeDecodeError:
+                entry.source = _FAILED
+        return None if entry.source is _FAILED else entry.source
+
+    def tree(self, path: str) -> Optional[ast.Module]:
+        entry = self._entry(path)
+        if entry.tree is None:
+            source = self.source(path)
+            entry.tree = _FAILED
+            if source is not None:
+                self.parses["ast"] += 1
+                try:
+                    entry.tree = ast.parse(source)
+                except Exception:
+                    pass
+        return None if entry.tree is _FAILED else entry.tree
+
+    def cst_module(self, path: str) -> Any:
+        """libcst.Module；libcst 的树不可变，调用方可以反复 visit 同一个模块"""
+        entry = self._entry(path)
+        if entry.cst_module is None:
+            source = self.source(path)
+            entry.cst_module = _FAILED
+            if source is not None:
+                import libcst as cst
+                self.parses["cst"] += 1
+                try:
+                    entry.cst_module = cst.parse_module(source)
+                except Exception:
+                    pass
+        return None if entry.cst_module is _FAILED else entry.cst_module
+
+    def metadata(self, path: str) -> Any:
+        """缓存的 libcst MetadataWrapper，与 cst_module 共用同一棵树，已解析的元数据在各访问者间共享"""
+        entry = self._entry(path)
+        if entry.metadata is None:
+            module = self.cst_module(path)
+            if module is None:
+                return None
+            from libcst.metadata import MetadataWrapper
+            entry.metadata = MetadataWrapper(module, unsafe_skip_copy=True)
+        return entry.metadata
+
+    def release(self, path: str, *kinds: str) -> None:
+        """释放 path 的缓存条目中的 kinds（"data"、"source"、"tree"、"cst_module"、"metadata"），不给出时释放整个条目"""
+        entry = self._entries.get(path)
+        if entry is None:
+            return
+        for kind in kinds or _Entry.__slots__:
+            setattr(entry, kind, None)
+        if all(getattr(entry, kind) is None for kind in _Entry.__slots__):
+            del self._entries[path]
+
+    def clear(self) -> None:
+        """释放所有文件的缓存条目，文件索引保留"""
+        self._entries.clear()
+
+    def release_scanned(self, path: str) -> None:
+        """依赖图扫描完 path 之后调用：释放 ast 树；libcst 模块没有被缓存时同时释放字节和源码"""
+        entry = self._entries.get(path)
+        if entry is None:
+            return
+        if entry.cst_module is None:
+            self.release(path, "data", "source", "tree")
+        else:
+            self.release(path, "tree")
+
+    def update(self, path: str, source: str) -> None:
+        """文件内容已变为 source：替换缓存的源码，丢弃旧的解析结果"""
+        entry = self._entries[path] = _Entry()
+        entry.data = source.encode("utf-8")
+        entry.source = source
+
+    def write(self, path: str, source: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(source)
+        self.update(path, source)
+
+    def dependency_graph(self) -> Dict[str, Set[str]]:
+        """与 deps.build_dependency_graph(root, package_paths) 相同的依赖图，在当前进程中串行扫描"""
+        from .deps import _imports_in_module
+        graph: Dict[str, Set[str]] = {}
+        for path, mod in self.paths.items():
+            tree = self.tree(path)
+            if tree is not None:
+                graph[mod] = _imports_in_module(tree, mod, os.path.basename(path) == "__init__.py")
+            self.release_scanned(path)
+        return graph
+
+    def import_graph(self) -> Tuple[Set[str], Set[Tuple[str, str]]]:
+        """`graph imports` 的节点与边（模块名相对 root，与 build_import_graph_mermaid 相同）"""
+        from .deps import module_name_from_path
+        from .graph import import_edges
+        nodes: Set[str] = set()
+        edges: Set[Tuple[str, str]] = set()
+        for path in self.paths:
+            tree = self.tree(path)
+            self.release_scanned(path)
+            if tree is None:
+                continue
+            mod = module_name_from_path(path, self.root)
+            nodes.add(mod)
+            edges |= import_edges(tree, mod)
+        return nodes, edges
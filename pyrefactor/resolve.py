@@ -0,0 +1,127 @@
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Set
+
+# 模块解析索引：包根目录前缀树（按路径分量逐级匹配最长的根目录，代替对每个文件遍历全部根目录）、
+# 模块名 -> 文件，以及模块分类（本项目 / 标准库 / 已安装的第三方包 / 未知），全部离线完成。
+
+FIRST_PARTY = "first-party"
+STDLIB = "stdlib"
+THIRD_PARTY = "third-party"
+UNKNOWN = "unknown"
+
+_END = ""
+_stdlib_names: Optional[Set[str]] = None
+_installed_names: Optional[Set[str]] = None
+
+
+def stdlib_names() -> Set[str]:
+    """标准库顶层模块名：sys.stdlib_module_names，旧版本解释器上退回到扫描标准库目录"""
+    global _stdlib_names
+    if _stdlib_names is None:
+        names = set(getattr(sys, "stdlib_module_names", ())) | set(sys.builtin_module_names)
+        if not hasattr(sys, "stdlib_module_names"):
+            import sysconfig
+            stdlib = sysconfig.get_paths()["stdlib"]
+            for entry in os.listdir(stdlib):
+                name, ext = os.path.splitext(entry)
+                if ext == ".py" or (not ext and os.path.isfile(os.path.join(stdlib, entry, "__init__.py"))):
+                    names.add(name)
+        _stdlib_names = names
+    return _stdlib_names
+
+
+def installed_names() -> Set[str]:
+    """已安装分发包提供的顶层模块名，取自 importlib.metadata（top_level.txt 或 RECORD），不访问网络"""
+    global _installed_names
+    if _installed_names is None:
+        from importlib import metadata
+        names: Set[str] = set()
+        try:
+            names.update(metadata.packages_distributions())
+        except AttributeError:
+            # Python < 3.10
+            for dist in metadata.distributions():
+                top_level = dist.read_text("top_level.txt") or ""
+                names.update(line.strip() for line in top_level.splitlines() if line.strip())
+                for f in dist.files or ():
+                    if f.parts and f.parts[0].endswith(".py") and len(f.parts) == 1:
+                        names.add(f.parts[0][:-3])
+        _installed_names = names
+    return _installed_names
+
+
+class ModuleResolver:
+    """root 的模块解析索引，构建时遍历一次文件树
+
+    module_name 与 deps.module_name_from_path_multi 结果相同；files 为模块名 -> 文件（同名模块以遍历中后出现的为准），
+    paths 按遍历顺序给出 文件 -> 模块名。
+    """
+
+    def __init__(self, root: str, package_paths: Optional[List[str]] = None):
+        from .deps import list_python_files
+        self.root = os.path.abspath(root)
+        self.roots = [os.path.abspath(p) for p in package_paths] if package_paths else [self.root]
+        self._trie: Dict[str, dict] = {}
+        for r in self.roots:
+            node = self._trie
+            for part in self._parts(r):
+                node = node.setdefault(part, {})
+            node.setdefault(_END, r)
+        self.paths: Dict[str, str] = {}
+        self.files: Dict[str, str] = {}
+        for path in list_python_files(root):
+            mod = self.module_name(path)
+            self.paths[path] = mod
+            self.files[mod] = path
+        self._top_level = {m.split(".")[0] for m in self.files}
+        self._kinds: Dict[str, str] = {}
+
+    @staticmethod
+    def _parts(path: str) -> List[str]:
+        return [p for p in path.split(os.sep) if p]
+
+    def root_for(self, path: str) -> str:
+        """包含 path 的最长包根目录；都不包含时为第一个根目录"""
+        node = self._trie
+        best = node.get(_END)
+        parts = self._parts(os.path.abspath(path))
+        # 根目录本身不算包含（与 module_name_from_path_multi 一致），只匹配到倒数第二个分量
+        for part in parts[:-1]:
+            node = node.get(part)
+            if node is None:
+                break
+            best = node.get(_END, best)
+        return best or self.roots[0]
+
+    def module_name(self, path: str) -> str:
+        from .deps import module_name_from_path
+        return module_name_from_path(path, self.root_for(path))
+
+    def file_for(self, module: str) -> Optional[str]:
+        return self.files.get(module)
+
+    def classify(self, module: str) -> str:
+        """按顶层包名分类；本项目的模块优先（与 sys.path[0] 遮蔽同名标准库的行为一致），相对导入（以 . 开头）属于本项目"""
+        if module.startswith("."):
+            return FIRST_PARTY
+        top = module.split(".")[0]
+        kind = self._kinds.get(top)
+        if kind is None:
+            if top in self._top_level:
+                kind = FIRST_PARTY
+            elif top in stdlib_names():
+                kind = STDLIB
+            elif top in installed_names():
+                kind = THIRD_PARTY
+            else:
+                kind = UNKNOWN
+            self._kinds[top] = kind
+        return kind
+
+    def is_external(self, module: str) -> bool:
+        return self.classify(module) != FIRST_PARTY
+
+    def drop_external(self, graph: Dict[str, Iterable[str]]) -> Dict[str, Set[str]]:
+        """去掉指向外部模块的边"""
+        return {m: {d for d in deps if not self.is_external(d)} for m, deps in graph.items()}
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 分片结果文件格式：一次分片运行的所有"有产出"的文件条目，index 为该文件在完整文件枚举中的位置，
+# merge 按 index 排序还原单机运行时的输出顺序。
+FORMAT = "pyrefactor-shard"
+VERSION = 1
+
+Shard = Tuple[int, int]
+
+
+def parse_shard(spec: str) -> Shard:
+    """argparse 的 --shard 类型：解析 i/n（i 从 1 开始）"""
+    import argparse
+    try:
+        i_text, n_text = spec.split("/")
+        i, n = int(i_text), int(n_text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的分片参数 {spec!r}，应为 i/n") from None
+    if n < 1 or not 1 <= i <= n:
+        raise argparse.ArgumentTypeError(f"无效的分片参数 {spec!r}，要求 1 <= i <= n")
+    return i, n
+
+
+def shard_bucket(path: str, root: str, count: int) -> int:
+    """按相对 root 的 posix 路径做稳定哈希，返回 0..count-1；与检出位置和机器无关"""
+    rel = os.path.relpath(path, root).replace(os.sep, "/")
+    digest = hashlib.sha1(rel.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def in_shard(path: str, root: str, shard: Optional[Shard]) -> bool:
+    if shard is None:
+        return True
+    i, n = shard
+    return shard_bucket(path, root, n) == i - 1
+
+
+def select_shard(paths: Sequence[str], root: str, shard: Optional[Shard]) -> List[int]:
+    """返回属于该分片的文件在 paths 中的下标"""
+    return [k for k, p in enumerate(paths) if in_shard(p, root, shard)]
+
+
+def make_entry(index: int, path: str, changed: bool, diff: str = "", output: str = "", source: Optional[str] = None) -> Dict[str, Any]:
+    entry = {"index": index, "path": path, "changed": changed, "diff": diff, "output": output}
+    if source is not None:
+        entry["source"] = source
+    return entry
+
+
+def write_partial(out_path: str, command: str, shard: Shard, total: int, dry_run: bool, entries: List[Dict[str, Any]]) -> None:
+    data = {
+        "format": FORMAT,
+        "version": VERSION,
+        "command": command,
+        "shard": list(shard),
+        "total": total,
+        "dry_run": dry_run,
+        "entries": entries,
+    }
+    tmp = f"{out_path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, out_path)
+
+
+def _load_partial(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("format") != FORMAT or data.get("version") != VERSION:
+        raise ValueError(f"{path} 不是分片结果文件")
+    return data
+
+
+def merge_partials(paths: Sequence[str], output_diff: Optional[str] = None) -> Tuple[str, bool, List[str]]:
+    """合并各分片结果，产出与单机运行相同的输出
+
+    按文件原始顺序回放各文件的控制台输出、写出 diff，返回 (命令, 是否 dry_run, 变更列表)，
+    变更列表与对应目录函数的返回值一致。要求提供全部 n 个分片且各分片的命令、选项与文件总数一致。
+    """
+    parts = [_load_partial(p) for p in paths]
+    if not parts:
+        raise ValueError("没有可合并的分片结果")
+    first = parts[0]
+    command, dry_run, total = first["command"], first["dry_run"], first["total"]
+    n = first["shard"][1]
+    seen = set()
+    for part in parts:
+        if (part["command"], part["dry_run"], part["total"], part["shard"][1]) != (command, dry_run, total, n):
+            raise ValueError("分片结果来自不同的运行，无法合并")
+        if part["shard"][0] in seen:
+            raise ValueError(f"分片 {part['shard'][0]}/{n} 重复")
+        seen.add(part["shard"][0])
+    missing = sorted(set(range(1, n + 1)) - seen)
+    if missing:
+        raise ValueError(f"缺少分片: {', '.join(f'{i}/{n}' for i in missing)}")
+
+    entries = [e for part in parts for e in part["entries"]]
+    changes = replay_entries(command, dry_run, entries, output_diff=output_diff)
+    return command, dry_run, changes
+
+
+def _unchanged_since(path: str, digest: str) -> bool:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return hashlib.sha256(f.read().encode("utf-8")).hexdigest() == digest
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def replay_entries(command: str, dry_run: bool, entries: List[Dict[str, Any]], output_diff: Optional[str] = None) -> List[str]:
+    """按 index 顺序回放文件条目：输出控制台文本、写回条目携带的新源码（source）、写出 diff
+
+    返回值与对应目录函数（rewrite_directory / rewrite_directory_for_defensive_try_except）一致。
+    """
+    changes: List[str] = []
+    diff_chunks: List[str] = []
+    for entry in sorted(entries, key=lambda e: e["index"]):
+        sys.stdout.write(entry["output"])
+        if not entry["changed"]:
+            continue
+        if not dry_run and entry.get("source") is not None:
+            if "sha256" in entry and not _unchanged_since(entry["path"], entry["sha256"]):
+                # 条目带有计算时的源码哈希（分布式运行），文件此后被修改过时不覆盖
+                sys.stdout.write(f"文件 {entry['path']} 在处理期间被修改，未写回\n")
+                continue
+            with open(entry["path"], "w", encoding="utf-8") as f:
+                f.write(entry["source"])
+        if entry["diff"]:
+            diff_chunks.append(entry["diff"])
+        if command == "remove_defensive_try" or not (dry_run and entry["diff"]):
+            changes.append(entry["path"])
+    if output_diff and (diff_chunks or command == "remove_defensive_try"):
+        with open(output_diff, "w", encoding="utf-8") as f:
+            for d in diff_chunks:
+                f.write(d)
+        if command == "refc_import":
+            changes.append(output_diff)
+    return changes
@@ -0,0 +1,240 @@
+import os
+import mmap
+import struct
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+
+# 紧凑只读依赖图编码（CSR）：模块名被驻留为整数 id，邻接关系存为 offsets/targets 两个 uint32 数组。
+# 布局：header | offsets[n_nodes+1] | targets[n_edges] | name_offsets[n_nodes+1] | names(utf-8)
+# 前 n_keys 个节点是图中的模块（有出边表），其余是仅作为导入目标出现的外部模块；两段各自按 utf-8 字节序排序，
+# 因此 worker 通过二分查找即可定位模块名，无需反序列化或建立字典。
+MAGIC = b"PRGR"
+VERSION = 1
+_HEADER = struct.Struct("<4sIIIII")
+_ITEM = 4
+
+GraphHandle = Tuple[str, str]
+
+
+def encode_graph(graph: Dict[str, Set[str]]) -> bytes:
+    keys = sorted(graph, key=lambda n: n.encode("utf-8"))
+    key_set = set(keys)
+    externals = sorted({d for deps in graph.values() for d in deps if d not in key_set}, key=lambda n: n.encode("utf-8"))
+    names = keys + externals
+    ids = {n: i for i, n in enumerate(names)}
+    offsets: List[int] = [0]
+    targets: List[int] = []
+    for n in keys:
+        targets.extend(sorted(ids[d] for d in graph[n]))
+        offsets.append(len(targets))
+    for _ in externals:
+        offsets.append(len(targets))
+    name_offsets: List[int] = [0]
+    blob = bytearray()
+    for n in names:
+        blob += n.encode("utf-8")
+        name_offsets.append(len(blob))
+    header = _HEADER.pack(MAGIC, VERSION, len(names), len(keys), len(targets), len(blob))
+    fmt = f"<{len(offsets)}I{len(targets)}I{len(name_offsets)}I"
+    return header + struct.pack(fmt, *offsets, *targets, *name_offsets) + bytes(blob)
+
+
+class CSRGraph(Mapping):
+    """基于共享缓冲区的只读依赖图视图，提供与 Dict[str, Set[str]] 相同的读取接口
+
+    序列化时只传递句柄（共享内存名或文件路径），接收方重新 attach 而不复制图数据。
+    """
+
+    def __init__(self, buf, handle: Optional[GraphHandle] = None, owner=None):
+        self._owner = owner
+        self._handle = handle
+        self._buf = memoryview(buf)
+        magic, version, n_nodes, n_keys, n_edges, names_len = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("不是有效的依赖图编码")
+        self.n_nodes = n_nodes
+        self.n_keys = n_keys
+        self.n_edges = n_edges
+        pos = _HEADER.size
+        self._offsets = self._buf[pos:pos + (n_nodes + 1) * _ITEM].cast("I")
+        pos += (n_nodes + 1) * _ITEM
+        self._targets = self._buf[pos:pos + n_edges * _ITEM].cast("I")
+        pos += n_edges * _ITEM
+        self._name_offsets = self._buf[pos:pos + (n_nodes + 1) * _ITEM].cast("I")
+        pos += (n_nodes + 1) * _ITEM
+        self._names = self._buf[pos:pos + names_len]
+
+    def __reduce__(self):
+        if self._handle is None:
+            raise TypeError("未绑定共享句柄的 CSRGraph 不能被序列化")
+        return attach, (self._handle,)
+
+    @property
+    def handle(self) -> Optional[GraphHandle]:
+        return self._handle
+
+    def tobytes(self) -> bytes:
+        """返回完整编码（例如通过网络发送给远程 worker）"""
+        return self._buf.tobytes()
+
+    def _name_bytes(self, i: int) -> bytes:
+        return bytes(self._names[self._name_offsets[i]:self._name_offsets[i + 1]])
+
+    def name(self, i: int) -> str:
+        return self._name_bytes(i).decode("utf-8")
+
+    def _search(self, key: bytes, lo: int, hi: int) -> int:
+        while lo < hi:
+            mid = (lo + hi) // 2
+            cur = self._name_bytes(mid)
+            if cur < key:
+                lo = mid + 1
+            elif cur > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def node_id(self, name: str) -> int:
+        key = name.encode("utf-8")
+        i = self._search(key, 0, self.n_keys)
+        if i < 0:
+            i = self._search(key, self.n_keys, self.n_nodes)
+        return i
+
+    def successors(self, i: int) -> memoryview:
+        return self._targets[self._offsets[i]:self._offsets[i + 1]]
+
+    def reachable(self, src: str, dst: str) -> bool:
+        if src == dst:
+            return True
+        s = self.node_id(src)
+        d = self.node_id(dst)
+        if s < 0 or d < 0:
+            return False
+        seen = bytearray(self.n_nodes)
+        stack = [s]
+        while stack:
+            cur = stack.pop()
+            if cur == d:
+                return True
+            if seen[cur]:
+                continue
+            seen[cur] = 1
+            stack.extend(self.successors(cur))
+        return False
+
+    def __getitem__(self, name: str) -> FrozenSet[str]:
+        i = self._search(name.encode("utf-8"), 0, self.n_keys)
+        if i < 0:
+            raise KeyError(name)
+        return frozenset(self.name(t) for t in self.successors(i))
+
+    def __contains__(self, name) -> bool:
+        return isinstance(name, str) and self._search(name.encode("utf-8"), 0, self.n_keys) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.name(i) for i in range(self.n_keys))
+
+    def __len__(self) -> int:
+        return self.n_keys
+
+    def release(self) -> None:
+        """释放对底层缓冲区的引用，之后才能关闭共享内存或 mmap"""
+        for view in (self._names, self._name_offsets, self._targets, self._offsets, self._buf):
+            view.release()
+
+
+def _open_shm(name: str):
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 没有 track 参数；本进程的子进程共享父进程的 resource tracker，注册是幂等的
+        return shared_memory.SharedMemory(name=name)
+
+
+# 常驻 worker 池中每个批次都会重新反序列化句柄，按句柄缓存最近 attach 的图以免反复映射。共享内存名每次创建都不同，因此缓存不会取到过期内容；
+# 文件可能被原地替换，缓存键中带上文件的 stat 签名。
+_ATTACHED: "OrderedDict[tuple, CSRGraph]" = OrderedDict()
+_ATTACH_CACHE_SIZE = 4
+
+
+def attach(handle: GraphHandle) -> CSRGraph:
+    kind, location = handle
+    if kind not in ("shm", "file", "index"):
+        raise ValueError(f"未知的图句柄类型: {kind}")
+    key: tuple = handle
+    if kind != "shm":
+        st = os.stat(location)
+        key = (handle, st.st_mtime_ns, st.st_size, st.st_ino)
+    graph = _ATTACHED.get(key)
+    if graph is not None:
+        _ATTACHED.move_to_end(key)
+        return graph
+    if kind == "shm":
+        shm = _open_shm(location)
+        graph = CSRGraph(shm.buf, handle=handle, owner=shm)
+    elif kind == "file":
+        graph = open_graph_file(location)
+    else:
+        from .graph_index import open_index_graph
+        graph = open_index_graph(location)
+    _ATTACHED[key] = graph
+    while len(_ATTACHED) > _ATTACH_CACHE_SIZE:
+        _, old = _ATTACHED.popitem(last=False)
+        old.release()
+        old._owner.close()
+    return graph
+
+
+def write_graph_file(graph: Dict[str, Set[str]], path: str) -> None:
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(encode_graph(graph))
+    os.replace(tmp, path)
+
+
+def open_graph_file(path: str) -> CSRGraph:
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return CSRGraph(mm, handle=("file", os.path.abspath(path)), owner=mm)
+
+
+class SharedGraph:
+    """将依赖图放入共享内存（或 path 指定的 mmap 文件），供 worker 零拷贝 attach
+
+    用法：
+        with SharedGraph(graph) as shared:
+            run_ordered(func, tasks, jobs=4, context=shared.graph)
+    """
+
+    def __init__(self, graph: Dict[str, Set[str]], path: Optional[str] = None):
+        self._shm = None
+        self._path = path
+        if path:
+            write_graph_file(graph, path)
+            self.graph = open_graph_file(path)
+        else:
+            from multiprocessing import shared_memory
+            data = encode_graph(graph)
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+            self._shm.buf[:len(data)] = data
+            self.graph = CSRGraph(self._shm.buf, handle=("shm", self._shm.name))
+
+    def close(self) -> None:
+        self.graph.release()
+        owner = self.graph._owner
+        if owner is not None:
+            owner.close()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self) -> "SharedGraph":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,113 @@
+import ast
+from typing import Any, Dict, List, Optional
+
+# 符号级导入索引：每个文件导入的名字（绑定位置）以及这些名字的使用位置，区分模块级和函数级。
+# 与依赖图在同一次 ast 解析中扫描（见 graph_index.py），随依赖图索引持久保存。
+# 名字按模块内最后一次导入解析，不区分被局部变量遮蔽的情况。
+
+MODULE = "module"
+FUNCTION = "function"
+
+
+class _SymbolVisitor(ast.NodeVisitor):
+    """bindings 为空时收集导入绑定，否则按 bindings 收集使用位置"""
+
+    def __init__(self, module_name: str, is_init: bool, bindings: Optional[Dict[str, str]] = None):
+        self.module_name = module_name
+        self.is_init = is_init
+        self.targets = bindings
+        self.bindings: List[List[Any]] = []
+        self.uses: List[List[Any]] = []
+        self._depth = 0
+
+    @property
+    def scope(self) -> str:
+        return FUNCTION if self._depth else MODULE
+
+    def _bind(self, name: str, target: str, node: ast.AST) -> None:
+        if self.targets is None:
+            self.bindings.append([name, target, node.lineno, self.scope])
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            if alias.asname:
+                self._bind(alias.asname, alias.name, node)
+            else:
+                # import a.b.c 绑定的是 a
+                top = alias.name.split(".")[0]
+                self._bind(top, top, node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        from .deps import resolve_relative_pkg
+        base = resolve_relative_pkg(self.module_name, node.level or 0, node.module, self.is_init)
+        if not base:
+            return
+        for alias in node.names:
+            if alias.name != "*":
+                self._bind(alias.asname or alias.name, f"{base}.{alias.name}", node)
+
+    def _function(self, node: ast.AST) -> None:
+        # 装饰器、默认值和注解在定义时求值，属于外层作用域
+        for decorator in getattr(node, "decorator_list", []):
+            self.visit(decorator)
+        self.visit(node.args)
+        if getattr(node, "returns", None) is not None:
+            self.visit(node.returns)
+        self._depth += 1
+        for stmt in node.body if isinstance(node.body, list) else [node.body]:
+            self.visit(stmt)
+        self._depth -= 1
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_Lambda = _function
+
+    def _use(self, name: str, qualified: str, node: ast.AST) -> None:
+        self.uses.append([name, qualified, node.lineno, self.scope])
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        chain: List[str] = []
+        cur: ast.AST = node
+        while isinstance(cur, ast.Attribute):
+            chain.append(cur.attr)
+            cur = cur.value
+        if self.targets and isinstance(cur, ast.Name) and isinstance(cur.ctx, ast.Load) and cur.id in self.targets:
+            # 记录最长的属性链，例如 np.linalg.norm -> numpy.linalg.norm
+            self._use(cur.id, ".".join([self.targets[cur.id]] + chain[::-1]), node)
+            return
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if self.targets and isinstance(node.ctx, ast.Load) and node.id in self.targets:
+            self._use(node.id, self.targets[node.id], node)
+
+    def visit_Assign(self, node: ast.Assign) -> None:
+        # __all__ 中列出的名字视为被使用（重新导出）
+        if self.targets and any(isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets) and isinstance(node.value, (ast.List, ast.Tuple)):
+            for elt in node.value.elts:
+                if isinstance(elt, ast.Constant) and elt.value in self.targets:
+                    self._use(elt.value, self.targets[elt.value], elt)
+        self.generic_visit(node)
+
+
+def scan_symbols(tree: ast.Module, module_name: str, is_init: bool) -> Dict[str, List[List[Any]]]:
+    """文件的符号索引：{"bindings": [[名字, 导入目标, 行号, 作用域]], "uses": [[名字, 完整名, 行号, 作用域]]}
+
+    作用域为 "module"（含类体）或 "function"；完整名是使用处属性链展开后的名字，例如 os.path.join。
+    """
+    collector = _SymbolVisitor(module_name, is_init)
+    collector.visit(tree)
+    targets = {name: target for name, target, _, _ in collector.bindings}
+    users = _SymbolVisitor(module_name, is_init, targets)
+    if targets:
+        users.visit(tree)
+    return {"bindings": collector.bindings, "uses": users.uses}
+
+
+def unused_bindings(symbols: Dict[str, List[List[Any]]]) -> List[List[Any]]:
+    """没有任何使用位置的导入绑定"""
+    used = {name for name, _, _, _ in symbols["uses"]}
+    return [b for b in symbols["bindings"] if b[0] not in used]
+
+
+def matches(qualified: str, name: str) -> bool:
+    """qualified 是否就是 name 或其属性/子模块"""
+    return qualified == name or qualified.startswith(name + ".")
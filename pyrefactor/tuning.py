@@ -0,0 +1,143 @@
+import os
+import math
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from .parallel import _call_batch, _make_pool, resolve_backend
+
+# --jobs auto 的校准：先在主进程中解析一小批抽样文件，测出每字节的处理代价（含读文件，
+# 因此 NFS 等慢速存储上的 I/O 也计入代价），再启动一个 worker 测出池启动和每批次往返的 IPC 开销，
+# 据此选择 worker 数和批大小。
+
+SAMPLE_SIZE = 8
+# 每批次的 IPC 开销不超过该批处理代价的比例
+IPC_BUDGET = 0.05
+# 每个 worker 至少分到的批次数，保证负载能被小批次填平
+MIN_BATCHES_PER_WORKER = 4
+
+
+class Tuning(NamedTuple):
+    """自动调优的结果：workers 为 worker 数，batch_size 为每批文件数；file_seconds 为估计的每文件代价，
+    spawn_seconds 为 worker 池启动到完成第一批的时间，ipc_seconds 为每批次往返开销"""
+    workers: int
+    batch_size: int
+    file_seconds: float
+    spawn_seconds: float
+    ipc_seconds: float
+
+    def batches_per_worker(self, count: int) -> int:
+        return max(1, math.ceil(count / max(1, self.workers * self.batch_size)))
+
+
+class RunSummary:
+    """一次运行中各个自动调优阶段的选择和实测吞吐，以及内容去重复用结果的文件数，由 run_files 填写，CLI 在结束时输出"""
+
+    def __init__(self):
+        self.runs: List[Tuple[Tuning, int, float]] = []
+        self.dedup_hits = 0
+
+    def record(self, tuning: Tuning, files: int, seconds: float) -> None:
+        self.runs.append((tuning, files, seconds))
+
+    def record_dedup(self, hits: int) -> None:
+        self.dedup_hits += hits
+
+    def lines(self) -> List[str]:
+        out = []
+        for tuning, files, seconds in self.runs:
+            throughput = files / seconds if seconds > 0 else float("inf")
+            measured = f"估计 {tuning.file_seconds * 1000:.2f} 毫秒/文件"
+            if tuning.spawn_seconds:
+                measured += f"，IPC {tuning.ipc_seconds * 1000:.2f} 毫秒/批"
+            else:
+                measured += "，只有 1 个 CPU 或文件，未测 IPC"
+            out.append(
+                f"自动调优: {tuning.workers} 个 worker，每批 {tuning.batch_size} 个文件（{measured}）；"
+                f"实测吞吐 {throughput:.1f} 文件/秒（{files} 个文件，{seconds:.2f} 秒）"
+            )
+        if self.dedup_hits:
+            out.append(f"内容去重: {self.dedup_hits} 个文件与先前的文件内容相同，直接复用其结果")
+        return out
+
+
+def _noop(_context, item):
+    return item
+
+
+def _sample(paths: Sequence[str], sizes: Sequence[int], size: int) -> List[int]:
+    """按文件大小排序后等距抽样，覆盖从小到大的各种文件"""
+    order = sorted(range(len(paths)), key=lambda i: (sizes[i], i))
+    if len(order) <= size:
+        return order
+    step = (len(order) - 1) / (size - 1)
+    return sorted({order[round(k * step)] for k in range(size)})
+
+
+def measure_file_seconds(paths: Sequence[str], sample_size: int = SAMPLE_SIZE) -> float:
+    """读取并用 libcst 解析抽样文件，按字节数把抽样代价外推为全部文件的平均每文件代价"""
+    import libcst as cst
+    sizes = []
+    for p in paths:
+        try:
+            sizes.append(os.path.getsize(p))
+        except OSError:
+            sizes.append(0)
+    picked = _sample(paths, sizes, sample_size)
+    start = time.perf_counter()
+    for i in picked:
+        try:
+            with open(paths[i], "r", encoding="utf-8") as f:
+                cst.parse_module(f.read())
+        except Exception:
+            pass  # 无法读取或解析的文件同样计入代价
+    elapsed = time.perf_counter() - start
+    sampled_bytes = sum(sizes[i] for i in picked)
+    if sampled_bytes <= 0:
+        return elapsed / max(1, len(picked))
+    return elapsed / sampled_bytes * sum(sizes) / len(paths)
+
+
+def measure_ipc(backend: str, rounds: int = 5) -> Tuple[float, float]:
+    """启动单 worker 的池，返回 (启动并完成第一批的秒数, 之后每批次往返的平均秒数)"""
+    start = time.perf_counter()
+    with _make_pool(backend, 1, None) as executor:
+        executor.submit(_call_batch, _noop, None, [None]).result()
+        spawn = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(rounds):
+            executor.submit(_call_batch, _noop, None, [None]).result()
+        ipc = (time.perf_counter() - start) / rounds
+    return spawn, ipc
+
+
+def choose(count: int, max_workers: int, file_seconds: float, spawn_seconds: float, ipc_seconds: float) -> Tuning:
+    """根据测得的代价选择 worker 数和批大小
+
+    每个 worker 至少要分到相当于一次池启动开销的工作量，否则并行得不偿失；
+    批大小取使 IPC 开销不超过批处理代价 IPC_BUDGET 的最小值，同时保证每个 worker 至少有
+    MIN_BATCHES_PER_WORKER 个批次用于均衡负载。
+    """
+    total = file_seconds * count
+    workers = 1
+    if spawn_seconds > 0:
+        workers = int(total // spawn_seconds)
+    elif total > 0:
+        workers = max_workers
+    workers = max(1, min(max_workers, count, workers))
+    if workers <= 1:
+        return Tuning(1, max(1, count), file_seconds, spawn_seconds, ipc_seconds)
+    batch = math.ceil(ipc_seconds / (IPC_BUDGET * file_seconds)) if file_seconds > 0 else count
+    batch = max(1, min(batch, count // (workers * MIN_BATCHES_PER_WORKER)))
+    return Tuning(workers, batch, file_seconds, spawn_seconds, ipc_seconds)
+
+
+def autotune(paths: Sequence[str], max_workers: Optional[int] = None, backend: str = "auto") -> Tuning:
+    """对即将处理的文件做一次短暂校准，返回选定的 worker 数和批大小（max_workers 默认为 CPU 数）"""
+    max_workers = max_workers or os.cpu_count() or 1
+    if not paths:
+        return Tuning(1, 1, 0.0, 0.0, 0.0)
+    file_seconds = measure_file_seconds(paths)
+    if len(paths) <= 1 or max_workers <= 1:
+        return Tuning(1, len(paths), file_seconds, 0.0, 0.0)
+    spawn_seconds, ipc_seconds = measure_ipc(resolve_backend(backend))
+    return choose(len(paths), max_workers, file_seconds, spawn_seconds, ipc_seconds)
@@ -0,0 +1,46 @@
+import os
+import subprocess
+from typing import List, Optional, Set
+
+# --since / --staged：用本地 git 仓库确定需要转换的文件。只限制被转换的文件，
+# 依赖图仍覆盖整个根目录，成环判断不受影响。
+
+
+def _git(cwd: str, *args: str) -> str:
+    try:
+        proc = subprocess.run(["git", "-C", cwd, *args], capture_output=True, text=True)
+    except OSError as e:
+        raise ValueError(f"无法运行 git: {e}")
+    if proc.returncode != 0:
+        raise ValueError(f"git {' '.join(args)} 失败: {proc.stderr.strip()}")
+    return proc.stdout
+
+
+def _paths(top: str, output: str) -> List[str]:
+    return [os.path.join(top, name) for name in output.split("\0") if name.endswith(".py")]
+
+
+def changed_files(path: str, since: Optional[str] = None, staged: bool = False) -> Set[str]:
+    """path 所在仓库中被改动的 .py 文件（绝对路径），已删除的文件不计入
+
+    since: 自该 ref 与 HEAD 的合并基以来改动的文件，包括已提交、未提交和未跟踪的文件
+    staged: 暂存区中相对 HEAD 改动的文件
+    两者都给出时取并集。
+    """
+    cwd = path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path))
+    top = _git(cwd, "rev-parse", "--show-toplevel").strip()
+    files: List[str] = []
+    if since:
+        base = _git(top, "merge-base", since, "HEAD").strip()
+        files += _paths(top, _git(top, "diff", "--name-only", "-z", "--diff-filter=ACMR", base, "--"))
+        files += _paths(top, _git(top, "ls-files", "--others", "--exclude-standard", "-z"))
+    if staged:
+        files += _paths(top, _git(top, "diff", "--cached", "--name-only", "-z", "--diff-filter=ACMR", "--"))
+    return {os.path.realpath(p) for p in files}
+
+
+def select_only(paths: List[str], only: Optional[Set[str]]) -> List[str]:
+    """保留 paths 中属于 only（changed_files 的结果）的路径；only 为 None 时全部保留"""
+    if only is None:
+        return paths
+    return [p for p in paths if os.path.realpath(p) in only]
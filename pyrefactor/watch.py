@@ -0,0 +1,299 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# --watch：监视根目录下的 .py 文件，只重新解析变化的文件，就地修补导入图 / 防御式 try 的发现，
+# 并只输出变化量（"+ " 为新增行，"- " 为消失的行）。Linux 上优先使用 inotify（通过 ctypes 调用 libc），
+# 不可用时退回按 mtime 轮询。两种监视器都跳过 __pycache__ 和以点开头的目录。
+
+Emit = Callable[[str], None]
+
+
+def _skip_dir(name: str) -> bool:
+    return name == "__pycache__" or name.startswith(".")
+
+
+def _walk_py(root: str) -> Iterable[str]:
+    if os.path.isfile(root):
+        yield root
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not _skip_dir(d)]
+        for fn in filenames:
+            if fn.endswith(".py"):
+                yield os.path.join(dirpath, fn)
+
+
+class PollingWatcher:
+    """按 interval 秒轮询 stat 签名（mtime_ns, size）的监视器"""
+
+    def __init__(self, root: str, interval: float = 0.5):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot: Dict[str, Tuple[int, int]] = {}
+        for path in _walk_py(self.root):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """阻塞直到有文件新增、修改或删除，返回这些路径；timeout 秒内没有变化时返回空集合"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(self.interval)
+            snapshot = self._scan()
+            changed = {p for p in snapshot.keys() | self._snapshot.keys() if snapshot.get(p) != self._snapshot.get(p)}
+            self._snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self) -> None:
+        pass
+
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """基于 inotify 的监视器：事件直接给出变化的路径，无需扫描整棵树
+
+    新建的子目录会自动加入监视；事件队列溢出时退回一次全量扫描，返回当前全部 .py 文件和已知文件。
+    """
+
+    def __init__(self, root: str, debounce: float = 0.05):
+        import ctypes
+        import ctypes.util
+        self.root = root
+        self.debounce = debounce
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._dirs: Dict[int, str] = {}
+        self._known: Set[str] = set()
+        self._add_tree(root)
+
+    def _add_dir(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd >= 0:
+            self._dirs[wd] = path
+
+    def _add_tree(self, root: str) -> Set[str]:
+        found: Set[str] = set()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not _skip_dir(d)]
+            self._add_dir(dirpath)
+            found.update(os.path.join(dirpath, fn) for fn in filenames if fn.endswith(".py"))
+        self._known |= found
+        return found
+
+    def _read(self) -> Optional[Set[str]]:
+        changed: Set[str] = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return changed
+                raise
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+                pos += _EVENT.size + length
+                if mask & _IN_Q_OVERFLOW:
+                    return None
+                parent = self._dirs.get(wd)
+                if parent is None or not name:
+                    continue
+                path = os.path.join(parent, name)
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO) and not _skip_dir(name):
+                        changed |= self._add_tree(path)
+                    elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                        prefix = path + os.sep
+                        changed |= {p for p in self._known if p.startswith(prefix)}
+                elif name.endswith(".py"):
+                    changed.add(path)
+                    self._known.add(path)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if not ready:
+                return set()
+            # 编辑器保存通常产生一串事件，稍等片刻合并为一批
+            time.sleep(self.debounce)
+            changed = self._read()
+            if changed is None:
+                previous = set(self._known)
+                return previous | self._add_tree(self.root)
+            if changed:
+                return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def open_watcher(root: str, interval: float = 0.5, use_inotify: bool = True) -> Any:
+    """目录且平台支持时使用 inotify，否则（单个文件、非 Linux、inotify 监视数耗尽等）按 interval 轮询"""
+    if use_inotify and sys.platform.startswith("linux") and os.path.isdir(root):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root, interval)
+
+
+def _graph_lines(state: Any) -> List[str]:
+    if state is None or state.edges is None:
+        return []
+    lines = [f'    "{state.graph_name}"']
+    lines.extend(f'    "{a}" --> "{b}"' for a, b in sorted(state.edges))
+    return lines
+
+
+def _cycle_line(cycle: Tuple[str, ...]) -> str:
+    return "%% 导入环: " + ", ".join(cycle)
+
+
+def watch_import_graph(root: str, watcher: Any, emit: Emit = print, rounds: Optional[int] = None) -> None:
+    """输出完整的 Mermaid 导入图及当前的导入环，之后每批文件变化只输出增减的节点、边和导入环
+
+    rounds 为处理的变化批次数（None 表示一直运行，直到被中断）。
+    """
+    from .deps import import_cycles
+    from .graph import render_import_graph
+    from .workspace import Workspace
+    ws = Workspace(root)
+    ws.refresh()
+    # 同一行可能来自多个文件（例如 pkg.py 与 pkg/__init__.py），按贡献计数
+    counts: Counter = Counter()
+    nodes: Set[str] = set()
+    edges: Set[Tuple[str, str]] = set()
+    for rel in ws.order:
+        state = ws.files[rel]
+        counts.update(_graph_lines(state))
+        if state.edges is not None:
+            nodes.add(state.graph_name)
+            edges |= state.edges
+    emit(render_import_graph(nodes, edges))
+    cycles = set(import_cycles(ws.graph))
+    for cycle in sorted(cycles):
+        emit(_cycle_line(cycle))
+    done = 0
+    while rounds is None or done < rounds:
+        changes = ws.update(watcher.wait())
+        if not changes:
+            continue
+        done += 1
+        removed: List[str] = []
+        added: List[str] = []
+        for _, old, new in changes:
+            for line in _graph_lines(old):
+                counts[line] -= 1
+                if not counts[line]:
+                    del counts[line]
+                    removed.append(line)
+            for line in _graph_lines(new):
+                counts[line] += 1
+                if counts[line] == 1:
+                    added.append(line)
+        # 同一批中先消失后又出现的行不算变化
+        both = set(removed) & set(added)
+        current = set(import_cycles(ws.graph))
+        out = [f"- {line}" for line in sorted(set(removed) - both)]
+        out += [f"- {_cycle_line(c)}" for c in sorted(cycles - current)]
+        out += [f"+ {line}" for line in sorted(set(added) - both)]
+        out += [f"+ {_cycle_line(c)}" for c in sorted(current - cycles)]
+        cycles = current
+        for line in out:
+            emit(line)
+
+
+def split_findings(output: str) -> List[str]:
+    """把防御式 try 检查截获的输出拆成逐条发现：以缩进开头的行（原因）归入上一条"""
+    findings: List[str] = []
+    for line in output.splitlines():
+        if line.startswith("  ") and findings:
+            findings[-1] += "\n" + line
+        elif line:
+            findings.append(line)
+    return findings
+
+
+def watch_defensive_try(
+    path: str,
+    watcher: Any,
+    max_try_length: int = 30,
+    check_print_log: bool = True,
+    check_rethrow: bool = True,
+    check_return_none: bool = True,
+    jobs: Any = 1,
+    emit: Emit = print,
+    rounds: Optional[int] = None,
+) -> None:
+    """先完整运行一次 remove_defensive_try --dry-run 并输出结果，之后只重新检查变化的文件，输出增减的发现
+
+    rounds 含义同 watch_import_graph。
+    """
+    from .defensive_try_except import collect_files, _defensive_file_task
+    from .parallel import run_files
+    context = (max_try_length, True, False, check_print_log, check_rethrow, check_return_none, 1, "auto")
+    file_paths = collect_files(path)
+    findings: Dict[str, List[str]] = {}
+    for file_path, (_, _, output) in zip(file_paths, run_files(_defensive_file_task, file_paths, file_paths, jobs=jobs, context=context)):
+        if output:
+            emit(output.rstrip("\n"))
+        findings[os.path.abspath(file_path)] = split_findings(output)
+    display = {os.path.abspath(p): p for p in file_paths}
+    done = 0
+    while rounds is None or done < rounds:
+        changed = watcher.wait()
+        out: List[str] = []
+        for file_path in sorted(changed):
+            key = os.path.abspath(file_path)
+            if os.path.exists(file_path):
+                shown = display.setdefault(key, file_path)
+                _, _, output = _defensive_file_task(context, shown)
+                current = split_findings(output)
+            else:
+                current = []
+            previous = findings.get(key, [])
+            if current == previous:
+                continue
+            findings[key] = current
+            out += [f"- {f}" for f in previous if f not in current]
+            out += [f"+ {f}" for f in current if f not in previous]
+        if not out:
+            continue
+        done += 1
+        # 原因行多缩进两格，与 "+ " / "- " 前缀后的发现对齐
+        for finding in out:
+            emit(finding.replace("\n", "\n  "))
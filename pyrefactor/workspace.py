@@ -0,0 +1,222 @@
+import os
+import ast
+import difflib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# 根目录的热缓存：文件索引（stat 签名）、源码、ast 导入扫描结果、按需解析的 libcst 模块和依赖图。
+# 常驻服务（daemon.py）和 --watch（watch.py）共用；顶层只依赖标准库，分析模块和 libcst 按需导入。
+
+
+class _FileState:
+    """单个文件的缓存：stat 签名变化时整体失效"""
+
+    __slots__ = ("signature", "source", "module_name", "graph_name", "deps", "edges", "cst_module", "results")
+
+    def __init__(self, signature: Tuple[int, int, int], source: Optional[str], module_name: str, graph_name: str, is_init: bool):
+        self.signature = signature
+        self.source = source
+        self.module_name = module_name
+        self.graph_name = graph_name
+        self.deps: Optional[Set[str]] = None
+        self.edges: Optional[Set[Tuple[str, str]]] = None
+        self.cst_module: Any = None
+        # (选项..., 显示路径) -> (是否变化, diff, 新源码)，依赖图变化时清空
+        self.results: Dict[Tuple[Any, ...], Tuple[bool, str, Optional[str]]] = {}
+        if source is None:
+            return
+        from .deps import _imports_in_module
+        from .graph import import_edges
+        try:
+            tree = ast.parse(source)
+        except Exception:
+            return
+        self.deps = _imports_in_module(tree, module_name, is_init)
+        self.edges = import_edges(tree, graph_name)
+
+
+def _signature(st: os.stat_result) -> Tuple[int, int, int]:
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class Workspace:
+    """一个根目录的热缓存：文件索引、源码与 ast 扫描结果、libcst 模块、依赖图
+
+    与 collect_tasks/build_dependency_graph/build_import_graph_mermaid 使用相同的遍历顺序和模块命名，
+    因此结果与 CLI 一致。非线程安全，由 Daemon 串行调用。
+    """
+
+    def __init__(self, root: str, package_paths: Optional[List[str]] = None):
+        self.root = os.path.abspath(root)
+        self.package_paths = [os.path.abspath(p) for p in package_paths] if package_paths else None
+        self.files: Dict[str, _FileState] = {}
+        self.order: List[str] = []
+        self.graph: Dict[str, Set[str]] = {}
+        self.graph_version = 0
+        self._reachability: Optional[Tuple[int, Any]] = None
+
+    def _load(self, path: str, signature: Tuple[int, int, int]) -> _FileState:
+        from .deps import module_name_from_path, module_name_from_path_multi
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                source = f.read()
+        except (OSError, UnicodeDecodeError):
+            source = None
+        roots = self.package_paths or [self.root]
+        return _FileState(signature, source, module_name_from_path_multi(path, roots), module_name_from_path(path, self.root), os.path.basename(path) == "__init__.py")
+
+    def _graph_changed(self) -> None:
+        self.graph_version += 1
+        for state in self.files.values():
+            state.results.clear()
+
+    def refresh(self) -> int:
+        """stat 整棵树，重新读取变化的文件并在依赖图变化时使缓存的转换结果失效；返回重新读取的文件数"""
+        order: List[str] = []
+        files: Dict[str, _FileState] = {}
+        reread = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d != "__pycache__" and not d.startswith(".")]
+            for fn in filenames:
+                if not fn.endswith(".py"):
+                    continue
+                path = os.path.join(dirpath, fn)
+                try:
+                    signature = _signature(os.stat(path))
+                except OSError:
+                    continue
+                rel = os.path.relpath(path, self.root)
+                state = self.files.get(rel)
+                if state is None or state.signature != signature:
+                    state = self._load(path, signature)
+                    reread += 1
+                order.append(rel)
+                files[rel] = state
+        self.order = order
+        self.files = files
+        graph: Dict[str, Set[str]] = {}
+        for rel in order:
+            state = files[rel]
+            if state.deps is not None:
+                graph[state.module_name] = state.deps
+        if graph != self.graph:
+            self.graph = graph
+            self._graph_changed()
+        return reread
+
+    def update(self, paths: Iterable[str]) -> List[Tuple[str, Optional[_FileState], Optional[_FileState]]]:
+        """只重新 stat 给定的文件（例如文件监视器报告的路径），就地修补文件索引和依赖图
+
+        返回实际变化的 (相对路径, 旧状态, 新状态)，新增文件旧状态为 None，删除的文件新状态为 None。
+        新增文件追加在 order 末尾，下一次 refresh 会恢复遍历顺序。
+        """
+        changes: List[Tuple[str, Optional[_FileState], Optional[_FileState]]] = []
+        for path in paths:
+            rel = os.path.relpath(os.path.abspath(path), self.root)
+            parts = rel.split(os.sep)
+            if not rel.endswith(".py") or parts[0] == os.pardir or any(p == "__pycache__" or p.startswith(".") for p in parts[:-1]):
+                continue
+            old = self.files.get(rel)
+            try:
+                signature = _signature(os.stat(os.path.join(self.root, rel)))
+            except OSError:
+                signature = None
+            if signature is None:
+                if old is None:
+                    continue
+                del self.files[rel]
+                self.order.remove(rel)
+                new = None
+            else:
+                if old is not None and old.signature == signature:
+                    continue
+                new = self._load(os.path.join(self.root, rel), signature)
+                if old is None:
+                    self.order.append(rel)
+                self.files[rel] = new
+            changes.append((rel, old, new))
+        graph_changed = False
+        for rel, old, new in changes:
+            if old is not None and old.deps is not None and (new is None or new.module_name != old.module_name):
+                self.graph.pop(old.module_name, None)
+                graph_changed = True
+            if new is not None and new.deps is not None:
+                if self.graph.get(new.module_name) != new.deps:
+                    graph_changed = True
+                self.graph[new.module_name] = new.deps
+            elif new is not None and self.graph.pop(new.module_name, None) is not None:
+                graph_changed = True
+        if graph_changed:
+            self._graph_changed()
+        return changes
+
+    def reachability(self) -> Any:
+        """当前依赖图的 deps.ReachabilityIndex，依赖图变化后下次使用时重建"""
+        if self._reachability is None or self._reachability[0] != self.graph_version:
+            from .deps import ReachabilityIndex
+            self._reachability = (self.graph_version, ReachabilityIndex(self.graph))
+        return self._reachability[1]
+
+    def _transform(self, state: _FileState, rel: str, display: str, include_relative: bool, allow_control_blocks: bool, failfirst: bool) -> Tuple[bool, str, Optional[str]]:
+        key = (include_relative, allow_control_blocks, failfirst, display)
+        cached = state.results.get(key)
+        if cached is not None:
+            return cached
+        result: Tuple[bool, str, Optional[str]] = (False, "", None)
+        if state.source is not None:
+            import libcst as cst
+            from .imports_refactor import transform_module
+            if state.cst_module is None:
+                try:
+                    state.cst_module = cst.parse_module(state.source)
+                except Exception:
+                    state.cst_module = False
+            if state.cst_module is not False:
+                is_init = os.path.basename(rel) == "__init__.py"
+                new_src = transform_module(state.cst_module, state.module_name, is_init, self.reachability(), include_relative, allow_control_blocks, failfirst)
+                if new_src != state.source:
+                    diff = "".join(difflib.unified_diff(state.source.splitlines(True), new_src.splitlines(True), fromfile=display, tofile=display))
+                    result = (True, diff, new_src)
+        state.results[key] = result
+        return result
+
+    def refc_import(self, display_root: str, dry_run: bool = True, include_relative: bool = False, allow_control_blocks: bool = False, failfirst: bool = False, modify_under: Optional[str] = None) -> Dict[str, Any]:
+        """与 rewrite_directory 相同的转换；display_root 是客户端给出的根目录写法，用于拼出与 CLI 相同的文件路径
+
+        dry_run 时返回合并后的 diff；否则写回文件并返回变更文件列表。
+        """
+        self.refresh()
+        target_prefix = os.path.abspath(modify_under) if modify_under else None
+        changes: List[str] = []
+        diffs: List[str] = []
+        for rel in self.order:
+            path = os.path.join(self.root, rel)
+            if target_prefix and not path.startswith(target_prefix):
+                continue
+            state = self.files[rel]
+            display = os.path.join(display_root, rel)
+            changed, diff, new_src = self._transform(state, rel, display, include_relative, allow_control_blocks, failfirst)
+            if not changed:
+                continue
+            if dry_run:
+                if diff:
+                    diffs.append(diff)
+                continue
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(new_src)
+            state.signature = (-1, -1, -1)  # 下次请求重新读取
+            changes.append(display)
+        return {"changes": changes, "diff": "".join(diffs)}
+
+    def import_graph(self) -> str:
+        """与 build_import_graph_mermaid(root) 相同的 Mermaid 导入图"""
+        from .graph import render_import_graph
+        self.refresh()
+        nodes: Set[str] = set()
+        edges: Set[Tuple[str, str]] = set()
+        for rel in self.order:
+            state = self.files[rel]
+            if state.edges is None:
+                continue
+            nodes.add(state.graph_name)
+            edges |= state.edges
+        return render_import_graph(nodes, edges)
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pyrefactor.aio import FileResult, stream_ordered
+from pyrefactor.imports_refactor import rewrite_directory, rewrite_directory_async, rewrite_file_async
+from pyrefactor.defensive_try_except import (
+    rewrite_directory_for_defensive_try_except,
+    rewrite_directory_for_defensive_try_except_async,
+    rewrite_file_for_defensive_try_except_async,
+)
+from pyrefactor.functions import rewrite_directory_for_functions_async, rewrite_file_for_functions, rewrite_file_for_functions_async
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def _square(offset, x):
+    return x * x + offset
+
+
+async def _collect(aiter):
+    return [item async for item in aiter]
+
+
+def test_stream_ordered_keeps_order_with_bounded_window():
+    with ThreadPoolExecutor(4) as executor:
+        results = asyncio.run(_collect(stream_ordered(_square, range(100), context=1, executor=executor, limit=3)))
+    assert results == [x * x + 1 for x in range(100)]
+
+
+def test_defensive_directory_stream_matches_sync(capsys):
+    path = os.path.join(EXAMPLES, "defensive_try_except")
+    expected = rewrite_directory_for_defensive_try_except(path, max_try_length=1, dry_run=True)
+    expected_out = capsys.readouterr().out
+    with ThreadPoolExecutor(4) as executor:
+        results = asyncio.run(_collect(rewrite_directory_for_defensive_try_except_async(path, max_try_length=1, dry_run=True, executor=executor)))
+    assert all(isinstance(r, FileResult) for r in results)
+    assert [r.path for r in results if r.changed] == expected
+    assert "".join(r.output for r in results) == expected_out
+    assert capsys.readouterr().out == ""
+    assert any(r.diff for r in results)
+
+
+def test_defensive_file_async():
+    path = os.path.join(EXAMPLES, "defensive_try_except", "example_with_defensive_try.py")
+    assert asyncio.run(rewrite_file_for_defensive_try_except_async(path, max_try_length=1, dry_run=True))
+
+
+def test_import_directory_stream_matches_sync(tmp_path):
+    root = str(tmp_path / "proj")
+    shutil.copytree(os.path.join(EXAMPLES, "imports", "try_complex_project"), root)
+    diff_path = str(tmp_path / "out.diff")
+    rewrite_directory(root, dry_run=True, output_diff=diff_path, failfirst=True)
+    with open(diff_path, encoding="utf-8") as f:
+        expected = f.read()
+    with ProcessPoolExecutor(2) as executor:
+        results = asyncio.run(_collect(rewrite_directory_async(root, dry_run=True, failfirst=True, executor=executor)))
+    assert "".join(r.diff for r in results) == expected
+
+
+def test_concurrent_reviews_share_one_executor(tmp_path):
+    root = str(tmp_path / "proj")
+    shutil.copytree(os.path.join(EXAMPLES, "imports", "simple_project"), root)
+    path = os.path.join(EXAMPLES, "defensive_try_except")
+
+    async def main(executor):
+        imports, defensive, functions = await asyncio.gather(
+            _collect(rewrite_directory_async(root, dry_run=True, executor=executor)),
+            _collect(rewrite_directory_for_defensive_try_except_async(path, max_try_length=1, dry_run=True, executor=executor)),
+            _collect(rewrite_directory_for_functions_async(os.path.join(EXAMPLES, "function_splitter"), dry_run=True, executor=executor)),
+        )
+        changed, diff = await rewrite_file_async(os.path.join(root, "pkg", "module_a.py"), "pkg.module_a", {}, dry_run=True, executor=executor)
+        return imports, defensive, functions, changed
+
+    with ThreadPoolExecutor(4) as executor:
+        imports, defensive, functions, _ = asyncio.run(main(executor))
+    assert len(imports) == 3
+    assert any(r.changed for r in defensive)
+    assert len(functions) == 4
+
+
+def test_functions_file_async():
+    source = "def f():\n    return 1\n"
+    assert asyncio.run(rewrite_file_for_functions_async(source)) == rewrite_file_for_functions(source)
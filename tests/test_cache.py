@@ -0,0 +1,225 @@
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pyrefactor import cache as cache_module
+from pyrefactor.cache import ResultCache, seal, unseal
+from pyrefactor.defensive_try_except import rewrite_directory_for_defensive_try_except
+from pyrefactor.functions import rewrite_directory_for_functions
+from pyrefactor.imports_refactor import rewrite_directory
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def _copy(tmp_path, name):
+    root = tmp_path / "src"
+    shutil.copytree(os.path.join(EXAMPLES, name), root)
+    # mtime 早于 RACY_SECONDS，stat 索引才会记录这些文件
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            os.utime(os.path.join(dirpath, fn), (1_000_000_000, 1_000_000_000))
+    return str(root)
+
+
+def _defensive(root, diff, cache):
+    open(diff, "w").close()
+    changes = rewrite_directory_for_defensive_try_except(root, max_try_length=1, dry_run=True, output_diff=diff, cache=cache)
+    with open(diff, encoding="utf-8") as f:
+        return changes, f.read()
+
+
+def test_rerun_hits_and_matches_uncached_output(tmp_path, capsys):
+    root = _copy(tmp_path, "defensive_try_except")
+    diff = str(tmp_path / "run.diff")
+    expected = _defensive(root, diff, None)
+    expected_out = capsys.readouterr().out
+
+    with ResultCache(str(tmp_path / "cache")) as cache:
+        assert _defensive(root, diff, cache) == expected
+        assert capsys.readouterr().out == expected_out
+        assert cache.hits == 0 and cache.misses > 0
+    with ResultCache(str(tmp_path / "cache")) as cache:
+        assert _defensive(root, diff, cache) == expected
+        assert capsys.readouterr().out == expected_out
+        assert cache.misses == 0 and cache.hits > 0
+
+    # 同样内容的文件换了路径也能命中，输出中的路径随之替换
+    moved = str(tmp_path / "moved")
+    shutil.copytree(root, moved)
+    with ResultCache(str(tmp_path / "cache")) as cache:
+        changes, text = _defensive(moved, diff, cache)
+        assert cache.misses == 0
+    assert changes == [c.replace(root, moved) for c in expected[0]]
+    assert text == expected[1].replace(root, moved)
+
+
+def test_stat_fast_path_and_edited_file(tmp_path, monkeypatch):
+    root = _copy(tmp_path, "function_splitter")
+    with ResultCache(str(tmp_path / "cache")) as cache:
+        rewrite_directory_for_functions(root, dry_run=True, cache=cache)
+
+    hashed = []
+    real = cache_module.file_digest
+    monkeypatch.setattr(cache_module, "file_digest", lambda path: hashed.append(path) or real(path))
+    with ResultCache(str(tmp_path / "cache")) as cache:
+        rewrite_directory_for_functions(root, dry_run=True, cache=cache)
+        assert hashed == [] and cache.misses == 0
+
+    path = os.path.join(root, "example_functions.py")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\nX = 1\n")
+    with ResultCache(str(tmp_path / "cache")) as cache:
+        rewrite_directory_for_functions(root, dry_run=True, cache=cache)
+        assert hashed == [path] and cache.misses == 1
+
+
+def test_write_run_stores_only_unchanged_results(tmp_path):
+    root = tmp_path / "pkg"
+    root.mkdir()
+    (root / "__init__.py").write_text("")
+    (root / "a.py").write_text("def afunc():\n    import os\n    return os.sep\n")
+    (root / "b.py").write_text("import os\n")
+    with ResultCache(str(tmp_path / "cache")) as cache:
+        changes = rewrite_directory(str(root), cache=cache)
+    assert changes == [str(root / "a.py")]
+    # a.py 已被改写，其新内容与 b.py、__init__.py 一样没有需要提升的导入
+    with ResultCache(str(tmp_path / "cache")) as cache:
+        assert rewrite_directory(str(root), cache=cache) == []
+        assert cache.hits == 2 and cache.misses == 1
+
+
+
+def test_import_edits_only_invalidate_affected_modules(tmp_path, capsys):
+    root = tmp_path / "src"
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "__init__.py").write_text("")
+    (root / "pkg" / "a.py").write_text("def f():\n    from pkg import b\n    return b\n")
+    (root / "pkg" / "b.py").write_text("X = 1\n")
+    (root / "pkg" / "c.py").write_text("Y = 2\n")
+    cache_dir = str(tmp_path / "cache")
+    with ResultCache(cache_dir) as cache:
+        rewrite_directory(str(root), dry_run=True, cache=cache)
+
+    # c.py 新增的导入不改变能到达其他模块的模块集合，只有 c.py 自身未命中
+    (root / "pkg" / "c.py").write_text("import os\nY = 2\n")
+    with ResultCache(cache_dir) as cache:
+        rewrite_directory(str(root), dry_run=True, cache=cache)
+        assert cache.misses == 1
+    # b.py 导入 a 之后，a.py 中提升 b 会成环：a.py 的结果必须重新计算；
+    # a.py 的 `from pkg import b` 使 b 也能到达 pkg，__init__.py 同样未命中
+    (root / "pkg" / "b.py").write_text("import pkg.a\nX = 1\n")
+    capsys.readouterr()
+    expected = rewrite_directory(str(root), dry_run=True)
+    expected_out = capsys.readouterr().out
+    with ResultCache(cache_dir) as cache:
+        assert rewrite_directory(str(root), dry_run=True, cache=cache) == expected
+        assert cache.misses == 3
+    assert capsys.readouterr().out == expected_out
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1000)
+    for i in range(30):
+        cache.put(f"{i:064x}", [False, "x" * 90])
+        path = cache.local.path(f"{i:064x}")
+        os.utime(path, (i, i))
+    cache.get(f"{0:064x}")  # 最近使用过的条目保留
+    cache.close()
+    assert cache.get(f"{0:064x}") is not None
+    assert cache.get(f"{1:064x}") is None
+    assert cache.get(f"{29:064x}") is not None
+    kept = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(tmp_path / "cache" / "results") for f in fs)
+    assert kept <= 1000 * cache_module.EVICT_TO
+
+
+class _Store(BaseHTTPRequestHandler):
+    """测试用的 HTTP GET/PUT 存储"""
+    entries = {}
+
+    def do_GET(self):
+        data = self.entries.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        self.entries[self.path] = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_store():
+    _Store.entries = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Store)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/cache", _Store.entries
+    server.shutdown()
+    server.server_close()
+
+
+def test_cached_paths_only_in_headers_and_findings():
+    old, new = "/r/a.py", "/s/a.py"
+    diff = f"--- {old}\n+++ {old}.modified\n@@ -1 +1 @@\n-X = {old!r}\n+Y = {old!r}\n"
+    output = f"{old}:1 - ✓ 移除整个防御式 try-except\n"
+    # 文件内容中的路径原样保存；换到别的路径后只有 diff 头和发现的前缀随之改变
+    stored = cache_module._encode((True, diff, output), old)
+    assert repr(old) in stored[1]
+    assert cache_module._decode(stored, new) == (True, diff.replace(f"--- {old}", f"--- {new}").replace(f"+++ {old}", f"+++ {new}"), output.replace(old, new))
+
+
+def test_unseal_rejects_corrupt_entries():
+    data = seal([False, "", "out"])
+    assert unseal(data) == [False, "", "out"]
+    assert unseal(data[:-1]) is None
+    assert unseal(data.replace(b"out", b"OUT")) is None
+    assert unseal(b'[false, "", ""]') is None
+
+
+def test_shared_backends_serve_other_nodes(tmp_path, capsys, http_store):
+    root = _copy(tmp_path, "defensive_try_except")
+    diff = str(tmp_path / "run.diff")
+    expected = _defensive(root, diff, None)
+    expected_out = capsys.readouterr().out
+    url, entries = http_store
+    for shared in (url, str(tmp_path / "nfs")):
+        # 每个节点有自己的本地缓存目录，只通过共享后端交换结果
+        with ResultCache(str(tmp_path / "node1"), shared=shared) as cache:
+            _defensive(root, diff, cache)
+        with ResultCache(str(tmp_path / "node2"), shared=shared) as cache:
+            assert _defensive(root, diff, cache) == expected
+            assert capsys.readouterr().out == expected_out * 2
+            assert cache.misses == 0 and cache.hits > 0
+        shutil.rmtree(tmp_path / "node1")
+        shutil.rmtree(tmp_path / "node2")
+    assert entries
+
+    # 共享后端中写了一半或被篡改的条目不被采用，重新计算并覆盖
+    for key in list(entries):
+        entries[key] = entries[key][:-3]
+    with ResultCache(str(tmp_path / "node3"), shared=url) as cache:
+        assert _defensive(root, diff, cache) == expected
+        assert capsys.readouterr().out == expected_out
+        assert cache.hits == 0 and cache.rejected == len(entries)
+    assert all(unseal(data) is not None for data in entries.values())
+
+
+def test_unreachable_shared_backend_is_a_miss(tmp_path, capsys):
+    root = _copy(tmp_path, "defensive_try_except")
+    diff = str(tmp_path / "run.diff")
+    expected = _defensive(root, diff, None)
+    with ResultCache(str(tmp_path / "cache"), shared="http://127.0.0.1:9/cache") as cache:
+        assert _defensive(root, diff, cache) == expected
+        assert cache.hits == 0
@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+from pyrefactor.chunking import split_top_level, parse_chunk, supports_chunking
+from pyrefactor.defensive_try_except import DefensiveTryExceptTransformer, rewrite_directory_for_defensive_try_except
+from pyrefactor.imports_refactor import ImportLifter
+from pyrefactor.functions import FunctionSplitter
+
+DEFENSIVE = '''
+
+@decorator
+def func_{i}():
+    try:
+        a = 1
+        b = 2
+        c = 3
+    except Exception as e:
+        print(f"error: {{e}}")
+        return None
+
+
+if flag_{i}:
+    x = {i}
+else:
+    x = -{i}
+'''
+
+
+def _big_module(count):
+    return "import os\n" + "".join(DEFENSIVE.format(i=i) for i in range(count))
+
+
+def test_split_top_level_keeps_statements_whole():
+    src = _big_module(20)
+    chunks = split_top_level(src, 6)
+    assert len(chunks) > 1
+    assert "".join(text for _, text, _ in chunks) == src
+    for offset, text, _ in chunks:
+        assert not text.lstrip().startswith(("else", "def "))
+        assert parse_chunk((offset, text, chunks[0][2])).code == text
+
+
+def test_split_top_level_falls_back_on_tokenize_error():
+    src = "def f(:\n    pass\n" * 10
+    assert len(split_top_level(src, 4)) == 1
+
+
+def test_only_defensive_transformer_supports_chunking():
+    assert supports_chunking(DefensiveTryExceptTransformer)
+    assert not supports_chunking(ImportLifter)
+    assert not supports_chunking(FunctionSplitter)
+
+
+def test_split_large_files_matches_whole_file(capsys):
+    results = []
+    for split_lines in (None, 100):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "big.py"), "w", encoding="utf-8") as f:
+                f.write(_big_module(40))
+            with open(os.path.join(tmpdir, "small.py"), "w", encoding="utf-8") as f:
+                f.write(_big_module(1))
+            diff_path = os.path.join(tmpdir, "out.diff")
+            open(diff_path, "w").close()
+            capsys.readouterr()
+            rewrite_directory_for_defensive_try_except(tmpdir, max_try_length=2, dry_run=True, output_diff=diff_path, jobs=3, split_lines=split_lines)
+            with open(diff_path, encoding="utf-8") as f:
+                diff = f.read().replace(tmpdir, "<root>")
+            results.append((diff, capsys.readouterr().out.replace(tmpdir, "<root>")))
+    assert results[0][0]
+    assert results[0] == results[1]
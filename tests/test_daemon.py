@@ -0,0 +1,73 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+from pyrefactor.daemon import Client, RPCError, make_server, METHOD_NOT_FOUND
+from pyrefactor.graph import build_import_graph_mermaid
+from pyrefactor.imports_refactor import rewrite_directory
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+@pytest.fixture
+def client(tmp_path):
+    address = f"unix:{tmp_path / 'pyrefactor.sock'}"
+    server = make_server(address)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    with Client(address) as c:
+        yield c
+    server.shutdown()
+    server.server_close()
+
+
+def _expected_diff(root, tmp_path, **options):
+    diff_path = str(tmp_path / "expected.diff")
+    rewrite_directory(root, dry_run=True, output_diff=diff_path, **options)
+    if not os.path.exists(diff_path):
+        return ""
+    with open(diff_path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_refc_import_matches_cli_and_tracks_edits(client, tmp_path):
+    root = str(tmp_path / "proj")
+    shutil.copytree(os.path.join(EXAMPLES, "imports", "try_complex_project"), root)
+    expected = _expected_diff(root, tmp_path, failfirst=True)
+    assert expected
+    for _ in range(2):
+        result = client.call("refc_import", path=root, dry_run=True, failfirst=True)
+        assert result == {"changes": [], "diff": expected}
+
+    with open(os.path.join(root, "pkg", "opt.py"), "a", encoding="utf-8") as f:
+        f.write("\ndef later():\n    import json\n    return json\n")
+    result = client.call("refc_import", path=root, dry_run=True, failfirst=True)
+    assert result["diff"] == _expected_diff(root, tmp_path, failfirst=True)
+    assert result["diff"] != expected
+
+
+def test_refc_import_writes_files(client, tmp_path):
+    root = str(tmp_path / "proj")
+    shutil.copytree(os.path.join(EXAMPLES, "imports", "simple_project"), root)
+    expected_root = str(tmp_path / "expected")
+    shutil.copytree(root, expected_root)
+    expected = rewrite_directory(expected_root)
+    result = client.call("refc_import", path=root, dry_run=False)
+    assert [os.path.relpath(p, root) for p in result["changes"]] == [os.path.relpath(p, expected_root) for p in expected]
+    assert client.call("refc_import", path=root, dry_run=True)["diff"] == ""
+
+
+def test_graph_matches_cli_and_relative_paths(client, tmp_path):
+    root = os.path.join(EXAMPLES, "imports", "integration_project", "src")
+    assert client.call("graph", type="imports", path=root) == build_import_graph_mermaid(root)
+    cwd, name = os.path.split(os.path.abspath(root))
+    assert client.call("graph", type="imports", path=name, cwd=cwd) == build_import_graph_mermaid(root)
+    assert client.call("ping")["workspaces"] == 1
+
+
+def test_unknown_method(client):
+    with pytest.raises(RPCError) as info:
+        client.call("nope")
+    assert info.value.code == METHOD_NOT_FOUND
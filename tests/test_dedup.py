@@ -0,0 +1,125 @@
+import os
+import sys
+import shutil
+import difflib
+import subprocess
+
+from pyrefactor.dedup import retarget
+from pyrefactor.defensive_try_except import format_findings, rewrite_directory_for_defensive_try_except
+from pyrefactor.imports_refactor import rewrite_directory
+from pyrefactor.tuning import RunSummary
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), "..", "examples", "defensive_try_except", "example_with_defensive_try.py")
+
+
+def _tree(root):
+    os.makedirs(os.path.join(root, "vendor", "a"))
+    os.makedirs(os.path.join(root, "vendor", "b"))
+    for rel in ("app.py", "vendor/a/copy.py", "vendor/b/copy.py"):
+        shutil.copyfile(EXAMPLE, os.path.join(root, rel))
+    with open(os.path.join(root, "other.py"), "w", encoding="utf-8") as f:
+        f.write("x = 1\n")
+    return root
+
+
+def _read_all(root):
+    out = {}
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            with open(os.path.join(dirpath, fn), encoding="utf-8") as f:
+                out[os.path.relpath(os.path.join(dirpath, fn), root)] = f.read()
+    return out
+
+
+def _run(root, diff, dedup, dry_run=True):
+    summary = RunSummary()
+    if diff:
+        open(diff, "w").close()
+    changes = rewrite_directory_for_defensive_try_except(root, max_try_length=1, dry_run=dry_run, output_diff=diff, summary=summary, dedup=dedup)
+    text = ""
+    if diff:
+        with open(diff, encoding="utf-8") as f:
+            text = f.read()
+    return changes, text, summary
+
+
+def test_dedup_matches_individual_processing(tmp_path, capsys):
+    root = _tree(str(tmp_path / "src"))
+    expected = _run(root, str(tmp_path / "plain.diff"), dedup=False)
+    expected_out = capsys.readouterr().out
+    changes, text, summary = _run(root, str(tmp_path / "dedup.diff"), dedup=True)
+    assert capsys.readouterr().out == expected_out
+    assert (changes[:-1], text) == (expected[0][:-1], expected[1])
+    assert summary.dedup_hits == 2 and expected[2].dedup_hits == 0
+    assert "内容去重: 2 个文件" in summary.lines()[-1]
+
+
+def test_dedup_write_back(tmp_path, capsys):
+    plain = _tree(str(tmp_path / "plain"))
+    deduped = _tree(str(tmp_path / "dedup"))
+    _run(plain, None, dedup=False, dry_run=False)
+    _run(deduped, None, dedup=True, dry_run=False)
+    assert _read_all(deduped) == _read_all(plain)
+    assert _read_all(plain)["app.py"] != open(EXAMPLE, encoding="utf-8").read()
+
+
+def test_refc_import_keys_on_module_name(tmp_path):
+    pkg = tmp_path / "pkg"
+    pkg.mkdir()
+    (pkg / "__init__.py").write_text("")
+    body = "def f():\n    import pkg.c\n    return pkg.c\n"
+    (pkg / "a.py").write_text(body)
+    (pkg / "b.py").write_text(body)
+    # pkg.c 导入 pkg.a：a.py 提升会成环，b.py 不会
+    (pkg / "c.py").write_text("import pkg.a\n")
+    summary = RunSummary()
+    changes = rewrite_directory(str(tmp_path), summary=summary, dedup=True)
+    assert changes == [str(pkg / "b.py")]
+    assert (pkg / "a.py").read_text() == body
+    assert summary.dedup_hits == 0
+
+
+def test_cli_output_independent_of_cache_state(tmp_path):
+    root = _tree(str(tmp_path / "src"))
+    cmd = [sys.executable, "-m", "pyrefactor.cli", "remove_defensive_try", root, "--max-length", "1", "--dry-run", "--cache-dir", str(tmp_path / "cache")]
+    env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), ".."))
+    cold = subprocess.run(cmd, capture_output=True, text=True, env=env, check=True).stdout
+    warm = subprocess.run(cmd, capture_output=True, text=True, env=env, check=True).stdout
+    assert cold == warm and "内容去重" not in cold
+    deduped = subprocess.run(cmd + ["--no-cache", "--dedup"], capture_output=True, text=True, env=env, check=True).stdout
+    assert deduped == cold
+
+
+def test_write_back_updates_project(tmp_path):
+    from pyrefactor import Project
+    from pyrefactor.dedup import Dedup
+    root = tmp_path / "src"
+    root.mkdir()
+    paths = [str(root / "a.py"), str(root / "b.py")]
+    for p in paths:
+        with open(p, "w") as f:
+            f.write("x = 1\n")
+    project = Project(str(root))
+    assert project.source(paths[1]) == "x = 1\n"
+
+    def runner(tasks, ps):
+        for p in ps:
+            with open(p, "w") as f:
+                f.write("x = 2\n")
+            yield True, ""
+
+    assert list(Dedup(write_back=True, project=project).run(paths, paths, runner)) == [(True, ""), (True, "")]
+    assert project.source(paths[1]) == "x = 2\n" and project.tree(paths[1]) is not None
+
+
+def test_retarget_leaves_file_content_alone():
+    src, dst = "/r/a/copy.py", "/r/b/copy.py"
+    old = f"try:\n    LOG = {src!r}\nexcept Exception:\n    pass\n"
+    new = f"LOG = {src!r}\n"
+    diff = "".join(difflib.unified_diff(old.splitlines(True), new.splitlines(True), fromfile=src, tofile=f"{src}.modified"))
+    output = format_findings(src, [(1, "✓ 移除整个防御式 try-except", f"路径 {src}x")]) + f"解析文件 {src} 时出错: {src}\n"
+    changed, new_diff, new_output = retarget((True, diff, output), src, dst)
+    expected = "".join(difflib.unified_diff(old.splitlines(True), new.splitlines(True), fromfile=dst, tofile=f"{dst}.modified"))
+    # 只有 diff 头、发现的前缀和错误信息中的文件路径被替换，diff 正文和原因、错误详情中的路径保持原样
+    assert changed is True and new_diff == expected and src in new_diff
+    assert new_output == format_findings(dst, [(1, "✓ 移除整个防御式 try-except", f"路径 {src}x")]) + f"解析文件 {dst} 时出错: {src}\n"
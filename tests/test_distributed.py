@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from pyrefactor.distributed import run_coordinator, run_worker, parse_address
+from pyrefactor.defensive_try_except import collect_files, rewrite_directory_for_defensive_try_except
+from pyrefactor.imports_refactor import collect_tasks, build_dependency_graph, rewrite_directory
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def _start_workers(address, count):
+    threads = [threading.Thread(target=run_worker, args=(address,), daemon=True) for _ in range(count)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def test_parse_address():
+    assert parse_address("tcp:localhost:9000")[1] == ("localhost", 9000)
+    assert parse_address("unix:/tmp/x.sock")[1] == "/tmp/x.sock"
+
+
+def test_defensive_distributed_matches_single_run(capsys):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = os.path.join(tmpdir, "d")
+        shutil.copytree(os.path.join(EXAMPLES, "defensive_try_except"), root)
+        single_diff = os.path.join(tmpdir, "single.diff")
+        open(single_diff, "w").close()
+        single = rewrite_directory_for_defensive_try_except(root, max_try_length=2, dry_run=True, output_diff=single_diff)
+        single_out = capsys.readouterr().out
+
+        address = "unix:" + os.path.join(tmpdir, "coord.sock")
+        options = {"dry_run": True, "want_diff": True, "max_try_length": 2, "check_print_log": True, "check_rethrow": True, "check_return_none": True}
+        workers = _start_workers(address, 3)
+        merged_diff = os.path.join(tmpdir, "merged.diff")
+        tasks = [(p, "") for p in collect_files(root)]
+        changes = run_coordinator(address, "remove_defensive_try", options, tasks, output_diff=merged_diff, timeout=60)
+        for t in workers:
+            t.join(10)
+        assert changes == single
+        assert capsys.readouterr().out == single_out
+        with open(single_diff) as a, open(merged_diff) as b:
+            assert a.read() == b.read()
+
+
+def test_import_distributed_writes_edits_on_coordinator():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        expected_root = os.path.join(tmpdir, "expected")
+        root = os.path.join(tmpdir, "proj")
+        src = os.path.join(EXAMPLES, "imports", "try_complex_project")
+        shutil.copytree(src, expected_root)
+        shutil.copytree(src, root)
+        expected = rewrite_directory(expected_root, failfirst=True)
+
+        address = "unix:" + os.path.join(tmpdir, "coord.sock")
+        options = {"dry_run": False, "include_relative": False, "allow_control_blocks": False, "failfirst": True}
+        workers = _start_workers(address, 2)
+        changes = run_coordinator(address, "refc_import", options, collect_tasks(root), graph=build_dependency_graph(root), timeout=60)
+        for t in workers:
+            t.join(10)
+        assert [os.path.relpath(c, root) for c in changes] == [os.path.relpath(c, expected_root) for c in expected]
+        for rel in ("pkg/a.py", "pkg/opt.py"):
+            with open(os.path.join(expected_root, rel)) as a, open(os.path.join(root, rel)) as b:
+                assert a.read() == b.read()
+
+
+def test_missing_file_and_stale_results(capsys):
+    from pyrefactor.distributed import Coordinator, compute_entry
+    from pyrefactor.shard import replay_entries
+    with tempfile.TemporaryDirectory() as tmpdir:
+        good = os.path.join(tmpdir, "good.py")
+        with open(good, "w") as f:
+            f.write("def f():\n    import os\n    return os\n")
+        missing = os.path.join(tmpdir, "missing.py")
+        options = {"dry_run": False, "include_relative": False, "allow_control_blocks": False, "failfirst": False}
+        address = "unix:" + os.path.join(tmpdir, "coord.sock")
+        workers = _start_workers(address, 1)
+        # 无法读取的文件记为错误条目，其余文件照常完成
+        changes = run_coordinator(address, "refc_import", options, [(missing, "missing"), (good, "good")], graph={}, timeout=30)
+        for t in workers:
+            t.join(10)
+        assert changes == [good]
+        assert f"处理文件 {missing} 时出错" in capsys.readouterr().out
+
+        with open(good, "w") as f:
+            f.write("def f():\n    import json\n    return json\n")
+        coord = Coordinator("refc_import", options, [(good, "good")], graph={})
+        task = coord.task_message(coord.next_task())
+        # worker 基于别的内容算出的结果被丢弃
+        coord.complete(compute_entry("refc_import", options, {}, 0, good, "good", "def f():\n    import sys\n    return sys\n"))
+        assert not coord._entries[0]["changed"]
+        # 处理期间磁盘上的文件被修改时不写回
+        entry = compute_entry("refc_import", options, {}, 0, good, "good", task["source"])
+        assert entry["changed"] and entry["sha256"] == task["sha256"]
+        with open(good, "a") as f:
+            f.write("# edited\n")
+        assert replay_entries("refc_import", False, [entry]) == []
+        assert "在处理期间被修改，未写回" in capsys.readouterr().out
+        assert open(good).read().endswith("# edited\n")
@@ -198,7 +198,25 @@ def main_function():
             # 文件内容应该没有变化
             self.assertIn("def main_function", content)
             self.assertNotIn("def 初始化", content)
+    
+    def test_split_state_does_not_leak_between_functions(self):
+        """测试拆分状态不会在顶级函数之间串扰"""
+        source = '''def f():
+    a = 1
+    # step one
+    b = 2
+
+def g():
+    c = 1
+    # step two
+    d = 2
+'''
+        result = rewrite_file_for_functions(source)
+        self.assertEqual(result.count("def f_1()"), 1)
+        self.assertIn("def g_1()", result)
+        # g 的第一条语句不应被并入 f 的上下文
+        self.assertIn("def g():\n    c = 1\n    g_1()", result)
 
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import pickle
+import shutil
+
+from pyrefactor.deps import build_dependency_graph, would_create_cycle
+from pyrefactor.graph import build_import_graph_mermaid
+from pyrefactor.graph_index import GraphIndex
+from pyrefactor.parallel import run_ordered
+from pyrefactor.shared_graph import CSRGraph
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples", "imports")
+
+
+def _copy(tmp_path, name="integration_project"):
+    root = tmp_path / "src"
+    shutil.copytree(os.path.join(EXAMPLES, name), root)
+    _age(root)
+    return str(root)
+
+
+def _age(root):
+    # mtime 早于 RACY_SECONDS，索引才会记录签名
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            os.utime(os.path.join(dirpath, fn), (1_000_000_000, 1_000_000_000))
+
+
+def _expected(root):
+    return {k: frozenset(v) for k, v in build_dependency_graph(root).items()}
+
+
+def _cycle(graph, pair):
+    return would_create_cycle(graph, *pair)
+
+
+def test_incremental_refresh(tmp_path):
+    root = _copy(tmp_path)
+    path = str(tmp_path / "graph.idx")
+    index = GraphIndex(path, root)
+    graph = index.refresh()
+    assert isinstance(graph, CSRGraph) and dict(graph) == _expected(root)
+    assert index.parsed == len(index.files) and index.written
+
+    index = GraphIndex(path, root)
+    assert dict(index.refresh()) == _expected(root)
+    assert index.parsed == 0 and not index.written
+
+    # 只改动一个文件：只重新解析它；签名变了但内容未变的文件只重新哈希
+    rel = sorted(index.files)[0]
+    with open(os.path.join(root, rel), "a", encoding="utf-8") as f:
+        f.write("\nimport json\n")
+    os.utime(os.path.join(root, sorted(index.files)[1]), (1_000_000_001, 1_000_000_001))
+    _age(os.path.join(root, os.path.dirname(rel)))
+    index = GraphIndex(path, root)
+    graph = index.refresh()
+    assert index.parsed == 1 and dict(graph) == _expected(root)
+
+    os.unlink(os.path.join(root, rel))
+    index = GraphIndex(path, root)
+    assert dict(index.refresh()) == _expected(root) and index.parsed == 0
+
+
+def test_index_serves_import_graph_and_workers(tmp_path):
+    root = _copy(tmp_path, "cycle_project")
+    path = str(tmp_path / "graph.idx")
+    assert build_import_graph_mermaid(root, index=path) == build_import_graph_mermaid(root)
+    assert build_import_graph_mermaid(root, index=path) == build_import_graph_mermaid(root)
+
+    graph = GraphIndex(path, root).refresh()
+    # worker 按文件句柄 mmap 索引，不复制图数据
+    assert len(pickle.dumps(graph)) < 200
+    pairs = [(a, b) for a in graph for b in graph]
+    expected = [would_create_cycle(_expected(root), a, b) for a, b in pairs]
+    assert list(run_ordered(_cycle, pairs, jobs=2, context=graph)) == expected
+
+
+def test_index_is_tied_to_package_paths(tmp_path):
+    root = _copy(tmp_path, "pkgpath_project")
+    path = str(tmp_path / "graph.idx")
+    GraphIndex(path, root).refresh()
+    package_paths = [os.path.join(root, d) for d in sorted(os.listdir(root)) if os.path.isdir(os.path.join(root, d))]
+    index = GraphIndex(path, root, package_paths)
+    graph = index.refresh()
+    assert index.parsed == len(index.files)
+    assert dict(graph) == {k: frozenset(v) for k, v in build_dependency_graph(root, package_paths=package_paths).items()}
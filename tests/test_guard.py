@@ -0,0 +1,71 @@
+import os
+import time
+
+import pytest
+
+from pyrefactor import guard as guard_module
+from pyrefactor.guard import Guard, Skipped, rss_bytes
+from pyrefactor.parallel import run_ordered
+from pyrefactor.defensive_try_except import rewrite_directory_for_defensive_try_except
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def _slow_on_negative(_context, x):
+    if x < 0:
+        time.sleep(30)
+    return x * 2
+
+
+def _hog_on_negative(_context, x):
+    if x < 0:
+        block = bytearray(400 * 1024 * 1024)
+        block[::4096] = b"x" * len(block[::4096])
+        time.sleep(30)
+    return x * 2
+
+
+def _fail(_context, x):
+    raise ValueError(x)
+
+
+def test_guard_is_falsy_without_limits():
+    assert not Guard()
+    assert Guard(timeout=1.0)
+
+
+def test_timeout_skips_only_offending_item():
+    timings = {}
+    results = list(run_ordered(_slow_on_negative, [1, -1, 2, 3], jobs=2, guard=Guard(timeout=0.5), timings=timings))
+    assert results == [2, Skipped("timeout"), 4, 6]
+    assert sorted(timings) == [0, 1, 2, 3]
+
+
+def test_no_respawn_after_last_dispatch(monkeypatch):
+    spawned = []
+    real = guard_module._Slot
+    monkeypatch.setattr(guard_module, "_Slot", lambda *args: spawned.append(1) or real(*args))
+    results = list(run_ordered(_slow_on_negative, [1, 2, -1, -2], jobs=2, guard=Guard(timeout=0.5)))
+    assert results == [2, 4, Skipped("timeout"), Skipped("timeout")]
+    # 最后两个文件超时时已经没有待派发的文件，不再为它们补充 worker
+    assert len(spawned) == 2
+
+
+@pytest.mark.skipif(rss_bytes(os.getpid()) is None, reason="需要 /proc 读取 RSS")
+def test_memory_watermark_skips_offending_item():
+    results = list(run_ordered(_hog_on_negative, [-1, 5], jobs=1, guard=Guard(timeout=20, max_rss=300 * 1024 * 1024)))
+    assert results == [Skipped("memory"), 10]
+
+
+def test_guarded_errors_propagate():
+    with pytest.raises(ValueError):
+        list(run_ordered(_fail, [1], guard=Guard(timeout=5)))
+
+
+def test_guarded_directory_run_matches_unguarded(capsys):
+    path = os.path.join(EXAMPLES, "defensive_try_except")
+    outputs = []
+    for guard in (None, Guard(timeout=60)):
+        changes = rewrite_directory_for_defensive_try_except(path, max_try_length=5, dry_run=True, jobs=2, guard=guard)
+        outputs.append((changes, capsys.readouterr().out))
+    assert outputs[0] == outputs[1]
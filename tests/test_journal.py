@@ -0,0 +1,98 @@
+import os
+import json
+import shutil
+
+import pytest
+
+from pyrefactor.defensive_try_except import rewrite_directory_for_defensive_try_except
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples", "defensive_try_except")
+
+
+def _copy_examples(tmp_path):
+    root = tmp_path / "src"
+    shutil.copytree(EXAMPLES, root)
+    return str(root)
+
+
+def _run(root, diff, journal=None, resume=False):
+    return rewrite_directory_for_defensive_try_except(root, max_try_length=1, dry_run=True, output_diff=diff, journal=journal, resume=resume)
+
+
+def test_resume_after_interruption_matches_full_run(tmp_path, capsys):
+    root = _copy_examples(tmp_path)
+    full_diff = str(tmp_path / "full.diff")
+    open(full_diff, "w").close()
+    expected = _run(root, full_diff)
+    expected_out = capsys.readouterr().out
+
+    diff = str(tmp_path / "run.diff")
+    journal = str(tmp_path / "run.journal")
+    _run(root, diff, journal=journal)
+    capsys.readouterr()
+    # 模拟中断：只保留到第一个写出 diff 的文件为止的记录，并在 diff 末尾留下写了一半的内容
+    with open(journal, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    records = [json.loads(line) for line in lines[1:]]
+    cut = next(k for k, entry in enumerate(records) if entry["diff_end"]) + 1
+    kept = records[:cut]
+    assert 0 < kept[-1]["diff_end"] < os.path.getsize(full_diff)
+    with open(journal, "w", encoding="utf-8") as f:
+        f.writelines(lines[:cut + 1])
+        f.write('{"path": "trunc')
+    with open(diff, "r+", encoding="utf-8") as f:
+        f.truncate(kept[-1]["diff_end"])
+        f.seek(0, os.SEEK_END)
+        f.write("--- partial\n")
+
+    assert _run(root, diff, journal=journal, resume=True) == expected
+    assert capsys.readouterr().out == expected_out
+    with open(diff, encoding="utf-8") as a, open(full_diff, encoding="utf-8") as b:
+        assert a.read() == b.read()
+
+
+def test_resume_reprocesses_only_changed_files(tmp_path, capsys):
+    root = _copy_examples(tmp_path)
+    journal = str(tmp_path / "run.journal")
+    target = os.path.join(root, "example_with_defensive_try.py")
+    _run(root, None, journal=journal)
+    with open(journal, encoding="utf-8") as f:
+        before = len(f.readlines())
+    with open(target, "a", encoding="utf-8") as f:
+        f.write("\n# edited\n")
+
+    assert target in _run(root, None, journal=journal, resume=True)
+    with open(journal, encoding="utf-8") as f:
+        lines = f.readlines()
+    assert len(lines) == before + 1
+    assert json.loads(lines[-1])["path"] == target
+
+
+def test_resume_rejects_different_options(tmp_path, capsys):
+    root = _copy_examples(tmp_path)
+    journal = str(tmp_path / "run.journal")
+    _run(root, None, journal=journal)
+    with pytest.raises(ValueError):
+        rewrite_directory_for_defensive_try_except(root, max_try_length=2, dry_run=True, journal=journal, resume=True)
+
+
+def test_resume_truncates_torn_last_line(tmp_path, capsys):
+    root = _copy_examples(tmp_path)
+    journal = str(tmp_path / "run.journal")
+    _run(root, None, journal=journal)
+    with open(journal, encoding="utf-8") as f:
+        lines = f.readlines()
+    # 模拟中断：最后一条记录只写了一半
+    with open(journal, "w", encoding="utf-8") as f:
+        f.writelines(lines[:-1])
+        f.write(lines[-1][: len(lines[-1]) // 2])
+    # 半行被截掉，对应的文件重新处理后追加在完整行之后
+    _run(root, None, journal=journal, resume=True)
+
+    with open(journal, encoding="utf-8") as f:
+        resumed = [json.loads(line) for line in f]
+    assert len(resumed) == len(lines)
+    # 再次恢复时所有记录都完好，不需要重新处理任何文件
+    assert _run(root, None, journal=journal, resume=True) == _run(root, None)
+    with open(journal, encoding="utf-8") as f:
+        assert len(f.readlines()) == len(lines)
@@ -0,0 +1,118 @@
+import io
+import os
+import time
+
+from pyrefactor.defensive_try_except import rewrite_file_for_defensive_try_except
+from pyrefactor.deps import build_dependency_graph
+from pyrefactor.imports_refactor import transform_source
+from pyrefactor.lsp import KIND_LIFT_IMPORTS, KIND_REMOVE_TRY, LanguageServer, path_to_uri, read_message, serve, text_edits, write_message
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def _apply(text, edits):
+    lines = text.splitlines(True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+
+    def offset(pos):
+        # 测试文本只含 BMP 字符，UTF-16 列号等于字符下标
+        return offsets[pos["line"]] + pos["character"] if pos["line"] < len(lines) else len(text)
+
+    for edit in sorted(edits, key=lambda e: (e["range"]["start"]["line"], e["range"]["start"]["character"]), reverse=True):
+        text = text[:offset(edit["range"]["start"])] + edit["newText"] + text[offset(edit["range"]["end"]):]
+    return text
+
+
+def _server(root=None, **options):
+    notes = []
+    server = LanguageServer(lambda method, params: notes.append((method, params)))
+    server.handle("initialize", {"rootUri": path_to_uri(root) if root else None, "initializationOptions": options})
+    return server, notes
+
+
+def _open(server, path, text=None):
+    if text is None:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    uri = path_to_uri(path)
+    server.handle("textDocument/didOpen", {"textDocument": {"uri": uri, "text": text, "version": 1}})
+    return uri, text
+
+
+def _actions(server, uri, kind):
+    params = {"textDocument": {"uri": uri}, "range": {"start": {"line": 0, "character": 0}, "end": {"line": 0, "character": 0}}, "context": {"diagnostics": [], "only": [kind]}}
+    return server.handle("textDocument/codeAction", params)
+
+
+def test_text_edits_roundtrip():
+    cases = [("a\nb\nc\n", "a\nx\nc\n"), ("a\nb", "a\nb\nc"), ("a\nb", "b"), ("", "x\n"), ("x = 1\n", "")]
+    for old, new in cases:
+        assert _apply(old, text_edits(old, new)) == new
+
+
+def test_remove_defensive_try_matches_cli():
+    path = os.path.abspath(os.path.join(EXAMPLES, "defensive_try_except", "example_with_defensive_try.py"))
+    server, notes = _server(maxTryLength=1)
+    uri, text = _open(server, path)
+
+    method, params = notes[-1]
+    assert method == "textDocument/publishDiagnostics" and params["uri"] == uri
+    assert params["diagnostics"] and all(d["code"] == "defensive-try" for d in params["diagnostics"])
+    (action,) = _actions(server, uri, KIND_REMOVE_TRY)
+    expected = rewrite_file_for_defensive_try_except(path, max_try_length=1, dry_run=True)
+    assert _apply(text, action["edit"]["changes"][uri]) == expected
+
+
+def test_lift_imports_uses_resident_graph_and_open_buffers(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "__init__.py").write_text("")
+    (tmp_path / "pkg" / "a.py").write_text("import pkg.b\n\ndef afunc():\n    return 'a'\n")
+    b_text = "def bfunc():\n    import pkg.a\n    return pkg.a.afunc()\n"
+    (tmp_path / "pkg" / "b.py").write_text(b_text)
+    server, _ = _server(str(tmp_path))
+    uri, _ = _open(server, str(tmp_path / "pkg" / "b.py"))
+    # 提升会形成 pkg.a -> pkg.b -> pkg.a 的环
+    assert _actions(server, uri, KIND_LIFT_IMPORTS) == []
+
+    # a.py 的缓冲区去掉了对 pkg.b 的导入（尚未保存），提升不再成环
+    _open(server, str(tmp_path / "pkg" / "a.py"), "def afunc():\n    return 'a'\n")
+    (action,) = _actions(server, uri, KIND_LIFT_IMPORTS)
+    graph = build_dependency_graph(str(tmp_path))
+    graph["pkg.a"] = set()
+    assert _apply(b_text, action["edit"]["changes"][uri]) == transform_source(b_text, "pkg.b", False, graph)
+
+    # 关闭 a.py 后恢复磁盘上的依赖
+    server.handle("textDocument/didClose", {"textDocument": {"uri": path_to_uri(str(tmp_path / "pkg" / "a.py"))}})
+    assert _actions(server, uri, KIND_LIFT_IMPORTS) == []
+
+
+def test_code_action_latency_uses_cache():
+    path = os.path.abspath(os.path.join(EXAMPLES, "defensive_try_except", "example_with_defensive_try.py"))
+    with open(path, encoding="utf-8") as f:
+        text = f.read() * 50
+    server, _ = _server(maxTryLength=1)
+    uri, _ = _open(server, path, text)
+    _actions(server, uri, KIND_REMOVE_TRY)
+    start = time.perf_counter()
+    for _ in range(20):
+        _actions(server, uri, KIND_REMOVE_TRY)
+    assert (time.perf_counter() - start) / 20 < 0.1
+
+
+def test_stdio_session():
+    requests = io.BytesIO()
+    write_message(requests, {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {"rootUri": None}})
+    write_message(requests, {"jsonrpc": "2.0", "method": "initialized", "params": {}})
+    write_message(requests, {"jsonrpc": "2.0", "id": 2, "method": "unknown/method", "params": {}})
+    write_message(requests, {"jsonrpc": "2.0", "id": 3, "method": "shutdown"})
+    write_message(requests, {"jsonrpc": "2.0", "method": "exit"})
+    requests.seek(0)
+    responses = io.BytesIO()
+    assert serve(requests, responses) == 0
+    responses.seek(0)
+    first = read_message(responses)
+    assert first["id"] == 1 and "codeActionProvider" in first["result"]["capabilities"]
+    assert read_message(responses)["error"]["code"] == -32601
+    assert read_message(responses) == {"jsonrpc": "2.0", "id": 3, "result": None}
@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+
+from pyrefactor.parallel import run_ordered, resolve_jobs, plan_batches, CostModel, resolve_backend, supports_parallel_threads, WorkerPool
+from pyrefactor.imports_refactor import rewrite_directory, rewrite_roots, parse_manifest, RootSpec
+from pyrefactor.defensive_try_except import rewrite_directory_for_defensive_try_except
+from pyrefactor.deps import build_dependency_graph
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def _square(offset, x):
+    return x * x + offset
+
+
+def test_run_ordered_keeps_input_order():
+    items = list(range(50))
+    expected = [x * x + 1 for x in items]
+    assert list(run_ordered(_square, items, jobs=1, context=1)) == expected
+    assert list(run_ordered(_square, items, jobs=4, context=1, chunksize=3)) == expected
+
+
+def test_resolve_jobs():
+    assert resolve_jobs(None) == 1
+    assert resolve_jobs(3) == 3
+    assert resolve_jobs(0) >= 1
+
+
+def _read_tree(root):
+    out = {}
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            p = os.path.join(dirpath, fn)
+            with open(p, "rb") as f:
+                out[os.path.relpath(p, root)] = f.read()
+    return out
+
+
+def test_import_rewrite_identical_across_jobs():
+    src = os.path.join(EXAMPLES, "imports", "try_complex_project")
+    results = []
+    for jobs in (1, 3):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = os.path.join(tmpdir, "proj")
+            shutil.copytree(src, root)
+            diff_path = os.path.join(tmpdir, "out.diff")
+            rewrite_directory(root, dry_run=True, output_diff=diff_path, failfirst=True, jobs=jobs)
+            with open(diff_path, encoding="utf-8") as f:
+                diff = f.read().replace(root, "<root>")
+            rewrite_directory(root, failfirst=True, jobs=jobs)
+            results.append((diff, _read_tree(root)))
+    assert results[0] == results[1]
+
+
+def test_dependency_graph_identical_across_jobs():
+    root = os.path.join(EXAMPLES, "imports", "integration_project", "src")
+    assert build_dependency_graph(root, jobs=1) == build_dependency_graph(root, jobs=2)
+
+
+def test_defensive_diff_identical_across_jobs(capsys):
+    src = os.path.join(EXAMPLES, "defensive_try_except")
+    outputs = []
+    for jobs in (1, 4):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = os.path.join(tmpdir, "d")
+            shutil.copytree(src, root)
+            diff_path = os.path.join(tmpdir, "out.diff")
+            changed = rewrite_directory_for_defensive_try_except(root, max_try_length=2, dry_run=True, output_diff=diff_path, jobs=jobs)
+            with open(diff_path, encoding="utf-8") as f:
+                diff = f.read().replace(root, "<root>")
+            printed = capsys.readouterr().out.replace(root, "<root>")
+            outputs.append(([os.path.relpath(c, root) for c in changed], diff, printed))
+    assert outputs[0] == outputs[1]
+    assert outputs[0][0]
+
+
+def test_plan_batches_largest_first_and_chunks_small_files():
+    costs = [1.0] * 40 + [100.0, 50.0]
+    batches = plan_batches(costs, workers=2)
+    assert batches[0] == [40]
+    assert batches[1] == [41]
+    flat = sorted(i for b in batches for i in b)
+    assert flat == list(range(len(costs)))
+    # 小文件被合并成批，而不是每个文件单独一次 IPC
+    assert len(batches) < len(costs) // 2
+
+
+def test_run_ordered_with_costs_keeps_order_and_records_timings():
+    items = list(range(30))
+    timings = {}
+    costs = [float(x % 7) for x in items]
+    out = list(run_ordered(_square, items, jobs=3, context=0, costs=costs, timings=timings))
+    assert out == [x * x for x in items]
+    assert sorted(timings) == items
+
+
+def test_cost_model_uses_history():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        small = os.path.join(tmpdir, "small.py")
+        big = os.path.join(tmpdir, "big.py")
+        with open(small, "w") as f:
+            f.write("x = 1\n")
+        with open(big, "w") as f:
+            f.write("x = 1\n" * 100)
+        history = os.path.join(tmpdir, "costs.json")
+        model = CostModel(history)
+        assert model.estimate([small, big]) == [6.0, 600.0]
+        # 上次运行中小文件反而更慢
+        model.record([small, big], {0: 2.0, 1: 0.5})
+        model.save()
+        assert CostModel(history).estimate([small, big]) == [2.0, 0.5]
+
+
+def test_thread_backend_matches_serial(capsys):
+    src = os.path.join(EXAMPLES, "defensive_try_except")
+    outputs = []
+    for jobs, backend in ((1, "process"), (4, "thread")):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = os.path.join(tmpdir, "d")
+            shutil.copytree(src, root)
+            diff_path = os.path.join(tmpdir, "out.diff")
+            rewrite_directory_for_defensive_try_except(root, max_try_length=2, dry_run=True, output_diff=diff_path, jobs=jobs, backend=backend)
+            with open(diff_path, encoding="utf-8") as f:
+                diff = f.read().replace(root, "<root>")
+            outputs.append((diff, capsys.readouterr().out.replace(root, "<root>")))
+    assert outputs[0] == outputs[1]
+
+
+def test_resolve_backend():
+    assert resolve_backend("thread") == "thread"
+    assert resolve_backend("auto") == ("thread" if supports_parallel_threads() else "process")
+
+
+def test_worker_pool_reused_across_calls():
+    items = list(range(30))
+    with WorkerPool(3, backend="process") as pool:
+        assert list(run_ordered(_square, items, context=1, pool=pool)) == [x * x + 1 for x in items]
+        executor = pool.executor
+        assert list(run_ordered(_square, items, context=2, pool=pool, costs=[1.0] * len(items))) == [x * x + 2 for x in items]
+        assert pool.executor is executor
+
+
+def test_rewrite_roots_matches_per_root_runs():
+    names = ("try_complex_project", "integration_project")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        expected = []
+        specs = []
+        for name in names:
+            single = os.path.join(tmpdir, "single", name)
+            shutil.copytree(os.path.join(EXAMPLES, "imports", name), single)
+            diff_path = os.path.join(tmpdir, f"{name}.diff")
+            rewrite_directory(single, dry_run=True, output_diff=diff_path, failfirst=True)
+            with open(diff_path, encoding="utf-8") as f:
+                expected.append(f.read().replace(single, "<root>"))
+            batch = os.path.join(tmpdir, "batch", name)
+            shutil.copytree(os.path.join(EXAMPLES, "imports", name), batch)
+            specs.append(RootSpec(batch))
+        combined = os.path.join(tmpdir, "combined.diff")
+        changes = rewrite_roots(specs, dry_run=True, output_diff=combined, failfirst=True, jobs=2)
+        assert changes == [combined]
+        with open(combined, encoding="utf-8") as f:
+            diff = f.read()
+        for spec in specs:
+            diff = diff.replace(spec.path, "<root>")
+        assert diff == "".join(expected)
+
+
+def test_parse_manifest(tmp_path):
+    manifest = tmp_path / "roots.txt"
+    manifest.write_text("# nightly\nsvc-a --package-path svc-a/src --modify-under svc-a/src/pkg\n\n'svc b' --output-diff b.diff  # comment\n", encoding="utf-8")
+    specs = parse_manifest(str(manifest))
+    assert specs == [
+        RootSpec(str(tmp_path / "svc-a"), [str(tmp_path / "svc-a/src")], str(tmp_path / "svc-a/src/pkg"), None),
+        RootSpec(str(tmp_path / "svc b"), None, None, str(tmp_path / "b.diff")),
+    ]
+
+
+def test_cost_history_saved_when_caller_stops_at_last_result(tmp_path):
+    path = os.path.join(EXAMPLES, "defensive_try_except")
+    history = str(tmp_path / "costs.json")
+    changes = rewrite_directory_for_defensive_try_except(path, max_try_length=1, dry_run=True, cost_history=history)
+    assert changes
+    assert os.path.exists(history)
@@ -0,0 +1,126 @@
+import os
+import pickle
+import shutil
+
+from pyrefactor import Project
+from pyrefactor.abs_imports import AbsImportRewriter, rewrite_abs_directory
+from pyrefactor.deps import build_dependency_graph
+from pyrefactor.graph import build_import_graph_mermaid
+from pyrefactor.imports_refactor import rewrite_directory
+
+
+def _tree(root):
+    for rel, text in {
+        "pkg/__init__.py": "",
+        "pkg/a.py": "def f():\n    from . import b\n    return b\n",
+        "pkg/b.py": "import os\n\ndef g():\n    import json\n    return json, os\n",
+        "pkg/c.py": "x = (\n",
+    }.items():
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return root
+
+
+def _read_all(root):
+    out = {}
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            with open(os.path.join(dirpath, fn), encoding="utf-8") as f:
+                out[os.path.relpath(os.path.join(dirpath, fn), root)] = f.read()
+    return out
+
+
+def test_each_file_parsed_once_per_kind(tmp_path):
+    plain = _tree(str(tmp_path / "plain"))
+    shared = str(tmp_path / "shared")
+    shutil.copytree(plain, shared)
+    rewrite_abs_directory(plain)
+    expected = rewrite_directory(plain, dedup=False)
+
+    project = Project(shared)
+    assert [os.path.relpath(p, shared) for p in rewrite_abs_directory(shared, project=project)] == [os.path.join("pkg", "a.py")]
+    changes = rewrite_directory(shared, dedup=False, project=project)
+    assert [os.path.relpath(p, shared) for p in changes] == [os.path.relpath(p, plain) for p in expected]
+    assert _read_all(shared) == _read_all(plain)
+    # --absimport 解析 4 个文件并改写 a.py；提升时只重新解析 a.py，依赖图的 ast 扫描每个文件一次
+    assert project.parses == {"cst": 5, "ast": 4}
+    assert not project._entries
+
+
+def test_scan_releases_trees(tmp_path):
+    root = _tree(str(tmp_path / "src"))
+    project = Project(root)
+    assert build_dependency_graph(root, project=project) == build_dependency_graph(root)
+    assert build_import_graph_mermaid(root, project=project) == build_import_graph_mermaid(root)
+    # 扫描完的 ast 树不保留，两个使用者各解析一次
+    assert project.parses == {"ast": 8}
+    assert not project._entries
+    path = os.path.join(root, "pkg", "b.py")
+    wrapper = project.metadata(path)
+    assert wrapper is project.metadata(path) and wrapper.module is project.cst_module(path)
+    assert project.parses["cst"] == 1
+
+
+def test_pickle_drops_cached_files(tmp_path):
+    root = _tree(str(tmp_path / "src"))
+    project = Project(root)
+    project.dependency_graph()
+    copy = pickle.loads(pickle.dumps(project))
+    assert copy.root == root and not copy._entries and copy._resolver is None
+    assert copy.source(os.path.join(root, "pkg", "a.py")) == project.source(os.path.join(root, "pkg", "a.py"))
+
+
+def test_entries_released(tmp_path):
+    root = _tree(str(tmp_path / "src"))
+    project = Project(root)
+    a, b = os.path.join(root, "pkg", "a.py"), os.path.join(root, "pkg", "b.py")
+    project.cst_module(a)
+    build_dependency_graph(root, project=project)
+    # a.py 的 libcst 模块还要给提升使用，保留源码；其余文件的条目全部释放
+    assert list(project._entries) == [a]
+    assert project._entries[a].tree is None and project._entries[a].source is not None
+    project.metadata(b)
+    project.release(b, "metadata", "cst_module")
+    assert b in project._entries and project._entries[b].cst_module is None
+    project.release(b)
+    assert b not in project._entries
+    rewrite_directory(root, dry_run=True, project=project)
+    assert not project._entries
+
+
+def test_absimport_with_project_skips_failing_files(tmp_path, monkeypatch):
+    root = _tree(str(tmp_path / "src"))
+
+    def boom(self, original_node, updated_node):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(AbsImportRewriter, "leave_ImportFrom", boom)
+    assert rewrite_abs_directory(root, project=Project(root)) == []
+
+
+def test_absimport_outside_project_root_walks(tmp_path):
+    root = _tree(str(tmp_path / "src"))
+    other = _tree(str(tmp_path / "other"))
+    changed = rewrite_abs_directory(other, project=Project(root))
+    assert changed == [os.path.join(other, "pkg", "a.py")]
+    assert "from pkg import b" in open(changed[0], encoding="utf-8").read()
+
+
+def test_crlf_source_matches_text_mode(tmp_path):
+    plain = _tree(str(tmp_path / "plain"))
+    crlf = _tree(str(tmp_path / "crlf"))
+    for rel in ("pkg/a.py", "pkg/b.py"):
+        path = os.path.join(crlf, rel)
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data.replace(b"\n", b"\r\n"))
+    path = os.path.join(crlf, "pkg", "b.py")
+    # 与按文本模式读取一样换行统一为 \n，写回和 diff 与逐文件 open() 读取时相同
+    assert Project(crlf).source(path) == open(path, encoding="utf-8").read()
+    expected = [os.path.relpath(p, plain) for p in rewrite_directory(plain)]
+    assert [os.path.relpath(p, crlf) for p in rewrite_directory(crlf)] == expected == [os.path.join("pkg", "b.py")]
+    with open(path, "rb") as f, open(os.path.join(plain, "pkg", "b.py"), "rb") as g:
+        assert f.read() == g.read()
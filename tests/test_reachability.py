@@ -0,0 +1,51 @@
+import random
+
+from pyrefactor.deps import ReachabilityIndex, _reachable, import_cycles, reachability_index, would_create_cycle
+from pyrefactor.shared_graph import CSRGraph, encode_graph
+
+
+def _random_graph(seed, n=40, externals=5, edges=80):
+    rng = random.Random(seed)
+    names = [f"m{i}" for i in range(n)]
+    targets = names + [f"ext{i}" for i in range(externals)]
+    graph = {name: set() for name in names}
+    for _ in range(edges):
+        graph[rng.choice(names)].add(rng.choice(targets))
+    return graph
+
+
+def test_index_matches_dfs():
+    for seed in range(20):
+        graph = _random_graph(seed)
+        index = ReachabilityIndex(graph)
+        nodes = list(graph) + ["ext0", "ext4", "missing"]
+        for a in nodes:
+            for b in nodes:
+                assert index.reachable(a, b) == _reachable(graph, a, b), (seed, a, b)
+                assert would_create_cycle(index, a, b) == would_create_cycle(graph, a, b)
+        assert import_cycles(index) == import_cycles(graph)
+        assert dict(index) == graph
+
+
+def test_csr_graph_queries_without_decoding():
+    graph = _random_graph(1)
+    csr = CSRGraph(encode_graph(graph))
+    # 进程 worker 中的共享图不构建索引，直接在 CSR 上搜索
+    assert reachability_index(csr) is None and reachability_index(graph) is None
+    index = ReachabilityIndex(csr)
+    assert reachability_index(index) is index
+    for a in graph:
+        for b in list(graph)[:10]:
+            assert would_create_cycle(csr, a, b) == would_create_cycle(graph, a, b) == would_create_cycle(index, a, b)
+
+
+def test_long_chain():
+    # 链式依赖上 DFS 每次查询都要走完整条链，索引查询只做位运算
+    n = 3000
+    graph = {f"m{i}": {f"m{i + 1}"} for i in range(n)}
+    graph[f"m{n}"] = set()
+    index = ReachabilityIndex(graph)
+    assert index.reachable("m0", f"m{n}")
+    assert not index.reachable(f"m{n}", "m0")
+    assert would_create_cycle(index, f"m{n}", "m0") and not would_create_cycle(index, "m0", f"m{n}")
+    assert import_cycles(index) == []
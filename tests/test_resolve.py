@@ -0,0 +1,60 @@
+import os
+
+from pyrefactor.deps import build_dependency_graph, list_python_files, module_name_from_path_multi
+from pyrefactor.graph import build_import_graph_mermaid
+from pyrefactor.resolve import FIRST_PARTY, STDLIB, THIRD_PARTY, UNKNOWN, ModuleResolver
+
+
+def _tree(tmp_path):
+    for rel, text in {
+        "src/pkg/__init__.py": "",
+        "src/pkg/a.py": "import os\nimport pytest\nimport nosuchmodule_xyz\nfrom pkg import b\nfrom .b import x\n",
+        "src/pkg/b.py": "import json.decoder\n",
+        "src/pkg/sub/__init__.py": "",
+        "src/pkg/sub/c.py": "import pkg.a\n",
+        "tools/run.py": "import pkg\n",
+        "setup.py": "",
+    }.items():
+        path = tmp_path / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    return str(tmp_path)
+
+
+def test_module_names_match_linear_scan(tmp_path):
+    root = _tree(tmp_path)
+    roots = [root, os.path.join(root, "src"), os.path.join(root, "src", "pkg", "sub")]
+    resolver = ModuleResolver(root, roots)
+    assert list(resolver.paths) == list_python_files(root)
+    for path, mod in resolver.paths.items():
+        assert mod == module_name_from_path_multi(path, roots)
+    assert resolver.file_for("pkg.a") == os.path.join(root, "src", "pkg", "a.py")
+    assert resolver.paths[os.path.join(root, "src", "pkg", "sub", "c.py")] == "c"
+    # 不在任何根目录下的文件按第一个根目录命名
+    run = os.path.join(root, "tools", "run.py")
+    assert ModuleResolver(os.path.join(root, "tools"), [os.path.join(root, "src")]).module_name(run) == module_name_from_path_multi(run, [os.path.join(root, "src")])
+
+
+def test_classify(tmp_path):
+    root = _tree(tmp_path)
+    resolver = ModuleResolver(root, [os.path.join(root, "src"), root])
+    assert resolver.classify("pkg.sub.c") == FIRST_PARTY
+    assert resolver.classify(".b") == FIRST_PARTY
+    assert resolver.classify("json.decoder") == STDLIB
+    assert resolver.classify("sys") == STDLIB
+    assert resolver.classify("pytest") == THIRD_PARTY
+    assert resolver.classify("nosuchmodule_xyz") == UNKNOWN
+    graph = build_dependency_graph(root, [os.path.join(root, "src"), root], resolver=resolver)
+    assert resolver.drop_external(graph)["pkg.a"] == {"pkg", "pkg.b"}
+
+
+def test_first_party_import_graph(tmp_path):
+    root = _tree(tmp_path)
+    full = build_import_graph_mermaid(root)
+    first_party = build_import_graph_mermaid(root, first_party_only=True)
+    assert '"src.pkg.a" --> "os"' in full and '"os"' not in first_party
+    assert '"src.pkg.a" --> "pytest"' in full and '"pytest"' not in first_party
+    # 以 root 为包根时顶层包是 src、tools 和 setup，pkg 不是本项目的模块；相对导入总是保留
+    assert '"src.pkg.a" --> ".b"' in first_party
+    index = str(tmp_path / "graph.idx")
+    assert build_import_graph_mermaid(root, index=index, first_party_only=True) == first_party
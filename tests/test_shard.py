@@ -0,0 +1,82 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import pytest
+
+from pyrefactor.shard import parse_shard, shard_bucket, merge_partials
+from pyrefactor.imports_refactor import rewrite_directory
+from pyrefactor.defensive_try_except import rewrite_directory_for_defensive_try_except
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def test_parse_shard():
+    assert parse_shard("2/3") == (2, 3)
+    for bad in ("0/3", "4/3", "a/b", "3"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(bad)
+
+
+def test_cli_reports_shard_error(tmp_path):
+    cmd = [sys.executable, "-m", "pyrefactor.cli", "remove_defensive_try", str(tmp_path), "--shard", "4/3"]
+    env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), ".."))
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    assert result.returncode == 2 and "要求 1 <= i <= n" in result.stderr
+
+
+def test_shard_bucket_is_relative_to_root():
+    assert shard_bucket("/a/x/pkg/m.py", "/a/x", 7) == shard_bucket("/b/pkg/m.py", "/b", 7)
+
+
+def test_defensive_shards_merge_to_single_run(capsys):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = os.path.join(tmpdir, "d")
+        shutil.copytree(os.path.join(EXAMPLES, "defensive_try_except"), root)
+        single_diff = os.path.join(tmpdir, "single.diff")
+        open(single_diff, "w").close()
+        single = rewrite_directory_for_defensive_try_except(root, max_try_length=2, dry_run=True, output_diff=single_diff)
+        single_out = capsys.readouterr().out
+
+        parts = []
+        for i in range(1, 4):
+            part = os.path.join(tmpdir, f"part{i}.json")
+            rewrite_directory_for_defensive_try_except(root, max_try_length=2, dry_run=True, output_diff=single_diff, shard=(i, 3), shard_output=part)
+            parts.append(part)
+        assert capsys.readouterr().out == ""
+
+        merged_diff = os.path.join(tmpdir, "merged.diff")
+        command, dry_run, merged = merge_partials(parts, output_diff=merged_diff)
+        assert (command, dry_run) == ("remove_defensive_try", True)
+        assert merged == single
+        assert capsys.readouterr().out == single_out
+        with open(single_diff) as a, open(merged_diff) as b:
+            assert a.read() == b.read()
+
+        with pytest.raises(ValueError):
+            merge_partials(parts[:2])
+
+
+def test_import_shards_share_graph_file():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = os.path.join(tmpdir, "proj")
+        shutil.copytree(os.path.join(EXAMPLES, "imports", "try_complex_project"), root)
+        single_diff = os.path.join(tmpdir, "single.diff")
+        single = rewrite_directory(root, dry_run=True, output_diff=single_diff, failfirst=True)
+
+        graph_file = os.path.join(tmpdir, "graph.bin")
+        parts = []
+        for i in range(1, 3):
+            part = os.path.join(tmpdir, f"part{i}.json")
+            rewrite_directory(root, dry_run=True, failfirst=True, shard=(i, 2), shard_output=part, graph_file=graph_file)
+            parts.append(part)
+        assert os.path.exists(graph_file)
+
+        merged_diff = os.path.join(tmpdir, "merged.diff")
+        _, _, merged = merge_partials(parts, output_diff=merged_diff)
+        assert merged == [merged_diff] and single == [single_diff]
+        with open(single_diff) as a, open(merged_diff) as b:
+            assert a.read() == b.read()
@@ -0,0 +1,50 @@
+import os
+import pickle
+import tempfile
+
+from pyrefactor.deps import would_create_cycle
+from pyrefactor.parallel import run_ordered
+from pyrefactor.shared_graph import SharedGraph, CSRGraph, encode_graph, open_graph_file, write_graph_file
+
+GRAPH = {
+    "pkg.a": {"pkg.b", "os"},
+    "pkg.b": {"pkg.c"},
+    "pkg.c": set(),
+    "pkg.d": {"pkg.a", "json"},
+}
+
+
+def _cycle(graph, pair):
+    return would_create_cycle(graph, *pair)
+
+
+def test_csr_graph_matches_dict():
+    g = CSRGraph(encode_graph(GRAPH))
+    assert dict(g) == {k: frozenset(v) for k, v in GRAPH.items()}
+    assert "os" not in g and "pkg.a" in g
+    assert g.node_id("os") >= g.n_keys
+    assert g.node_id("missing") == -1
+    pairs = [(a, b) for a in list(GRAPH) + ["os", "x"] for b in list(GRAPH) + ["os", "x"]]
+    for a, b in pairs:
+        assert would_create_cycle(g, a, b) == would_create_cycle(GRAPH, a, b), (a, b)
+
+
+def test_shared_memory_graph_in_workers():
+    pairs = [("pkg.c", "pkg.a"), ("pkg.a", "pkg.d"), ("pkg.d", "os"), ("pkg.c", "pkg.c")]
+    expected = [would_create_cycle(GRAPH, a, b) for a, b in pairs]
+    with SharedGraph(GRAPH) as shared:
+        # 序列化结果只包含共享内存句柄
+        assert len(pickle.dumps(shared.graph)) < 200
+        assert list(run_ordered(_cycle, pairs, jobs=2, context=shared.graph)) == expected
+
+
+def test_graph_file_roundtrip():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "graph.bin")
+        write_graph_file(GRAPH, path)
+        g = open_graph_file(path)
+        assert g["pkg.d"] == frozenset({"pkg.a", "json"})
+        clone = pickle.loads(pickle.dumps(g))
+        assert clone["pkg.a"] == frozenset({"pkg.b", "os"})
+        clone.release()
+        g.release()
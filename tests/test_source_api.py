@@ -0,0 +1,87 @@
+import os
+import sys
+import subprocess
+
+import libcst as cst
+import pytest
+
+from pyrefactor import abs_imports, defensive_try_except, functions, imports_refactor
+from pyrefactor.deps import build_dependency_graph
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+EXAMPLES = os.path.join(ROOT, "examples")
+DEFENSIVE = os.path.join(EXAMPLES, "defensive_try_except", "example_with_defensive_try.py")
+CYCLE = os.path.join(EXAMPLES, "imports", "cycle_project")
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _cli(args, stdin, cwd=ROOT):
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT))
+    return subprocess.run([sys.executable, "-m", "pyrefactor.cli", *args], input=stdin, capture_output=True, text=True, cwd=cwd, env=env)
+
+
+def test_defensive_refactor_source_matches_file_api(capsys):
+    source = _read(DEFENSIVE)
+    new_source, findings = defensive_try_except.refactor_source(source, max_try_length=1, filename="x.py")
+    assert capsys.readouterr().out == ""
+    assert new_source == defensive_try_except.rewrite_file_for_defensive_try_except(DEFENSIVE, max_try_length=1, dry_run=True)
+    assert capsys.readouterr().out == defensive_try_except.format_findings(DEFENSIVE, findings)
+    assert defensive_try_except.refactor_source("x = 1\n") == ("x = 1\n", [])
+    with pytest.raises(cst.ParserSyntaxError):
+        defensive_try_except.refactor_source("def (:\n")
+
+
+def test_defensive_transformer_does_not_print(capsys):
+    from libcst.metadata import MetadataWrapper
+    transformer = defensive_try_except.DefensiveTryExceptTransformer(1, True, filename="x.py")
+    MetadataWrapper(cst.parse_module(_read(DEFENSIVE))).visit(transformer)
+    assert transformer.findings and capsys.readouterr().out == ""
+
+
+def test_defensive_parse_failures_reported_as_parse_errors(tmp_path, capsys, monkeypatch):
+    path = tmp_path / "x.py"
+    path.write_text("x = 1\n")
+
+    def boom(source):
+        raise RecursionError("too deep")
+
+    monkeypatch.setattr(defensive_try_except.cst, "parse_module", boom)
+    assert defensive_try_except.rewrite_file_for_defensive_try_except(str(path)) is None
+    assert capsys.readouterr().out == f"解析文件 {path} 时出错: too deep\n"
+
+
+def test_other_refactor_sources():
+    src = "def bfunc():\n    import os\n    return os.sep\n"
+    new_source, lifted = imports_refactor.refactor_source(src, "m", False, {})
+    assert lifted == ["import os"]
+    assert new_source == imports_refactor.transform_source(src, "m", False, {})
+
+    src = "from .b import x\nfrom os import sep\n"
+    assert abs_imports.refactor_source(src, "pkg.a", False) == ("from pkg.b import x\nfrom os import sep\n", [(".b", "pkg.b")])
+
+    source = _read(os.path.join(EXAMPLES, "function_splitter", "example_functions.py"))
+    new_source, created = functions.refactor_source(source)
+    assert new_source == functions.rewrite_file_for_functions(source)
+    assert created and all(f"def {name}(" in new_source for name in created)
+
+
+def test_cli_stdin_filter():
+    result = _cli(["remove_defensive_try", "-", "--max-length", "1", "--stdin-filename", "x.py"], _read(DEFENSIVE))
+    assert result.returncode == 0
+    expected, findings = defensive_try_except.refactor_source(_read(DEFENSIVE), max_try_length=1)
+    assert result.stdout == expected
+    assert result.stderr == defensive_try_except.format_findings("x.py", findings)
+
+    # 有 --stdin-filename 时按包根目录构建依赖图：提升 pkg.a 会成环，源码原样输出
+    b_src = _read(os.path.join(CYCLE, "pkg", "b.py"))
+    result = _cli(["refc_import", "-", "--stdin-filename", "pkg/b.py"], b_src, cwd=CYCLE)
+    assert result.returncode == 0 and result.stdout == b_src
+    result = _cli(["refc_import", "-", "--dry-run"], b_src, cwd=CYCLE)
+    assert result.stdout.startswith("--- <stdin>\n+++ <stdin>\n") and "+import pkg.a\n" in result.stdout
+
+    result = _cli(["split_func", "-", "--output-diff", "x.diff"], "")
+    assert result.returncode == 2 and "--output-diff" in result.stderr
@@ -0,0 +1,75 @@
+import ast
+import os
+
+from pyrefactor.graph_index import GraphIndex
+from pyrefactor.symbols import scan_symbols, unused_bindings
+
+SOURCE = """\
+import os
+import numpy as np
+import a.b.c
+from . import sibling
+from .util import helper as h
+from typing import List
+
+__all__ = ["h"]
+
+
+@np.vectorize
+def f(x=os.sep):
+    import json
+    return np.linalg.norm(x) + json.dumps(a.b.c.value)
+
+
+class K:
+    attr = os.path.join("x")
+"""
+
+
+def test_scan_symbols():
+    symbols = scan_symbols(ast.parse(SOURCE), "pkg.mod", False)
+    assert symbols["bindings"] == [
+        ["os", "os", 1, "module"],
+        ["np", "numpy", 2, "module"],
+        ["a", "a", 3, "module"],
+        ["sibling", "pkg.sibling", 4, "module"],
+        ["h", "pkg.util.helper", 5, "module"],
+        ["List", "typing.List", 6, "module"],
+        ["json", "json", 13, "function"],
+    ]
+    uses = {(q, line, scope) for _, q, line, scope in symbols["uses"]}
+    assert uses == {
+        ("pkg.util.helper", 8, "module"),
+        # 装饰器和默认值在定义时求值，属于模块级
+        ("numpy.vectorize", 11, "module"),
+        ("os.sep", 12, "module"),
+        ("numpy.linalg.norm", 14, "function"),
+        ("json.dumps", 14, "function"),
+        ("a.b.c.value", 14, "function"),
+        ("os.path.join", 18, "module"),
+    }
+    assert [b[0] for b in unused_bindings(symbols)] == ["sibling", "List"]
+
+
+def test_index_queries_survive_reload(tmp_path):
+    pkg = tmp_path / "pkg"
+    pkg.mkdir()
+    (pkg / "__init__.py").write_text("from pkg.a import f\n")
+    (pkg / "a.py").write_text("import os\nimport sys\n\ndef f():\n    return os.getcwd()\n")
+    (pkg / "b.py").write_text("from pkg.a import f\n\ndef g():\n    import pkg.a\n    return pkg.a.f() or f()\n")
+    for p in pkg.iterdir():
+        os.utime(p, (1_000_000_000, 1_000_000_000))
+    path = str(tmp_path / "graph.idx")
+    GraphIndex(path, str(tmp_path)).refresh()
+
+    index = GraphIndex(path, str(tmp_path))
+    index.refresh()
+    assert index.parsed == 0
+    a, b, init = os.path.join("pkg", "a.py"), os.path.join("pkg", "b.py"), os.path.join("pkg", "__init__.py")
+    assert index.unused_imports() == [(a, 2, "sys", "sys")]
+    assert index.users("pkg.a.f") == [
+        (init, 1, "module", "pkg.a.f"),
+        (b, 1, "module", "pkg.a.f"),
+        (b, 5, "function", "pkg.a.f"),
+    ]
+    assert index.users("os") == [(a, 1, "module", "os"), (a, 5, "function", "os.getcwd")]
@@ -0,0 +1,70 @@
+import os
+
+import pyrefactor.imports_refactor as imports_refactor
+import pyrefactor.tuning as tuning_module
+from pyrefactor.imports_refactor import rewrite_directory
+from pyrefactor.parallel import AUTO, parse_jobs, resolve_jobs
+from pyrefactor.tuning import RunSummary, Tuning, autotune, choose
+from pyrefactor.defensive_try_except import rewrite_directory_for_defensive_try_except
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def test_parse_jobs():
+    assert parse_jobs("auto") == AUTO
+    assert parse_jobs("3") == 3
+    assert resolve_jobs(AUTO) >= 1
+
+
+def test_choose_stays_serial_when_work_is_below_spawn_cost():
+    tuning = choose(100, 8, file_seconds=0.001, spawn_seconds=0.5, ipc_seconds=0.001)
+    assert tuning.workers == 1
+
+
+def test_choose_scales_workers_and_batches():
+    tuning = choose(1000, 8, file_seconds=0.01, spawn_seconds=0.1, ipc_seconds=0.002)
+    assert tuning.workers == 8
+    # IPC 开销不超过批处理代价的 5%：0.002 / (0.05 * 0.01) = 4
+    assert tuning.batch_size == 4
+    # 单文件代价很小时批次变大，但每个 worker 仍至少有 4 个批次
+    tuning = choose(1000, 8, file_seconds=0.0001, spawn_seconds=0.01, ipc_seconds=0.002)
+    assert tuning.batch_size == 1000 // (tuning.workers * 4)
+
+
+def test_autotune_measures_sample(tmp_path):
+    root = os.path.join(EXAMPLES, "defensive_try_except")
+    paths = sorted(os.path.join(root, f) for f in os.listdir(root) if f.endswith(".py"))
+    tuning = autotune(paths, max_workers=2, backend="thread")
+    assert 1 <= tuning.workers <= 2
+    assert tuning.file_seconds > 0
+    assert tuning.spawn_seconds > 0
+
+
+def test_auto_jobs_matches_serial_and_reports_summary(capsys):
+    path = os.path.join(EXAMPLES, "defensive_try_except")
+    serial = rewrite_directory_for_defensive_try_except(path, max_try_length=1, dry_run=True, jobs=1)
+    serial_out = capsys.readouterr().out
+    summary = RunSummary()
+    auto = rewrite_directory_for_defensive_try_except(path, max_try_length=1, dry_run=True, jobs=AUTO, summary=summary)
+    assert (auto, capsys.readouterr().out) == (serial, serial_out)
+    [line] = summary.lines()
+    assert "自动调优" in line and "文件/秒" in line
+    assert isinstance(summary.runs[0][0], Tuning)
+
+
+def test_auto_jobs_picks_graph_after_tuning(tmp_path, monkeypatch):
+    root = tmp_path / "src"
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "__init__.py").write_text("")
+    (root / "pkg" / "a.py").write_text("def f():\n    import os\n    return os\n")
+    (root / "pkg" / "b.py").write_text("def g():\n    import json\n    return json\n")
+    serial = rewrite_directory(str(root), dry_run=True, jobs=1)
+
+    def no_shared(graph):
+        raise AssertionError("校准选择单 worker 时不应把依赖图放入共享内存")
+
+    # 校准选定 1 个 worker：即使 CPU 数大于 1 且后端为进程，也走串行的可达性索引
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    monkeypatch.setattr(tuning_module, "autotune", lambda paths, **kwargs: Tuning(1, len(paths), 0.001, 0.0, 0.0))
+    monkeypatch.setattr(imports_refactor, "SharedGraph", no_shared)
+    assert rewrite_directory(str(root), dry_run=True, jobs=AUTO, backend="process") == serial
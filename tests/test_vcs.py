@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pyrefactor.imports_refactor import rewrite_directory
+from pyrefactor.vcs import changed_files
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+LIFTABLE = "def {name}():\n    import os\n    return os.sep\n"
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args], cwd=repo, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    pkg = tmp_path / "pkg"
+    pkg.mkdir()
+    (pkg / "__init__.py").write_text("")
+    (pkg / "a.py").write_text("import pkg.b\n\ndef afunc():\n    return 'a'\n")
+    (pkg / "b.py").write_text("def bfunc():\n    import pkg.a\n    return pkg.a.afunc()\n")
+    (pkg / "c.py").write_text("X = 1\n")
+    (pkg / "d.py").write_text(LIFTABLE.format(name="dfunc"))
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "base")
+    # 改动 b.py（提升 pkg.a 会与未改动的 a.py 成环）和 c.py；d.py 未改动
+    (pkg / "b.py").write_text("def bfunc():\n    import pkg.a\n    return pkg.a.afunc() * 2\n")
+    (pkg / "c.py").write_text(LIFTABLE.format(name="cfunc"))
+    return tmp_path
+
+
+def test_since_limits_transformed_files_but_keeps_full_graph(repo):
+    pkg = repo / "pkg"
+    (pkg / "e.py").write_text(LIFTABLE.format(name="efunc"))  # 未跟踪
+    only = changed_files(str(repo), since="HEAD")
+    assert only == {os.path.realpath(pkg / n) for n in ("b.py", "c.py", "e.py")}
+    changes = rewrite_directory(str(repo), only=only)
+    assert sorted(changes) == [str(pkg / "c.py"), str(pkg / "e.py")]
+    assert (pkg / "d.py").read_text() == LIFTABLE.format(name="dfunc")
+    assert "    import pkg.a\n" in (pkg / "b.py").read_text()
+
+
+def test_staged(repo):
+    _git(repo, "add", "pkg/c.py")
+    assert changed_files(str(repo / "pkg"), staged=True) == {os.path.realpath(repo / "pkg" / "c.py")}
+
+
+def test_cli_since_and_bad_ref(repo):
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT))
+    diff = repo / "out.diff"
+    cmd = [sys.executable, "-m", "pyrefactor.cli", "refc_import", str(repo), "--dry-run", "--no-cache", "--output-diff", str(diff)]
+    result = subprocess.run(cmd + ["--since", "HEAD"], capture_output=True, text=True, env=env)
+    assert result.returncode == 0
+    text = diff.read_text()
+    assert "pkg/c.py" in text and "pkg/d.py" not in text
+    result = subprocess.run(cmd + ["--since", "no-such-ref"], capture_output=True, text=True, env=env)
+    assert result.returncode == 2 and "merge-base" in result.stderr
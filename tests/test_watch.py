@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+
+import pytest
+
+from pyrefactor.deps import import_cycles
+from pyrefactor.graph import build_import_graph_mermaid
+from pyrefactor.watch import PollingWatcher, open_watcher, watch_import_graph, watch_defensive_try, split_findings
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples", "defensive_try_except")
+
+
+class _ScriptedWatcher:
+    """按顺序执行编辑操作，并把被编辑的路径作为一批变化返回"""
+
+    def __init__(self, *edits):
+        self.edits = list(edits)
+
+    def wait(self, timeout=None):
+        return self.edits.pop(0)()
+
+    def close(self):
+        pass
+
+
+def _write(path, text):
+    def edit():
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        # 保证 stat 签名变化（部分文件系统 mtime 精度较粗）
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        return {path}
+    return edit
+
+
+def test_import_cycles():
+    graph = {"a": {"b"}, "b": {"a", "c"}, "c": {"c"}, "d": {"os"}}
+    assert import_cycles(graph) == [("a", "b"), ("c",)]
+
+
+def test_watch_import_graph_emits_deltas(tmp_path):
+    (tmp_path / "a.py").write_text("import b\n")
+    (tmp_path / "b.py").write_text("import os\n")
+    root = str(tmp_path)
+    initial = build_import_graph_mermaid(root)
+    lines = []
+    watcher = _ScriptedWatcher(
+        _write(str(tmp_path / "b.py"), "import a\n"),
+        _write(str(tmp_path / "c.py"), "import a\n"),
+        _write(str(tmp_path / "b.py"), "import os\n"),
+    )
+    watch_import_graph(root, watcher, emit=lines.append, rounds=3)
+
+    assert lines[0] == initial
+    assert lines[1:] == [
+        '-     "b" --> "os"',
+        '+     "b" --> "a"',
+        "+ %% 导入环: a, b",
+        '+     "c"',
+        '+     "c" --> "a"',
+        '-     "b" --> "a"',
+        "- %% 导入环: a, b",
+        '+     "b" --> "os"',
+    ]
+
+
+def test_watch_defensive_try_reports_only_changed_findings(tmp_path):
+    source = open(os.path.join(EXAMPLES, "example_with_defensive_try.py"), encoding="utf-8").read()
+    target = tmp_path / "mod.py"
+    target.write_text(source)
+    (tmp_path / "clean.py").write_text("x = 1\n")
+    lines = []
+    watcher = _ScriptedWatcher(
+        _write(str(tmp_path / "clean.py"), "x = 2\n"),
+        _write(str(target), "x = 1\n"),
+    )
+    watch_defensive_try(str(tmp_path), watcher, max_try_length=1, emit=lines.append, rounds=1)
+
+    # clean.py 的修改不产生发现，不计入批次；mod.py 清空后它的全部发现以 "- " 输出
+    assert not watcher.edits
+    findings = split_findings(lines[0])
+    assert len(findings) > 1 and all(f.startswith(str(target)) for f in findings)
+    assert lines[1:] == ["- " + f.replace("\n", "\n  ") for f in findings]
+
+
+def test_polling_watcher_detects_add_modify_delete(tmp_path):
+    path = tmp_path / "m.py"
+    path.write_text("x = 1\n")
+    watcher = PollingWatcher(str(tmp_path), interval=0.01)
+    assert watcher.wait(timeout=0.05) == set()
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert watcher.wait(timeout=1) == {str(path)}
+    (tmp_path / "n.py").write_text("")
+    assert watcher.wait(timeout=1) == {str(tmp_path / "n.py")}
+    path.unlink()
+    assert watcher.wait(timeout=1) == {str(path)}
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify 仅在 Linux 上可用")
+def test_inotify_watcher_follows_new_directories(tmp_path):
+    watcher = open_watcher(str(tmp_path))
+    try:
+        sub = tmp_path / "pkg"
+        sub.mkdir()
+        (sub / "__init__.py").write_text("")
+        changed = watcher.wait(timeout=2)
+        assert str(sub / "__init__.py") in changed
+        (sub / "m.py").write_text("x = 1\n")
+        changed = watcher.wait(timeout=2)
+        while str(sub / "m.py") not in changed and changed:
+            changed = watcher.wait(timeout=2)
+        assert str(sub / "m.py") in changed
+    finally:
+        watcher.close()